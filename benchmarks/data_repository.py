@@ -0,0 +1,110 @@
+"""
+Context lookup cost and reload time of DataRepository at portfolio scale.
+
+Generates synthetic tenants/units/stakeholders files in a temporary
+directory, then times sender lookups against the indexed repository,
+the previous regex + linear scan and the SQLite backend (uncached), and
+how long a full reload (parse + index build) and a SQLite import take.
+
+    python -m benchmarks.data_repository --tenants 100000
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from core.data_repository import DataRepository
+from core.sqlite_repository import SQLiteDataRepository, import_json
+
+
+def write_portfolio(directory: Path, tenants: int) -> None:
+    with open(directory / "tenants.json", "w", encoding="utf-8") as f:
+        json.dump(
+            [
+                {
+                    "tenant_id": f"T{i:07d}",
+                    "name": f"Tenant {i}",
+                    "email": f"tenant{i}@example.com",
+                    "unit_id": f"U{i:07d}",
+                    "balance_due": i % 3000,
+                    "lease_terms": "Monthly rent is $1500, due on the 1st of each month.",
+                }
+                for i in range(tenants)
+            ],
+            f,
+        )
+    with open(directory / "units.json", "w", encoding="utf-8") as f:
+        json.dump([{"unit_id": f"U{i:07d}", "address": f"{i} Holland Ave Apt {i % 40}F"} for i in range(tenants)], f)
+    with open(directory / "stakeholders.json", "w", encoding="utf-8") as f:
+        json.dump({"locked_out": ["security@example.com"], "maintenance": [], "rent": [], "general": []}, f)
+
+
+def linear_context(tenants, units, sender):
+    """The lookup DataRepository did before it was indexed."""
+    match = re.search(r"<(.+?)>", sender)
+    email = (match.group(1) if match else sender).strip().lower()
+    tenant = next((t for t in tenants if t.get("email", "").lower() == email), None)
+    if not tenant:
+        return None
+    unit = next((u for u in units if u["unit_id"] == tenant["unit_id"]), None)
+    return {"tenant": tenant, "unit": unit}
+
+
+def time_per_call(fn, senders) -> float:
+    started = time.perf_counter()
+    for sender in senders:
+        fn(sender)
+    return (time.perf_counter() - started) / len(senders)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tenants", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--linear-lookups", type=int, default=50)
+    parser.add_argument("--reloads", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        write_portfolio(directory, args.tenants)
+
+        started = time.perf_counter()
+        repo = DataRepository(data_dir=directory, reload_interval=None)
+        print(f"{args.tenants} tenants, initial load {time.perf_counter() - started:.3f}s")
+
+        senders = [f"Tenant {i} <tenant{i}@example.com>" for i in
+                   (rng.randrange(args.tenants) for _ in range(args.lookups))]
+        indexed = time_per_call(repo.get_full_context_for_email, senders)
+        print(f"  indexed lookup: {indexed * 1e6:10.2f} us/call")
+
+        tenants = repo._load_json(repo.tenants_path)
+        units = repo._load_json(repo.units_path)
+        linear = time_per_call(lambda s: linear_context(tenants, units, s), senders[:args.linear_lookups])
+        print(f"  linear lookup:  {linear * 1e6:10.2f} us/call ({linear / indexed:,.0f}x slower)")
+
+        reloads = []
+        for _ in range(args.reloads):
+            os.utime(repo.tenants_path)
+            started = time.perf_counter()
+            repo.reload_if_changed()
+            reloads.append(time.perf_counter() - started)
+        print(f"  reload:         {statistics.median(reloads):10.3f} s (median of {args.reloads})")
+
+        db_path = directory / "data.sqlite3"
+        started = time.perf_counter()
+        import_json(directory, db_path)
+        print(f"  sqlite import:  {time.perf_counter() - started:10.3f} s")
+        sqlite_repo = SQLiteDataRepository(db_path, cache_size=0)
+        sqlite = time_per_call(sqlite_repo.get_full_context_for_email, senders)
+        print(f"  sqlite lookup:  {sqlite * 1e6:10.2f} us/call (no LRU)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Parse cost of the lean MIME parser against the full `message_from_bytes` path.
+
+Builds a corpus of tenant emails where most carry photo/PDF attachments
+of a few megabytes (the rest are plain or HTML-only), then times both
+parser modes over it and checks they extract the same text.
+
+    python -m benchmarks.email_parser --messages 50 --attachment-mb 4
+"""
+import argparse
+import os
+import random
+import time
+from email.message import EmailMessage as MIMEMessage
+from typing import List
+
+from core.email.email_parser import parse_email
+
+
+def build_corpus(messages: int, attachment_mb: float, seed: int = 7) -> List[bytes]:
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(messages):
+        msg = MIMEMessage()
+        msg["From"] = f"Tenant {i} <tenant{i}@example.com>"
+        msg["To"] = "manager@example.com"
+        msg["Subject"] = f"Leak under the sink in apartment {i % 40}B"
+        msg["Message-ID"] = f"<bench-{i}@example.com>"
+        text = f"Hi, water is leaking under the kitchen sink in {i % 40}B since this morning. Photos attached."
+        kind = rng.random()
+        if kind < 0.1:
+            msg.set_content(text)
+        else:
+            msg.set_content(text)
+            msg.add_alternative(f"<html><body><p>{text}</p></body></html>", subtype="html")
+            photos = rng.randint(1, 3)
+            for p in range(photos):
+                size = int(attachment_mb * 1024 * 1024 / photos)
+                msg.add_attachment(os.urandom(size), maintype="image", subtype="jpeg", filename=f"leak-{p}.jpg")
+        corpus.append(msg.as_bytes())
+    return corpus
+
+
+def time_parse(corpus: List[bytes], lean: bool) -> float:
+    started = time.perf_counter()
+    for raw in corpus:
+        parse_email(raw, lean=lean)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--attachment-mb", type=float, default=4.0)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.messages, args.attachment_mb)
+    total_mb = sum(len(raw) for raw in corpus) / 1024 / 1024
+    print(f"{len(corpus)} messages, {total_mb:.1f} MB")
+
+    mismatches = sum(parse_email(raw, lean=True).body != parse_email(raw, lean=False).body for raw in corpus)
+    full = time_parse(corpus, lean=False)
+    lean = time_parse(corpus, lean=True)
+    print(f"full parser: {full / len(corpus) * 1000:8.2f} ms/message")
+    print(f"lean parser: {lean / len(corpus) * 1000:8.2f} ms/message ({full / lean:.0f}x faster)")
+    print(f"body mismatches: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""
+End-to-end throughput and latency of PropertyManagerAi, fully offline.
+
+A child process runs a fake IMAP server preloaded (or fed at
+`--arrival-rate`) with a synthetic mailbox, a fake SMTP sink and a stub
+OpenAI-compatible endpoint with configurable latency, jitter and 429
+injection (see benchmarks/fake_servers.py). The service runs unmodified in
+this process in IDLE mode against them, so peak RSS is the service's own.
+
+Latency is measured per email from delivery to the mailbox until the
+pipeline marks it done (reply sent, or coalesced/skipped), and reported
+per intent of the generated email. Results can be saved as a JSON
+baseline and later runs compared against it; the run exits non-zero when
+a metric regressed by more than `--tolerance`.
+
+    python -m benchmarks.end_to_end --emails 500 --save-baseline state/e2e-baseline.json
+    python -m benchmarks.end_to_end --emails 500 --baseline state/e2e-baseline.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from contextlib import suppress
+from email.message import EmailMessage as MIMEMessage
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "benchmark"
+
+from benchmarks.fake_servers import FakeImapServer, FakeOpenAIServer, FakeSmtpServer
+from config.mailboxes import MailboxConfig
+from config.settings import settings
+from core.metrics import MetricsServer
+from core.workflows.ticket_sink import JsonlTicketSink
+from services.property_manager_ai import PropertyManagerAi
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+
+TEMPLATES: Dict[str, List[Tuple[str, str]]] = {
+    "locked_out": [
+        ("Locked out of apartment", "Hi, I am locked out of my apartment and lost my keys. Can someone help? Ref {n}"),
+        ("Urgent - lockout", "I'm locked out, the key does not work in the front door. Please send someone. Ref {n}"),
+    ],
+    "maintenance": [
+        ("Leak under the sink", "There is a leak under the kitchen sink, water is on the floor since {n} minutes ago."),
+        ("Heating broken", "The heating has not been working since yesterday, radiator {n} is cold."),
+    ],
+    "rent": [
+        ("Rent question", "When is rent due this month? I want to schedule payment number {n}."),
+        ("Balance", "Could you confirm my current balance? I paid rent last week, receipt {n}."),
+    ],
+    "general": [
+        ("Parking", "Is there any visitor parking available this weekend? Asking for guest {n}."),
+        ("Package room", "What are the package room opening hours? I have delivery {n} coming."),
+    ],
+}
+FOLLOW_UP = "Any update on this? Still waiting, please get back to me."
+BENCH_ID_RE = re.compile(r"<bench-(\d+)@")
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for item in text.split(","):
+        intent, _, weight = item.partition("=")
+        if intent.strip() not in TEMPLATES:
+            raise ValueError(f"Unknown intent in --mix: {intent!r}")
+        mix[intent.strip()] = float(weight)
+    return mix
+
+
+def build_corpus(emails: int, mix: Dict[str, float], attachment_rate: float, attachment_kb: int,
+                 thread_rate: float, seed: int = 7) -> List[Tuple[bytes, str]]:
+    """(raw message, intent label) pairs from known tenants, with photo attachments and follow-up replies."""
+    rng = random.Random(seed)
+    with open(DATA_DIR / "tenants.json", "r", encoding="utf-8") as f:
+        senders = [(t["name"], t["email"]) for t in json.load(f)]
+    intents, weights = zip(*mix.items())
+    previous: List[Tuple[MIMEMessage, str]] = []
+
+    corpus = []
+    for n in range(emails):
+        msg = MIMEMessage()
+        msg["To"] = "manager@example.com"
+        msg["Message-ID"] = f"<bench-{n}@example.com>"
+        if previous and rng.random() < thread_rate:
+            original, intent = rng.choice(previous[-50:])
+            msg["From"] = original["From"]
+            msg["Subject"] = f"Re: {original['Subject']}"
+            msg["In-Reply-To"] = original["Message-ID"]
+            msg["References"] = original["Message-ID"]
+            msg.set_content(FOLLOW_UP)
+        else:
+            intent = rng.choices(intents, weights)[0]
+            name, address = rng.choice(senders)
+            subject, body = rng.choice(TEMPLATES[intent])
+            msg["From"] = f"{name} <{address}>"
+            msg["Subject"] = f"{subject} #{n}"
+            msg.set_content(body.format(n=n))
+            previous.append((msg, intent))
+        if rng.random() < attachment_rate:
+            msg.add_attachment(rng.randbytes(attachment_kb * 1024), maintype="image", subtype="jpeg",
+                               filename=f"photo-{n}.jpg")
+        corpus.append((msg.as_bytes(), intent))
+    return corpus
+
+
+# ---------- FAKES PROCESS ---------- #
+
+
+def _serve_fakes(config: dict, conn) -> None:
+    asyncio.run(_fakes_main(config, conn))
+
+
+async def _fakes_main(config: dict, conn) -> None:
+    loop = asyncio.get_running_loop()
+    corpus = build_corpus(config["emails"], config["mix"], config["attachment_rate"], config["attachment_kb"],
+                          config["thread_rate"], config["seed"])
+    imap, smtp = FakeImapServer(), FakeSmtpServer()
+    llm = FakeOpenAIServer(latency=config["llm_latency"], jitter=config["llm_jitter"],
+                           rate_limit_rate=config["rate_limit_rate"], invalid_rate=config["llm_invalid_rate"],
+                           batch_latency=config["batch_latency"], seed=config["seed"])
+    for server in (imap, smtp, llm):
+        await server.start()
+    conn.send({
+        "imap_port": imap.port, "smtp_port": smtp.port, "llm_url": llm.base_url,
+        "labels": [intent for _, intent in corpus],
+        "mailbox_bytes": sum(len(raw) for raw, _ in corpus),
+    })
+
+    start_at = await loop.run_in_executor(None, conn.recv)
+    arrivals = {}
+    rate = config["arrival_rate"]
+    for index, (raw, _) in enumerate(corpus):
+        if rate > 0:
+            await asyncio.sleep(max(0.0, start_at + index / rate - time.time()))
+        arrivals[imap.deliver(raw)] = time.time()
+    corpus.clear()
+
+    await loop.run_in_executor(None, conn.recv)
+    conn.send({
+        "arrivals": arrivals,
+        "llm_requests": llm.requests,
+        "llm_throttled": llm.throttled,
+        "llm_invalid": llm.invalid,
+        "llm_batched": llm.batched_requests,
+        "smtp_messages": len(smtp.received),
+        "smtp_connections": smtp.connections,
+        "imap_bytes_sent": imap.bytes_sent,
+    })
+    for server in (imap, smtp, llm):
+        await server.stop()
+
+
+# ---------- SERVICE UNDER TEST ---------- #
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else 0.0
+
+
+def latency_summary(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+    }
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+async def run_benchmark(args: argparse.Namespace) -> dict:
+    config = {
+        "emails": args.emails, "mix": parse_mix(args.mix), "attachment_rate": args.attachment_rate,
+        "attachment_kb": args.attachment_kb, "thread_rate": args.thread_rate, "arrival_rate": args.arrival_rate,
+        "llm_latency": args.llm_latency, "llm_jitter": args.llm_jitter, "rate_limit_rate": args.rate_limit_rate,
+        "llm_invalid_rate": args.llm_invalid_rate, "llm_structured": args.llm_structured,
+        "concurrency": args.concurrency, "smtp_pool_size": args.smtp_pool_size,
+        "fetch_batch_size": args.fetch_batch_size, "header_first": args.header_first,
+        "llm_stream": args.llm_stream, "batch_threshold": args.batch_threshold,
+        "batch_latency": args.batch_latency, "seed": args.seed,
+    }
+    loop = asyncio.get_running_loop()
+    ctx = multiprocessing.get_context("spawn")
+    conn, child_conn = ctx.Pipe()
+    fakes = ctx.Process(target=_serve_fakes, args=(config, child_conn), name="benchmark-fakes", daemon=True)
+    fakes.start()
+    hello = await loop.run_in_executor(None, conn.recv)
+    labels: List[str] = hello["labels"]
+
+    settings.OPENAI_BASE_URL = hello["llm_url"]
+    settings.OPENAI_API_KEY = os.environ["OPENAI_API_KEY"]
+    with tempfile.TemporaryDirectory() as tmp:
+        processor = PropertyManagerAi(
+            concurrency=args.concurrency,
+            polling=1,
+            fetch_batch_size=args.fetch_batch_size,
+            sync_state_path=str(Path(tmp) / "sync_state.json"),
+            journal_path=str(Path(tmp) / "journal.sqlite3"),
+            smtp_pool_size=args.smtp_pool_size,
+            ticket_sink=JsonlTicketSink(Path(tmp) / "tickets"),
+            imap_header_first=args.header_first,
+            trace_path=args.trace,
+            llm_stream=args.llm_stream,
+            llm_structured=args.llm_structured,
+            batch_threshold=args.batch_threshold,
+            batch_max_wait=1,
+            batch_poll_interval=0.5,
+            mailbox=MailboxConfig(
+                name="benchmark", imap_host="127.0.0.1", imap_user="manager@example.com", imap_password="x",
+                smtp_host="127.0.0.1", smtp_user="manager@example.com", smtp_password="x",
+            ),
+        )
+        processor.imap.port, processor.imap.use_ssl = hello["imap_port"], False
+        processor.smtp.port, processor.smtp.use_tls = hello["smtp_port"], False
+
+        finished: Dict[int, Tuple[float, bool]] = {}
+        all_done = asyncio.Event()
+        commit = processor.imap.commit
+
+        def timed_commit(uid: Optional[int], failed: bool = False) -> None:
+            commit(uid, failed=failed)
+            if uid is not None and uid not in finished:
+                finished[uid] = (time.time(), failed)
+                if len(finished) >= len(labels):
+                    all_done.set()
+
+        processor.imap.commit = timed_commit
+
+        # When each email's workflows started, to show what streaming the intent buys
+        first_action: Dict[int, float] = {}
+        dispatch = processor.dispatcher.dispatch
+
+        async def timed_dispatch(intent, action_items, email_message, context, **kwargs):
+            match = BENCH_ID_RE.match(email_message.message_id or "") if email_message else None
+            if match:
+                first_action.setdefault(int(match.group(1)) + 1, time.time())
+            return await dispatch(intent, action_items, email_message, context, **kwargs)
+
+        processor.dispatcher.dispatch = timed_dispatch
+        metrics_server = MetricsServer(port=args.metrics_port) if args.metrics_port else None
+        if metrics_server:
+            await metrics_server.start()
+        service = asyncio.create_task(processor.run_forever())
+        # Let the reader connect and settle into IDLE before the first delivery
+        await asyncio.sleep(1.0)
+        start_at = time.time()
+        conn.send(start_at)
+        timed_out = False
+        try:
+            await asyncio.wait_for(all_done.wait(), timeout=args.timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+        service.cancel()
+        with suppress(asyncio.CancelledError):
+            await service
+        if metrics_server:
+            await metrics_server.stop()
+        stages = processor.pipeline.metrics()["stages"]
+
+    conn.send("stop")
+    fake_stats = await loop.run_in_executor(None, conn.recv)
+    fakes.join(10)
+
+    arrivals = fake_stats.pop("arrivals")
+    per_intent: Dict[str, List[float]] = {}
+    for uid, (done_at, _) in finished.items():
+        per_intent.setdefault(labels[uid - 1], []).append(done_at - arrivals[uid])
+    all_latencies = [value for values in per_intent.values() for value in values]
+    action_latencies = [started - arrivals[uid] for uid, started in first_action.items()]
+    duration = (max((done for done, _ in finished.values()), default=start_at) - start_at) or 1e-9
+
+    return {
+        "config": config,
+        "completed": len(finished),
+        "failed": sum(1 for _, failed in finished.values() if failed),
+        "timed_out": timed_out,
+        "duration_s": round(duration, 3),
+        "emails_per_s": round(len(finished) / duration, 2),
+        "latency_s": {"all": latency_summary(all_latencies),
+                      **{intent: latency_summary(values) for intent, values in sorted(per_intent.items())}},
+        "first_action_s": latency_summary(action_latencies),
+        "peak_rss_mb": peak_rss_mb(),
+        "mailbox_mb": round(hello["mailbox_bytes"] / 1024 / 1024, 1),
+        **fake_stats,
+        "stages": {name: {key: stats[key] for key in ("processed", "failed", "avg_seconds")}
+                   for name, stats in stages.items()},
+    }
+
+
+# ---------- REPORTING ---------- #
+
+
+def comparable_metrics(result: dict) -> Dict[str, Tuple[float, bool]]:
+    """metric name -> (value, higher is better)"""
+    metrics = {"emails_per_s": (result["emails_per_s"], True), "peak_rss_mb": (result["peak_rss_mb"], False)}
+    for intent, summary in result["latency_s"].items():
+        for pct in ("p50", "p95", "p99"):
+            metrics[f"latency.{intent}.{pct}"] = (summary[pct], False)
+    for pct in ("p50", "p95", "p99"):
+        if "first_action_s" in result:
+            metrics[f"first_action.{pct}"] = (result["first_action_s"][pct], False)
+    return metrics
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    """Prints a metric-by-metric comparison and returns the metrics that regressed."""
+    if baseline.get("config") != current["config"]:
+        print("warning: baseline was recorded with a different configuration")
+    before = comparable_metrics(baseline)
+    regressions = []
+    print(f"\n{'metric':32} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, (value, higher_is_better) in comparable_metrics(current).items():
+        if name not in before:
+            continue
+        old = before[name][0]
+        change = (value - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:32} {old:10.3f} {value:10.3f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def print_report(result: dict) -> None:
+    print(f"{result['completed']}/{result['config']['emails']} emails in {result['duration_s']:.1f}s "
+          f"({result['emails_per_s']:.1f} emails/s), failed={result['failed']}"
+          f"{' TIMED OUT' if result['timed_out'] else ''}")
+    print(f"peak RSS {result['peak_rss_mb']:.1f} MB, mailbox {result['mailbox_mb']:.1f} MB, "
+          f"IMAP sent {result['imap_bytes_sent'] / 1024 / 1024:.1f} MB")
+    print(f"LLM requests {result['llm_requests']} (429s {result['llm_throttled']}, "
+          f"invalid outputs {result.get('llm_invalid', 0)}, batched {result.get('llm_batched', 0)}), "
+          f"SMTP messages {result['smtp_messages']} over {result['smtp_connections']} connections")
+    print(f"\n{'intent':12} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for intent, summary in result["latency_s"].items():
+        print(f"{intent:12} {summary['count']:6d} {summary['p50']:8.3f} {summary['p95']:8.3f} {summary['p99']:8.3f}")
+    summary = result["first_action_s"]
+    print(f"{'1st action':12} {summary['count']:6d} {summary['p50']:8.3f} {summary['p95']:8.3f} {summary['p99']:8.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--emails", type=int, default=300)
+    parser.add_argument("--mix", default="maintenance=0.4,rent=0.25,general=0.25,locked_out=0.1",
+                        help="intent=weight pairs for generated emails")
+    parser.add_argument("--attachment-rate", type=float, default=0.3)
+    parser.add_argument("--attachment-kb", type=int, default=512)
+    parser.add_argument("--thread-rate", type=float, default=0.1, help="fraction of emails that are follow-ups")
+    parser.add_argument("--arrival-rate", type=float, default=0, help="emails/s delivered; 0 delivers all at once")
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.02, help="fraction of LLM calls answered 429")
+    parser.add_argument("--llm-invalid-rate", type=float, default=0.0,
+                        help="fraction of LLM outputs cut off mid-JSON")
+    parser.add_argument("--llm-structured", action="store_true", help="request schema-constrained output")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--smtp-pool-size", type=int, default=4)
+    parser.add_argument("--fetch-batch-size", type=int, default=25)
+    parser.add_argument("--header-first", action="store_true")
+    parser.add_argument("--llm-stream", action="store_true", help="stream completions and act on the intent before the reply is written")
+    parser.add_argument("--batch-threshold", type=int, default=0,
+                        help="backlog size that sends non-urgent emails through the Batch API; 0 disables")
+    parser.add_argument("--batch-latency", type=float, default=2.0, help="seconds the fake Batch API takes per job")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--baseline", help="compare against this saved result")
+    parser.add_argument("--save-baseline", help="write this run's result here")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve Prometheus metrics during the run")
+    parser.add_argument("--trace", help="write per-email span traces (JSONL) here")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    result = asyncio.run(run_benchmark(args))
+    print_report(result)
+
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save_baseline).write_text(json.dumps(result, indent=2), encoding="utf-8")
+        print(f"\nSaved baseline to {args.save_baseline}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(baseline, result, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,628 @@
+"""
+In-process stand-ins for the IMAP server, the SMTP relay and the OpenAI API.
+
+They speak just enough of each protocol for `PropertyManagerAi` to run
+unmodified against them: the IMAP server supports the searches, UID
+fetches (including BODYSTRUCTURE and section fetches) and IDLE pushes the
+reader uses, the SMTP sink accepts and counts messages, and the OpenAI
+stub answers chat completions with configurable latency, jitter and
+injected 429s, and emulates the Files and Batches endpoints for batch
+jobs. All of them listen on 127.0.0.1 with an OS-assigned port.
+"""
+import asyncio
+import email
+import json
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass, field
+from email.message import Message
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+UID_RANGE_RE = re.compile(r"^(\d+)(?::(\d+|\*))?$")
+BATCH_PATH_RE = re.compile(r"/batches/([\w-]+)$")
+FILE_CONTENT_PATH_RE = re.compile(r"/files/([\w-]+)/content$")
+SECTION_RE = re.compile(r"^BODY(?:\.PEEK)?\[([^\]]*)\]$", re.IGNORECASE)
+
+
+def _quote(value: Optional[str]) -> str:
+    if value is None:
+        return "NIL"
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _raw_payload(part: Message) -> bytes:
+    """The part's body exactly as it sits in the message (still transfer-encoded)."""
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        return b""
+    # compat32 hands back 8bit bodies already decoded with the part's charset
+    try:
+        return payload.encode(part.get_content_charset() or "ascii", errors="surrogateescape")
+    except LookupError:
+        return payload.encode("utf-8", errors="surrogateescape")
+
+
+def bodystructure(part: Message) -> str:
+    """RFC 3501 BODYSTRUCTURE of a parsed message, with disposition extension data."""
+    if part.is_multipart():
+        children = "".join(bodystructure(child) for child in part.get_payload())
+        boundary = part.get_boundary()
+        return f'({children} {_quote(part.get_content_subtype().upper())} ("BOUNDARY" {_quote(boundary)}) NIL NIL)'
+
+    params = part.get_params()[1:] if part.get_params() else []
+    params_text = "(" + " ".join(f"{_quote(k.upper())} {_quote(v)}" for k, v in params) + ")" if params else "NIL"
+    body = _raw_payload(part)
+    fields = [
+        _quote(part.get_content_maintype().upper()), _quote(part.get_content_subtype().upper()), params_text,
+        "NIL", "NIL", _quote(str(part.get("Content-Transfer-Encoding", "7BIT")).upper()), str(len(body)),
+    ]
+    if part.get_content_maintype() == "text":
+        fields.append(str(body.count(b"\n") + 1))
+    disposition = part.get_content_disposition()
+    filename = part.get_filename()
+    disposition_text = "NIL"
+    if disposition:
+        disposition_text = f"({_quote(disposition.upper())} " + (
+            f'("FILENAME" {_quote(filename)}))' if filename else "NIL)"
+        )
+    fields += ["NIL", disposition_text, "NIL"]
+    return "(" + " ".join(fields) + ")"
+
+
+def _sections(part: Message, prefix: str = "") -> Dict[str, bytes]:
+    if not part.is_multipart():
+        return {prefix or "1": _raw_payload(part)}
+    sections = {}
+    for number, child in enumerate(part.get_payload(), 1):
+        sections.update(_sections(child, f"{prefix}.{number}" if prefix else str(number)))
+    return sections
+
+
+@dataclass
+class StoredMessage:
+    uid: int
+    raw: bytes
+    header: bytes
+    structure: str
+    sections: Dict[str, bytes]
+    flags: Set[str] = field(default_factory=set)
+
+    @classmethod
+    def from_bytes(cls, uid: int, raw: bytes) -> "StoredMessage":
+        parsed = email.message_from_bytes(raw)
+        split = raw.find(b"\r\n\r\n")
+        header = raw[:split + 4] if split != -1 else raw[:raw.find(b"\n\n") + 2]
+        return cls(uid=uid, raw=raw, header=header, structure=bodystructure(parsed), sections=_sections(parsed))
+
+
+class LocalServer:
+    """asyncio TCP server on 127.0.0.1 that closes its open connections on stop()."""
+
+    def __init__(self):
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self.port = 0
+
+    async def start(self) -> int:
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(asyncio.current_task())
+        self._writers.add(writer)
+        try:
+            await self._handle(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        raise NotImplementedError
+
+
+# ---------- IMAP ---------- #
+
+
+class FakeImapServer(LocalServer):
+    """One mailbox, any credentials. `deliver()` appends a message and pushes EXISTS to idling clients."""
+
+    def __init__(self):
+        super().__init__()
+        self.uidvalidity = int(time.time())
+        self.messages: List[StoredMessage] = []
+        self._idling: Set[asyncio.StreamWriter] = set()
+        self.bytes_sent = 0
+        self.commands = 0
+
+    def deliver(self, raw: bytes) -> int:
+        uid = len(self.messages) + 1
+        self.messages.append(StoredMessage.from_bytes(uid, raw))
+        for writer in list(self._idling):
+            self._write(writer, f"* {len(self.messages)} EXISTS\r\n".encode())
+        return uid
+
+    def _write(self, writer: asyncio.StreamWriter, data: bytes) -> None:
+        self.bytes_sent += len(data)
+        writer.write(data)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._write(writer, b"* OK [CAPABILITY IMAP4rev1 IDLE UIDPLUS] Fake IMAP ready\r\n")
+        idle_tag = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                text = line.decode("utf-8", errors="replace").strip()
+                if idle_tag is not None:
+                    if text.upper() == "DONE":
+                        self._idling.discard(writer)
+                        self._write(writer, f"{idle_tag} OK IDLE terminated\r\n".encode())
+                        idle_tag = None
+                    continue
+                if not text:
+                    continue
+                self.commands += 1
+                tag, _, rest = text.partition(" ")
+                command, _, args = rest.partition(" ")
+                command = command.upper()
+                if command == "UID":
+                    command, _, args = args.partition(" ")
+                    command, by_uid = command.upper(), True
+                else:
+                    by_uid = False
+
+                if command == "IDLE":
+                    idle_tag = tag
+                    self._idling.add(writer)
+                    self._write(writer, b"+ idling\r\n")
+                elif command == "LOGOUT":
+                    self._write(writer, f"* BYE logging out\r\n{tag} OK LOGOUT completed\r\n".encode())
+                    await writer.drain()
+                    return
+                else:
+                    self._write(writer, self._execute(tag, command, args, by_uid))
+                await writer.drain()
+        finally:
+            self._idling.discard(writer)
+
+    def _execute(self, tag: str, command: str, args: str, by_uid: bool) -> bytes:
+        if command == "CAPABILITY":
+            return f"* CAPABILITY IMAP4rev1 IDLE UIDPLUS\r\n{tag} OK CAPABILITY completed\r\n".encode()
+        if command in ("LOGIN", "NOOP", "CHECK", "CLOSE"):
+            return f"{tag} OK {command} completed\r\n".encode()
+        if command in ("SELECT", "EXAMINE"):
+            return (
+                f"* {len(self.messages)} EXISTS\r\n* 0 RECENT\r\n"
+                f"* OK [UIDVALIDITY {self.uidvalidity}] UIDs valid\r\n"
+                f"* OK [UIDNEXT {len(self.messages) + 1}] Predicted next UID\r\n"
+                f"{tag} OK [READ-WRITE] {command} completed\r\n"
+            ).encode()
+        if command == "SEARCH":
+            found = [m.uid for m in self.messages if self._matches(m, args)]
+            # Sequence numbers equal UIDs: nothing is ever expunged
+            return f"* SEARCH {' '.join(map(str, found))}\r\n{tag} OK SEARCH completed\r\n".encode()
+        if command == "FETCH":
+            message_set, _, items = args.partition(" ")
+            out = bytearray()
+            for uid in self._message_set(message_set):
+                out += self._fetch_response(self.messages[uid - 1], items, by_uid)
+            out += f"{tag} OK FETCH completed\r\n".encode()
+            return bytes(out)
+        if command == "STORE":
+            message_set, _, rest = args.partition(" ")
+            mode, _, flags = rest.partition(" ")
+            flags = set(flags.strip("()").split())
+            out = bytearray()
+            for uid in self._message_set(message_set):
+                message = self.messages[uid - 1]
+                if mode.upper().startswith("+FLAGS"):
+                    message.flags |= flags
+                elif mode.upper().startswith("-FLAGS"):
+                    message.flags -= flags
+                else:
+                    message.flags = flags
+                if not mode.upper().endswith(".SILENT"):
+                    out += f"* {uid} FETCH (UID {uid} FLAGS ({' '.join(sorted(message.flags))}))\r\n".encode()
+            out += f"{tag} OK STORE completed\r\n".encode()
+            return bytes(out)
+        return f"{tag} BAD {command} not supported\r\n".encode()
+
+    @staticmethod
+    def _matches(message: StoredMessage, criteria: str) -> bool:
+        tokens = criteria.replace("(", " ").replace(")", " ").split()
+        ok = True
+        index = 0
+        while index < len(tokens):
+            token = tokens[index].upper()
+            if token == "UNSEEN":
+                ok &= "\\Seen" not in message.flags
+            elif token == "SINCE":
+                index += 1  # everything in the fake mailbox arrived today
+            elif token == "UID":
+                index += 1
+                ok &= message.uid in FakeImapServer._uid_range(tokens[index])
+            index += 1
+        return ok
+
+    @staticmethod
+    def _uid_range(text: str, top: int = 1 << 31) -> range:
+        match = UID_RANGE_RE.match(text)
+        if not match:
+            return range(0)
+        start = int(match.group(1))
+        end = match.group(2)
+        if end is None:
+            return range(start, start + 1)
+        return range(start, (top if end == "*" else int(end)) + 1)
+
+    def _message_set(self, text: str) -> List[int]:
+        uids: List[int] = []
+        for piece in text.split(","):
+            uids.extend(uid for uid in self._uid_range(piece, len(self.messages)) if 1 <= uid <= len(self.messages))
+        return uids
+
+    def _fetch_response(self, message: StoredMessage, items: str, by_uid: bool) -> bytes:
+        names = items.strip().strip("()").split()
+        attributes: List[str] = []
+        literal: Optional[Tuple[str, bytes]] = None
+        if by_uid:
+            attributes.append(f"UID {message.uid}")
+        for name in names:
+            upper = name.upper()
+            if upper == "UID":
+                if not by_uid:
+                    attributes.append(f"UID {message.uid}")
+            elif upper == "RFC822.SIZE":
+                attributes.append(f"RFC822.SIZE {len(message.raw)}")
+            elif upper == "BODYSTRUCTURE":
+                attributes.append(f"BODYSTRUCTURE {message.structure}")
+            elif upper in ("RFC822", "BODY[]"):
+                literal = (upper, message.raw)
+                message.flags.add("\\Seen")
+            elif match := SECTION_RE.match(name):
+                section = match.group(1).upper()
+                data = message.header if section == "HEADER" else message.raw if section == "" \
+                    else message.sections.get(section, b"")
+                literal = (f"BODY[{section}]", data)
+                if not upper.startswith("BODY.PEEK"):
+                    message.flags.add("\\Seen")
+        head = f"* {message.uid} FETCH ({' '.join(attributes)}"
+        if literal is None:
+            return (head + ")\r\n").encode()
+        name, data = literal
+        return (head + f" {name} {{{len(data)}}}\r\n").encode() + data + b")\r\n"
+
+
+# ---------- SMTP ---------- #
+
+
+class FakeSmtpServer(LocalServer):
+    """Accepts any AUTH and every message; counts them and records when each arrived."""
+
+    def __init__(self):
+        super().__init__()
+        self.received: List[Tuple[float, bytes]] = []
+        self.connections = 0
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        writer.write(b"220 fake ESMTP ready\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            verb = line.strip().split(b" ", 1)[0].upper()
+            if verb == b"EHLO":
+                writer.write(b"250-fake\r\n250-AUTH PLAIN LOGIN\r\n250-8BITMIME\r\n250 SMTPUTF8\r\n")
+            elif verb == b"HELO":
+                writer.write(b"250 fake\r\n")
+            elif verb == b"AUTH":
+                if line.strip().upper() == b"AUTH LOGIN":
+                    writer.write(b"334 VXNlcm5hbWU6\r\n")
+                    await writer.drain()
+                    await reader.readline()
+                    writer.write(b"334 UGFzc3dvcmQ6\r\n")
+                    await writer.drain()
+                    await reader.readline()
+                writer.write(b"235 2.7.0 Authentication successful\r\n")
+            elif verb == b"DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                data = await reader.readuntil(b"\r\n.\r\n")
+                self.received.append((time.time(), data))
+                writer.write(b"250 2.0.0 queued\r\n")
+            elif verb == b"QUIT":
+                writer.write(b"221 bye\r\n")
+                await writer.drain()
+                return
+            elif verb in (b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                writer.write(b"250 OK\r\n")
+            else:
+                writer.write(b"502 command not implemented\r\n")
+            await writer.drain()
+
+
+# ---------- OPENAI ---------- #
+
+INTENT_KEYWORDS = (
+    ("locked_out", ("locked out", "lost my key", "lockout")),
+    ("maintenance", ("leak", "broken", "not working", "repair", "heating")),
+    ("rent", ("rent", "payment", "balance")),
+)
+
+
+def stub_intent(text: str) -> str:
+    lowered = text.lower()
+    for intent, words in INTENT_KEYWORDS:
+        if any(word in lowered for word in words):
+            return intent
+    return "general"
+
+
+class FakeOpenAIServer(LocalServer):
+    """
+    Answers POST .../chat/completions like the OpenAI API, classifying the
+    email by keywords. Each call waits `latency` +- `jitter` seconds (normal
+    distribution), and `rate_limit_rate` of the calls get a 429 with
+    `retry-after-ms` instead. `invalid_rate` of the first attempts come back
+    cut off mid-JSON; repair calls (those quoting an earlier assistant
+    output) are always answered correctly. Streamed calls send their first
+    tokens after `first_token_share` of that time and the rest spread over
+    the remainder.
+
+    Batch jobs (file upload, create, retrieve, output download) complete
+    `batch_latency` seconds after creation, with every request answered
+    like a chat completion but without 429s. `batch_error_rate` of the
+    requests land in the error file instead, and with `batch_expire_after`
+    a batch expires once it has answered that many.
+    """
+
+    STREAM_CHUNK_CHARS = 16
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, rate_limit_rate: float = 0.0,
+                 retry_after_ms: int = 200, seed: int = 7, first_token_share: float = 0.2,
+                 invalid_rate: float = 0.0, batch_latency: float = 2.0, batch_error_rate: float = 0.0,
+                 batch_expire_after: Optional[int] = None):
+        self.latency = latency
+        self.first_token_share = first_token_share
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after_ms = retry_after_ms
+        self.invalid_rate = invalid_rate
+        self.batch_latency = batch_latency
+        self.batch_error_rate = batch_error_rate
+        self.batch_expire_after = batch_expire_after
+        super().__init__()
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.throttled = 0
+        self.invalid = 0
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.batched_requests = 0
+        self._batch_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            status, extra_headers, payload = await self._respond(request_line.decode("latin-1"), headers, body)
+            if isinstance(payload, list):
+                await self._write_stream(writer, payload)
+                continue
+            writer.write(self._http_response(status, extra_headers, payload))
+            await writer.drain()
+
+    @staticmethod
+    async def _write_stream(writer: asyncio.StreamWriter, events: List[Tuple[float, bytes]]) -> None:
+        """Server-sent events over chunked transfer encoding, each after its delay."""
+        writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: text/event-stream\r\n"
+                     b"transfer-encoding: chunked\r\nconnection: keep-alive\r\n\r\n")
+        for delay, data in events:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            event = b"data: " + data + b"\n\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(event), event))
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    @staticmethod
+    def _http_response(status: int, headers: Dict[str, str], payload: bytes) -> bytes:
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests"}.get(status, "Error")
+        lines = [f"HTTP/1.1 {status} {reason}", "content-type: application/json",
+                 f"content-length: {len(payload)}", "connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + payload
+
+    async def stop(self) -> None:
+        for task in list(self._batch_tasks):
+            task.cancel()
+        await asyncio.gather(*self._batch_tasks, return_exceptions=True)
+        await super().stop()
+
+    async def _respond(self, request_line: str, headers: Dict[str, str],
+                       body: bytes) -> Tuple[int, Dict[str, str], Any]:
+        method, path = (request_line.split() + ["", ""])[:2]
+        path = path.split("?")[0]
+        if method == "POST" and path.endswith("/chat/completions"):
+            return await self._chat_completion(body)
+        if method == "POST" and path.endswith("/files"):
+            return self._upload_file(headers, body)
+        if method == "POST" and path.endswith("/batches"):
+            return self._create_batch(body)
+        match = BATCH_PATH_RE.search(path)
+        if method == "GET" and match and match.group(1) in self.batches:
+            return 200, {}, json.dumps(self.batches[match.group(1)]).encode()
+        match = FILE_CONTENT_PATH_RE.search(path)
+        if method == "GET" and match and match.group(1) in self.files:
+            return 200, {}, self.files[match.group(1)]
+        return 404, {}, b'{"error": {"message": "not found"}}'
+
+    async def _chat_completion(self, body: bytes) -> Tuple[int, Dict[str, str], Any]:
+        self.requests += 1
+        request = json.loads(body or b"{}")
+
+        if self._rng.random() < self.rate_limit_rate:
+            self.throttled += 1
+            error = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+            return 429, {"retry-after-ms": str(self.retry_after_ms)}, json.dumps(error).encode()
+
+        delay = max(0.0, self._rng.gauss(self.latency, self.jitter))
+        base, content, usage = self._answer(request)
+        if request.get("stream"):
+            return 200, {}, self._stream_events(base, content, usage, delay)
+
+        await asyncio.sleep(delay)
+        return 200, {}, json.dumps(self._completion(base, content, usage)).encode()
+
+    def _answer(self, request: Dict[str, Any]) -> Tuple[Dict[str, Any], str, Dict[str, int]]:
+        """Chunk/completion id fields, the JSON content and the token usage for one chat request."""
+        prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []) if m.get("role") == "user")
+        intent = stub_intent(prompt)
+        # Same field order the real prompt asks for: intent and action items before the reply
+        content = json.dumps({
+            "intent": intent,
+            "action_items": [] if intent == "general" else [{"type": intent, "details": "Follow up with tenant"}],
+            "reply": f"Thank you for reaching out. We have logged your {intent.replace('_', ' ')} request.",
+        })
+        is_repair = any(m.get("role") == "assistant" for m in request.get("messages", []))
+        if not is_repair and self._rng.random() < self.invalid_rate:
+            self.invalid += 1
+            content = content[:len(content) // 2]
+        prompt_tokens = max(1, sum(len(str(m.get("content", ""))) for m in request.get("messages", [])) // 4)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                 "total_tokens": prompt_tokens + len(content) // 4}
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex}", "created": int(time.time()), "model": request.get("model", "stub")}
+        return base, content, usage
+
+    @staticmethod
+    def _completion(base: Dict[str, Any], content: str, usage: Dict[str, int]) -> Dict[str, Any]:
+        return {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": usage,
+        }
+
+    # Batch API
+
+    def _upload_file(self, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        # Multipart form: parse it as a MIME message to get at the "file" field
+        form = email.message_from_bytes(
+            f"Content-Type: {headers.get('content-type', '')}\r\n\r\n".encode("latin-1") + body
+        )
+        content = next(
+            (part.get_payload(decode=True) for part in form.get_payload()
+             if isinstance(part, Message) and part.get_param("name", header="content-disposition") == "file"),
+            b"",
+        )
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        self.files[file_id] = content
+        return 200, {}, json.dumps({
+            "id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+            "filename": "batch.jsonl", "purpose": "batch", "status": "processed",
+        }).encode()
+
+    def _create_batch(self, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        request = json.loads(body or b"{}")
+        input_file_id = request.get("input_file_id")
+        if input_file_id not in self.files:
+            return 400, {}, b'{"error": {"message": "unknown input_file_id"}}'
+        batch_id = f"batch_{uuid.uuid4().hex[:24]}"
+        lines = [line for line in self.files[input_file_id].splitlines() if line.strip()]
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": request.get("endpoint"),
+            "input_file_id": input_file_id, "completion_window": request.get("completion_window", "24h"),
+            "status": "in_progress", "created_at": int(time.time()), "output_file_id": None,
+            "error_file_id": None, "metadata": request.get("metadata"),
+            "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+        }
+        self.batches[batch_id] = batch
+        task = asyncio.create_task(self._run_batch(batch, lines))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+        return 200, {}, json.dumps(batch).encode()
+
+    async def _run_batch(self, batch: Dict[str, Any], lines: List[bytes]) -> None:
+        await asyncio.sleep(self.batch_latency)
+        answered = lines if self.batch_expire_after is None else lines[:self.batch_expire_after]
+        output, errors = [], []
+        for line in answered:
+            item = json.loads(line)
+            if self.batch_error_rate and self._rng.random() < self.batch_error_rate:
+                errors.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": item["custom_id"], "response": None,
+                    "error": {"code": "server_error", "message": "The server had an error processing your request"},
+                }))
+                continue
+            base, content, usage = self._answer(item["body"])
+            output.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:24]}", "custom_id": item["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                             "body": self._completion(base, content, usage)},
+                "error": None,
+            }))
+        self.batched_requests += len(answered)
+        expired = len(answered) < len(lines)
+        batch.update({
+            "status": "expired" if expired else "completed",
+            "expired_at" if expired else "completed_at": int(time.time()),
+            "output_file_id": self._store_file(output),
+            "error_file_id": self._store_file(errors),
+            "request_counts": {"total": len(lines), "completed": len(output), "failed": len(errors)},
+        })
+
+    def _store_file(self, lines: List[str]) -> Optional[str]:
+        if not lines:
+            return None
+        file_id = f"file-{uuid.uuid4().hex[:24]}"
+        self.files[file_id] = ("\n".join(lines) + "\n").encode()
+        return file_id
+
+    def _stream_events(self, base: Dict[str, Any], content: str, usage: Dict[str, int],
+                       delay: float) -> List[Tuple[float, bytes]]:
+        pieces = [content[i:i + self.STREAM_CHUNK_CHARS] for i in range(0, len(content), self.STREAM_CHUNK_CHARS)]
+        first = delay * self.first_token_share
+        step = (delay - first) / len(pieces)
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> bytes:
+            choices = [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else []
+            return json.dumps({**base, "object": "chat.completion.chunk", "choices": choices, **extra}).encode()
+
+        events = [(first, chunk({"role": "assistant", "content": ""}))]
+        events += [(step, chunk({"content": piece})) for piece in pieces]
+        events.append((0, chunk({}, "stop")))
+        events.append((0, chunk(None, usage=usage)))
+        events.append((0, b"[DONE]"))
+        return events
@@ -0,0 +1,124 @@
+"""
+Time-to-reply for urgent mail while a general backlog is being drained.
+
+Runs the real PropertyManagerAi pipeline with the LLM, SMTP and ticket
+writes replaced by in-process fakes, once with FIFO queues and once with
+priority scheduling, for growing backlog sizes. Latency is measured from
+the moment a message lands in the mailbox to the moment its reply is sent.
+
+Urgent latency stays flat while the backlog fits in the prioritized LLM
+queue (`priority_queue_size`); past that the fetcher is backpressured and
+new mail waits in the mailbox like it does in FIFO mode.
+
+    python -m benchmarks.priority_scheduling
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from email.mime.text import MIMEText
+
+os.environ["OPENAI_API_KEY"] = os.environ.get("OPENAI_API_KEY") or "benchmark"
+
+from core.email.imap_reader import FetchedEmail
+from core.models import Intent, LLMResponse
+from services.property_manager_ai import PropertyManagerAi
+
+
+def make_email(uid: int, subject: str, body: str) -> FetchedEmail:
+    msg = MIMEText(body)
+    msg["From"] = "Miki <miki@example.com>"
+    msg["Subject"] = subject
+    return FetchedEmail(uid=uid, raw=msg.as_bytes())
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run(backlog: int, urgent: int, prioritize: bool, llm_latency: float, concurrency: int):
+    processor = PropertyManagerAi(concurrency=concurrency, prioritize=prioritize)
+    replies = {}
+
+    async def fake_llm(email, context):
+        await asyncio.sleep(llm_latency)
+        intent = Intent.locked_out if "locked out" in email.subject else Intent.rent
+        return LLMResponse(reply="ok", intent=intent, action_items=[])
+
+    async def fake_send(**kwargs):
+        return True
+
+    async def fake_dispatch(**kwargs):
+        return None
+
+    send_stage = processor.pipeline.stages[-1]
+    send_handler = send_stage.handler
+
+    arrived_at = {}
+    mailbox: asyncio.Queue = asyncio.Queue()
+    for uid in range(1, backlog + 1):
+        arrived_at[uid] = time.monotonic()
+        mailbox.put_nowait(make_email(uid, "Question about my rent", "When is rent due this month?"))
+
+    async def timed_send(job):
+        result = await send_handler(job)
+        replies[job.fetched.uid] = (job.llm_response.intent, time.monotonic() - arrived_at[job.fetched.uid])
+        return result
+
+    processor.llm.generate_response_async = fake_llm
+    processor.smtp.send_email_async = fake_send
+    processor.dispatcher.dispatch = fake_dispatch
+    send_stage.handler = timed_send
+
+    async def deliver_urgent():
+        # Urgent mail lands in the mailbox while the backlog is still being worked off
+        for n in range(urgent):
+            await asyncio.sleep(llm_latency)
+            uid = backlog + n + 1
+            arrived_at[uid] = time.monotonic()
+            mailbox.put_nowait(make_email(uid, "I am locked out", "Lost my keys, please help"))
+
+    async def source():
+        # The fetcher hands out mail in mailbox order, like an IMAP UID search
+        for _ in range(backlog + urgent):
+            yield await mailbox.get()
+
+    delivery = asyncio.create_task(deliver_urgent())
+    started = time.monotonic()
+    await processor.pipeline.run(processor._jobs(source()))
+    elapsed = time.monotonic() - started
+    await delivery
+
+    urgent_latencies = [latency for intent, latency in replies.values() if intent == Intent.locked_out]
+    return {
+        "emails_per_sec": len(replies) / elapsed,
+        "urgent_p50": statistics.median(urgent_latencies),
+        "urgent_p99": percentile(urgent_latencies, 99),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backlogs", type=int, nargs="+", default=[100, 400, 800])
+    parser.add_argument("--urgent", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'backlog':>8} {'mode':>9} {'emails/s':>9} {'urgent p50':>11} {'urgent p99':>11}")
+    for backlog in args.backlogs:
+        for prioritize in (False, True):
+            result = await run(backlog, args.urgent, prioritize, args.llm_latency, args.concurrency)
+            print(
+                f"{backlog:>8} {'priority' if prioritize else 'fifo':>9} {result['emails_per_sec']:>9.1f} "
+                f"{result['urgent_p50']:>10.3f}s {result['urgent_p99']:>10.3f}s"
+            )
+
+
+if __name__ == "__main__":
+    import logging
+
+    logging.disable(logging.INFO)
+    asyncio.run(main())
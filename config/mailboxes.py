@@ -0,0 +1,56 @@
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+
+
+@dataclass
+class MailboxConfig:
+    """One building's mailbox. Empty credentials fall back to the single-mailbox settings."""
+    name: str
+    imap_host: str = ""
+    imap_user: str = ""
+    imap_password: str = ""
+    mailbox: str = "INBOX"
+    smtp_host: str = ""
+    smtp_user: str = ""
+    smtp_password: str = ""
+    # Fraction of the account-wide OpenAI rate limits this mailbox may use
+    llm_share: float = 1.0
+    # Extra PropertyManagerAi keyword arguments for this mailbox
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+def _secret(entry: dict, key: str) -> str:
+    """Reads `key` directly or, preferably, from the environment variable named by `<key>_env`."""
+    env_name: Optional[str] = entry.pop(f"{key}_env", None)
+    if env_name:
+        return os.getenv(env_name, "")
+    return entry.pop(key, "")
+
+
+def load_mailboxes(path: str | Path | None = None) -> List[MailboxConfig]:
+    """
+    Loads mailbox configs from a JSON list, e.g.
+    [{"name": "holland-ave", "imap_user": "holland@example.com", "imap_password_env": "HOLLAND_IMAP_PASSWORD"}]
+    Unless set explicitly, the OpenAI budget is split evenly between mailboxes.
+    """
+    path = path or settings.MAILBOXES_FILE
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+
+    mailboxes = []
+    for entry in entries:
+        entry = dict(entry)
+        entry["imap_password"] = _secret(entry, "imap_password")
+        entry["smtp_password"] = _secret(entry, "smtp_password")
+        entry.setdefault("llm_share", 1.0 / len(entries))
+        mailboxes.append(MailboxConfig(**entry))
+
+    names = [mailbox.name for mailbox in mailboxes]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Mailbox names must be unique: {names}")
+    return mailboxes
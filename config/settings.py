@@ -13,5 +13,19 @@ class Settings:
     SMTP_PASSWORD: str = os.getenv("SMTP_PASSWORD", "")
 
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+    # Point at an OpenAI-compatible endpoint (e.g. a local stub); empty means the public API
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
+
+    # JSON list of mailboxes for the sharded multi-process runner; empty runs the single mailbox above
+    MAILBOXES_FILE: str = os.getenv("MAILBOXES_FILE", "")
+
+    # Prometheus /metrics port; 0 disables it. Sharded workers serve on METRICS_PORT + shard index
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", "0") or 0)
+    # Write a per-email JSONL span trace next to each mailbox's state
+    TRACE_EMAILS: bool = os.getenv("TRACE_EMAILS", "").lower() in ("1", "true", "yes")
+    # Backlog size (unread plus in flight) above which non-urgent mail goes through the Batch API; 0 disables it
+    BATCH_THRESHOLD: int = int(os.getenv("BATCH_THRESHOLD", "0") or 0)
+    # Seconds in-flight emails get to finish after SIGTERM before they are cancelled and left for the next start
+    DRAIN_TIMEOUT: float = float(os.getenv("DRAIN_TIMEOUT", "30") or 30)
 
 settings = Settings()
@@ -0,0 +1,149 @@
+"""
+Groups bursts of related mail so each conversation costs one LLM call.
+
+A message joins an open group when it comes from the same sender and
+either replies into the group's thread (In-Reply-To / References) or is a
+near-duplicate of the group's first message, judged by MinHash over word
+shingles of the cleaned subject and body. Groups stay open for `window`
+seconds after their first message. Only same-sender mail is coalesced, so
+nobody's message goes unanswered.
+"""
+import hashlib
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from core.data_repository import normalize_email
+from core.models import EmailMessage
+from core.prompt_builder import clean_body
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+REPLY_PREFIX_RE = re.compile(r"^\s*((re|fwd?|aw|sv)\s*:\s*)+", re.IGNORECASE)
+# Mersenne prime modulus for the (a * x + b) permutations
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+class MinHasher:
+    """MinHash signatures over word shingles; matching slots estimate Jaccard similarity."""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = random.Random(seed)
+        self.shingle_size = shingle_size
+        self._perms = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def shingles(self, text: str) -> Set[int]:
+        words = WORD_RE.findall(text.lower())
+        k = min(self.shingle_size, len(words)) or 1
+        grams = {" ".join(words[i:i + k]) for i in range(max(len(words) - k + 1, 1))}
+        return {int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big") for g in grams}
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        hashes = self.shingles(text)
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self._perms)
+
+    @staticmethod
+    def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+        return sum(x == y for x, y in zip(a, b)) / len(a) if a else 0.0
+
+
+def conversation_text(email: EmailMessage) -> str:
+    """Subject without Re:/Fwd: prefixes plus the body without quoted replies or signature."""
+    return f"{REPLY_PREFIX_RE.sub('', email.subject)}\n{clean_body(email.body)}"
+
+
+@dataclass
+class ConversationGroup:
+    leader: Any
+    sender: str
+    text: str
+    started_at: float
+    message_ids: Set[str] = field(default_factory=set)
+    size: int = 1
+    # Computed on first comparison; most groups never get a second message
+    signature: Optional[Tuple[int, ...]] = None
+
+
+class EmailCoalescer:
+    """
+    `add(email, item)` returns the open group `item` joins, or None after
+    starting a new group led by `item`. What "joining" means (merging into
+    the leader, skipping the LLM) is up to the caller.
+    """
+
+    def __init__(self, window: float = 120, threshold: float = 0.6, num_perm: int = 64, shingle_size: int = 3):
+        self.window = window
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self._groups: Deque[ConversationGroup] = deque()
+        self._by_sender: Dict[str, List[ConversationGroup]] = {}
+
+        self.groups = 0
+        self.coalesced = 0
+
+    def add(self, email: EmailMessage, item: Any, now: Optional[float] = None) -> Optional[ConversationGroup]:
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        sender = normalize_email(email.sender)
+        text = conversation_text(email)
+
+        group = self._find(sender, email, text)
+        if group is not None:
+            group.size += 1
+            if email.message_id:
+                group.message_ids.add(email.message_id)
+            self.coalesced += 1
+            return group
+
+        if self.window > 0:
+            group = ConversationGroup(leader=item, sender=sender, text=text, started_at=now)
+            if email.message_id:
+                group.message_ids.add(email.message_id)
+            self._groups.append(group)
+            self._by_sender.setdefault(sender, []).append(group)
+            self.groups += 1
+        return None
+
+    def lead(self, group: ConversationGroup, item: Any) -> None:
+        """
+        Hands `group` to `item`, which the caller is processing on its own
+        after all; it no longer counts as coalesced and later messages join it.
+        """
+        group.leader = item
+        self.coalesced -= 1
+
+    def _find(self, sender: str, email: EmailMessage, text: str) -> Optional[ConversationGroup]:
+        candidates = self._by_sender.get(sender)
+        if not candidates:
+            return None
+
+        thread = set(email.references)
+        if email.in_reply_to:
+            thread.add(email.in_reply_to)
+        for group in candidates:
+            if thread & group.message_ids:
+                return group
+
+        signature = self.hasher.signature(text)
+        best, best_score = None, self.threshold
+        for group in candidates:
+            if group.signature is None:
+                group.signature = self.hasher.signature(group.text)
+            score = self.hasher.similarity(signature, group.signature)
+            if score >= best_score:
+                best, best_score = group, score
+        return best
+
+    def _expire(self, now: float) -> None:
+        while self._groups and now - self._groups[0].started_at > self.window:
+            group = self._groups.popleft()
+            remaining = [g for g in self._by_sender[group.sender] if g is not group]
+            if remaining:
+                self._by_sender[group.sender] = remaining
+            else:
+                del self._by_sender[group.sender]
+
+    def stats(self) -> dict:
+        return {"groups": self.groups, "coalesced": self.coalesced, "open": len(self._groups)}
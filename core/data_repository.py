@@ -1,28 +1,170 @@
 import json
+import logging
 import re
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 from core.models.intent import Intent
 
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+EMAIL_RE = re.compile(r"<(.+?)>")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_email(sender: str) -> str:
+    """
+    Lookup key for a sender.
+    Supports formats:
+    - 'First Name <email@example.com>'
+    - 'email@example.com'
+    """
+    if "<" in sender:
+        match = EMAIL_RE.search(sender)
+        if match:
+            sender = match.group(1)
+    return sender.strip().lower()
+
+
+def normalize_address(address: str) -> str:
+    return WHITESPACE_RE.sub(" ", address).strip().lower()
+
+
+@dataclass(frozen=True)
+class RepositoryIndex:
+    """
+    Immutable lookup tables built from one load of the data files.
+    Reloads build a new index and swap the reference, so a lookup sees
+    either the old data or the new data, never a mix.
+    """
+    tenants_by_email: Dict[str, dict] = field(default_factory=dict)
+    tenants_by_id: Dict[str, dict] = field(default_factory=dict)
+    units_by_id: Dict[str, dict] = field(default_factory=dict)
+    units_by_address: Dict[str, dict] = field(default_factory=dict)
+    stakeholders: Dict[str, List[str]] = field(default_factory=dict)
+    mtimes: Tuple[int, ...] = ()
+
+    @classmethod
+    def build(cls, tenants: List[dict], units: List[dict], stakeholders: Dict[str, List[str]],
+              mtimes: Tuple[int, ...] = ()) -> "RepositoryIndex":
+        # First entry wins on duplicates, as with the old linear scans
+        tenants_by_email = {}
+        tenants_by_id = {}
+        for tenant in tenants:
+            if tenant.get("email"):
+                tenants_by_email.setdefault(normalize_email(tenant["email"]), tenant)
+            if "tenant_id" in tenant:
+                tenants_by_id.setdefault(tenant["tenant_id"], tenant)
+
+        units_by_id = {}
+        units_by_address = {}
+        for unit in units:
+            units_by_id.setdefault(unit["unit_id"], unit)
+            if unit.get("address"):
+                units_by_address.setdefault(normalize_address(unit["address"]), unit)
+
+        return cls(
+            tenants_by_email=tenants_by_email,
+            tenants_by_id=tenants_by_id,
+            units_by_id=units_by_id,
+            units_by_address=units_by_address,
+            stakeholders=stakeholders,
+            mtimes=mtimes,
+        )
+
 
 class DataRepository:
-    def __init__(self):
-        base = Path(__file__).resolve().parent.parent / "data"
+    def __init__(self, data_dir: str | Path | None = None, reload_interval: Optional[float] = 5.0):
+        base = Path(data_dir) if data_dir else Path(__file__).resolve().parent.parent / "data"
         self.tenants_path = base / "tenants.json"
         self.units_path = base / "units.json"
         self.stakeholders_path = base / "stakeholders.json"
 
-        self._tenants = self._load_json(self.tenants_path)
-        self._units = self._load_json(self.units_path)
-        self._stakeholders = self._load_json(self.stakeholders_path)
+        # Seconds between mtime checks; None disables hot reload
+        self.reload_interval = reload_interval
+        self._checked_at = time.monotonic()
+        self._reload_lock = threading.Lock()
+
+        self._index = self._build_index(self._mtimes())
 
     def _load_json(self, path: Path):
         with open(path, "r", encoding="utf-8") as f:
             return json.load(f)
 
-    # ---------- LOOKUPS ---------- #
+    def _mtimes(self) -> Tuple[int, ...]:
+        return tuple(
+            path.stat().st_mtime_ns for path in (self.tenants_path, self.units_path, self.stakeholders_path)
+        )
+
+    def _build_index(self, mtimes: Tuple[int, ...]) -> RepositoryIndex:
+        return RepositoryIndex.build(
+            tenants=self._load_json(self.tenants_path),
+            units=self._load_json(self.units_path),
+            stakeholders=self._load_json(self.stakeholders_path),
+            mtimes=mtimes,
+        )
 
+    # ---------- RELOAD ---------- #
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """
+        Rebuilds the index when a data file's mtime changed and swaps it in.
+        Only one thread rebuilds at a time; the others keep reading the
+        current index meanwhile. Returns True when a new index was installed.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self._checked_at = time.monotonic()
+            try:
+                mtimes = self._mtimes()
+            except OSError as e:
+                logger.warning(f"Data files unavailable, keeping current index: {e}")
+                return False
+            if not force and mtimes == self._index.mtimes:
+                return False
+
+            started = time.perf_counter()
+            try:
+                index = self._build_index(mtimes)
+            except (OSError, ValueError, KeyError) as e:
+                # Usually a file caught mid-write; the next check retries
+                logger.warning(f"Failed to reload data files, keeping current index: {e}")
+                return False
+
+            self._index = index
+            logger.info(
+                f"Reloaded {len(index.tenants_by_id)} tenants and {len(index.units_by_id)} units "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def _current(self) -> RepositoryIndex:
+        """
+        The index to read from. Every `reload_interval` seconds the file
+        mtimes are checked (three stat calls); a rebuild runs on a background
+        thread so callers on the event loop never wait for it.
+        """
+        if self.reload_interval is not None and time.monotonic() - self._checked_at >= self.reload_interval:
+            self._checked_at = time.monotonic()
+            if self._changed() and not self._reload_lock.locked():
+                threading.Thread(target=self.reload_if_changed, name="data-repository-reload", daemon=True).start()
+        return self._index
+
+    def _changed(self) -> bool:
+        try:
+            return self._mtimes() != self._index.mtimes
+        except OSError:
+            return False
+
+    # ---------- LOOKUPS ---------- #
 
     def find_tenant_by_email(self, sender: str) -> Optional[dict]:
         """
@@ -31,36 +173,40 @@ class DataRepository:
         - 'First Name <email@example.com>'
         - 'email@example.com'
         """
-        # Extract email if in <...> format
-        match = re.search(r"<(.+?)>", sender)
-        email = match.group(1) if match else sender
-        email = email.strip().lower()
+        return self._current().tenants_by_email.get(normalize_email(sender))
 
-        return next((t for t in self._tenants if t.get("email", "").lower() == email), None)
+    def find_tenant_by_id(self, tenant_id: str) -> Optional[dict]:
+        return self._current().tenants_by_id.get(tenant_id)
 
     def find_unit(self, unit_id: str):
-        for unit in self._units:
-            if unit["unit_id"] == unit_id:
-                return unit
-        return None
+        return self._current().units_by_id.get(unit_id)
+
+    def find_unit_by_address(self, address: str) -> Optional[dict]:
+        return self._current().units_by_address.get(normalize_address(address))
 
     def get_full_context_for_email(self, sender_email: str):
         """
         Returns combined tenant + unit context, or None.
         """
-        tenant = self.find_tenant_by_email(sender_email)
+        # One index for both lookups, so a reload in between can't mix versions
+        index = self._current()
+        tenant = index.tenants_by_email.get(normalize_email(sender_email))
         if not tenant:
             return None
 
-        unit = self.find_unit(tenant["unit_id"])
+        unit = index.units_by_id.get(tenant["unit_id"])
 
         return {
             "tenant": tenant,
             "unit": unit,
         }
 
+    async def get_full_context_for_email_async(self, sender_email: str):
+        """Indexed lookups are dict hits, so there's no need for an executor hop."""
+        return self.get_full_context_for_email(sender_email)
+
     def get_stakeholders_for_intent(self, intent: Intent) -> List[str]:
         """
         Returns a list of stakeholder emails for a given intent.
         """
-        return self._stakeholders.get(intent, [])
\ No newline at end of file
+        return self._current().stakeholders.get(intent, [])
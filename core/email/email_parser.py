@@ -1,9 +1,20 @@
+import base64
+import binascii
 import email
+import quopri
+import re
 from email.message import Message
 from email.header import decode_header
-from typing import Tuple, Optional
+from email.parser import BytesHeaderParser
+from email.policy import compat32
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Tuple, Optional
 from core.models import EmailMessage
 
+MESSAGE_ID_RE = re.compile(r"<[^<>\s]+>")
+# Deeper nesting than this is not a tenant's mail client
+MAX_MIME_DEPTH = 8
+
 
 def decode_header_value(value: str) -> str:
     """
@@ -43,18 +54,186 @@ def extract_body(message: Message) -> str:
             return ""  # fallback if None or unknown type
 
 
-def parse_email(raw_email_bytes: bytes) -> EmailMessage:
+def extract_message_ids(value: Optional[str]) -> List[str]:
+    """
+    Pulls the <id@host> tokens out of Message-ID, In-Reply-To or References.
+    """
+    return MESSAGE_ID_RE.findall(str(value)) if value else []
+
+
+def parse_email(raw_email_bytes: bytes, lean: bool = True) -> EmailMessage:
     """
     Parses raw email bytes into an EmailMessage object.
+    The lean path (default) never builds the full MIME tree; `lean=False`
+    parses the whole message with `email.message_from_bytes`.
     """
+    if lean:
+        return parse_email_lean(raw_email_bytes)
     msg: Message = email.message_from_bytes(raw_email_bytes)
+    return _to_email_message(msg, extract_body(msg))
 
+
+def _to_email_message(msg: Message, body: str) -> EmailMessage:
     subject: str = decode_header_value(msg.get("Subject", "") or "")
     sender: str = decode_header_value(msg.get("From", "") or "")
-    body: str = extract_body(msg)
+    message_ids = extract_message_ids(msg.get("Message-ID"))
+    in_reply_to = extract_message_ids(msg.get("In-Reply-To"))
 
     return EmailMessage(
         subject=subject.strip(),
         body=body.strip(),
         sender=sender.strip(),
+        message_id=message_ids[0] if message_ids else None,
+        in_reply_to=in_reply_to[0] if in_reply_to else None,
+        references=extract_message_ids(msg.get("References")),
     )
+
+
+# ---------- LEAN PARSER ---------- #
+
+_HEADER_PARSER = BytesHeaderParser(policy=compat32)
+
+
+def parse_email_lean(raw_email_bytes: bytes) -> EmailMessage:
+    """
+    Reads only the top-level and per-part headers, then decodes just the
+    chosen text part. Part boundaries are found by scanning the raw bytes,
+    so attachments are never copied or base64-decoded. Falls back to the
+    first text/html part, converted to text, when there is no text/plain.
+    """
+    header_end, body_start = _split_headers(raw_email_bytes, 0, len(raw_email_bytes))
+    msg: Message = _HEADER_PARSER.parsebytes(raw_email_bytes[:header_end])
+
+    found: Dict[str, Tuple[Message, int, int]] = {}
+    _locate_text(raw_email_bytes, body_start, len(raw_email_bytes), msg, found, depth=0)
+
+    body = ""
+    if "text/plain" in found:
+        body = _decode_part(raw_email_bytes, *found["text/plain"])
+    elif "text/html" in found:
+        body = html_to_text(_decode_part(raw_email_bytes, *found["text/html"]))
+    return _to_email_message(msg, body)
+
+
+def _split_headers(raw: bytes, start: int, end: int) -> Tuple[int, int]:
+    """Returns (end of the header block, start of the body) within raw[start:end]."""
+    for blank in (b"\r\n", b"\n"):
+        # A part with no headers starts with the blank line
+        if raw.startswith(blank, start, end):
+            return start, start + len(blank)
+    # Pick the separator from the first line ending so the search never
+    # scans a multi-megabyte body for the other kind
+    first_newline = raw.find(b"\n", start, end)
+    separator = b"\r\n\r\n" if first_newline > start and raw[first_newline - 1] == 0x0D else b"\n\n"
+    pos = raw.find(separator, start, end)
+    if pos == -1:
+        return end, end
+    return pos, pos + len(separator)
+
+
+def _iter_parts(raw: bytes, start: int, end: int, boundary: bytes) -> Iterator[Tuple[int, int]]:
+    """Yields the (start, end) offsets of each body part between `--boundary` delimiter lines."""
+    delimiter = b"--" + boundary
+    if raw.startswith(delimiter, start, end):
+        pos = start
+    else:
+        pos = raw.find(b"\n" + delimiter, start, end)
+        if pos == -1:
+            return
+        pos += 1
+
+    while True:
+        after = pos + len(delimiter)
+        if raw.startswith(b"--", after, end):
+            return  # close delimiter
+        line_end = raw.find(b"\n", after, end)
+        if line_end == -1:
+            return
+        part_start = line_end + 1
+        next_delimiter = raw.find(b"\n" + delimiter, part_start - 1, end)
+        if next_delimiter == -1:
+            # Truncated message: the last part runs to the end
+            yield part_start, end
+            return
+        part_end = next_delimiter - 1 if raw[next_delimiter - 1:next_delimiter] == b"\r" else next_delimiter
+        yield part_start, max(part_start, part_end)
+        pos = next_delimiter + 1
+
+
+def _locate_text(raw: bytes, start: int, end: int, headers: Message,
+                 found: Dict[str, Tuple[Message, int, int]], depth: int) -> None:
+    """Records where the first inline text/plain and text/html parts are, descending into multiparts."""
+    if "attachment" in str(headers.get("Content-Disposition", "")):
+        return
+    content_type = headers.get_content_type()
+    if content_type.startswith("multipart/"):
+        boundary = headers.get_param("boundary")
+        if not isinstance(boundary, str) or depth >= MAX_MIME_DEPTH:
+            return
+        for part_start, part_end in _iter_parts(raw, start, end, boundary.encode("ascii", errors="ignore")):
+            header_end, body_start = _split_headers(raw, part_start, part_end)
+            part_headers = _HEADER_PARSER.parsebytes(raw[part_start:header_end])
+            _locate_text(raw, body_start, part_end, part_headers, found, depth + 1)
+            if "text/plain" in found:
+                return
+    elif content_type in ("text/plain", "text/html"):
+        found.setdefault(content_type, (headers, start, end))
+
+
+def decode_transfer_encoding(data: bytes, encoding: str) -> bytes:
+    """Undoes base64 or quoted-printable; 7bit, 8bit and binary pass through."""
+    encoding = encoding.strip().lower()
+    if encoding == "base64":
+        try:
+            return base64.b64decode(data)
+        except (binascii.Error, ValueError):
+            # Missing padding; extra '=' past the end is ignored
+            return binascii.a2b_base64(data + b"==")
+    if encoding == "quoted-printable":
+        return quopri.decodestring(data)
+    return data
+
+
+def _decode_part(raw: bytes, headers: Message, start: int, end: int) -> str:
+    """Undoes the transfer encoding, then decodes with the part's declared charset."""
+    data = decode_transfer_encoding(raw[start:end], str(headers.get("Content-Transfer-Encoding", "")))
+    charset = headers.get_content_charset() or "utf-8"
+    try:
+        return data.decode(charset, errors="ignore")
+    except LookupError:
+        return data.decode("utf-8", errors="ignore")
+
+
+class _HTMLTextExtractor(HTMLParser):
+    BLOCK_TAGS = {"br", "p", "div", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "table"}
+    SKIP_TAGS = {"script", "style", "head", "title"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skipping += 1
+        elif tag in self.BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.chunks.append(data)
+
+
+def html_to_text(html: str) -> str:
+    """Plain text of an HTML body: tags, scripts and styles dropped, block elements become line breaks."""
+    extractor = _HTMLTextExtractor()
+    extractor.feed(html)
+    extractor.close()
+    lines = (" ".join(line.split()) for line in "".join(extractor.chunks).splitlines())
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
@@ -1,79 +1,653 @@
+import asyncio
 import logging
+import re
 from datetime import datetime, timedelta
-from typing import AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Dict, Iterator, List, NamedTuple, Optional, Tuple
 
-from aioimaplib import IMAP4_SSL
+from aioimaplib import IMAP4, IMAP4_SSL, STOP_WAIT_SERVER_PUSH
 from config.settings import settings
+from core.email.email_parser import decode_transfer_encoding
+from core.email.sync_state import SyncState
+from core.metrics import REGISTRY
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
+FETCH_LITERAL_RE = re.compile(rb"^\d+ FETCH \(.*\{(\d+)\}$")
+FETCH_UID_RE = re.compile(rb"UID (\d+)")
+UIDVALIDITY_RE = re.compile(rb"\[UIDVALIDITY (\d+)\]")
+UIDNEXT_RE = re.compile(rb"\[UIDNEXT (\d+)\]")
+HEADER_LITERAL_RE = re.compile(rb"^\d+ FETCH \(.*BODY\[HEADER\] \{\d+\}$")
+BODYSTRUCTURE_RE = re.compile(rb"BODYSTRUCTURE ")
+RFC822_SIZE_RE = re.compile(rb"RFC822\.SIZE (\d+)")
+SEXP_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|(\{\d+\})|([^\s()"]+))')
+# Headers that describe the original MIME layout; replaced when rebuilding a header-first message
+MIME_HEADER_RE = re.compile(rb"^(content-type|content-transfer-encoding):", re.IGNORECASE)
+
+FETCH_SECONDS = REGISTRY.histogram(
+    "imap_fetch_seconds", "Time per IMAP fetch round (one message, or one UID chunk)", ["mode"]
+)
+MESSAGES_FETCHED = REGISTRY.counter("imap_messages_fetched_total", "Messages fetched from IMAP", ["mode"])
+BYTES_TOTAL = REGISTRY.counter(
+    "imap_bytes_total", "Message bytes downloaded, or left on the server by header-first fetches", ["kind"]
+)
+
+
+class BodyPart(NamedTuple):
+    """One leaf of a message's BODYSTRUCTURE, addressable as BODY[section]."""
+    section: str
+    content_type: str
+    params: Dict[str, str]
+    encoding: str
+    size: int
+    disposition: Optional[str] = None
+    filename: Optional[str] = None
+
+    @property
+    def is_attachment(self) -> bool:
+        return self.disposition == "attachment" or not self.content_type.startswith("text/")
+
+
+class FetchedEmail(NamedTuple):
+    """Raw RFC822 bytes plus the UID they were fetched under (None on the sequence-number path)."""
+    uid: Optional[int]
+    raw: bytes
+    # Header-first fetches leave attachments on the server; see IMAPReader.fetch_part
+    attachments: Tuple[BodyPart, ...] = ()
+
+
+def search_uids(response) -> List[int]:
+    """Extracts the UIDs from a UID SEARCH response."""
+    if not is_ok_response(response) or not response.lines:
+        return []
+    return [int(uid) for uid in response.lines[0].split() if uid.isdigit()]
+
 
 def is_ok_response(response) -> bool:
     """Check if aioimaplib response indicates success."""
+    if response.result == "OK":
+        return True
     if not response.lines:
         return False
     return any(line.startswith(b"OK") or b"Success" in line for line in response.lines)
 
 
+def to_message_set(uids: List[int]) -> str:
+    """
+    Compresses a list of UIDs into an IMAP message set.
+    Example: [1, 2, 3, 7, 9, 10] -> '1:3,7,9:10'
+    """
+    ranges: List[str] = []
+    start = prev = None
+    for uid in sorted(uids):
+        if start is None:
+            start = prev = uid
+        elif uid == prev + 1:
+            prev = uid
+        else:
+            ranges.append(f"{start}:{prev}" if start != prev else str(start))
+            start = prev = uid
+    if start is not None:
+        ranges.append(f"{start}:{prev}" if start != prev else str(start))
+    return ",".join(ranges)
+
+
+def iter_fetch_literals(lines: List[bytes]) -> Iterator[Tuple[Optional[int], bytes]]:
+    """
+    Walks a multi-message FETCH response and yields (uid, literal) pairs.
+    aioimaplib puts each literal on its own line right after the
+    '<seq> FETCH (... {size}' line that announces it.
+    """
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        match = FETCH_LITERAL_RE.match(bytes(line)) if isinstance(line, (bytes, bytearray)) else None
+        if match and index + 1 < len(lines):
+            literal = bytes(lines[index + 1])
+            uid_match = FETCH_UID_RE.search(bytes(line))
+            # Some servers send the UID after the literal: ' UID 42)'
+            if not uid_match and index + 2 < len(lines):
+                uid_match = FETCH_UID_RE.search(bytes(lines[index + 2]))
+            yield (int(uid_match.group(1)) if uid_match else None), literal
+            index += 2
+        else:
+            index += 1
+
+
+def parse_sexp(data: bytes, pos: int = 0) -> Tuple[Any, int]:
+    """
+    Parses one IMAP parenthesized list (or atom) starting at `pos`.
+    Lists become Python lists, quoted strings and atoms become str, NIL becomes None.
+    """
+    match = SEXP_TOKEN_RE.match(data, pos)
+    if not match:
+        raise ValueError(f"Unexpected IMAP data at offset {pos}")
+    pos = match.end()
+    open_paren, close_paren, quoted, literal, atom = match.groups()
+    if open_paren:
+        items = []
+        while True:
+            close = SEXP_TOKEN_RE.match(data, pos)
+            if close and close.group(2):
+                return items, close.end()
+            item, pos = parse_sexp(data, pos)
+            items.append(item)
+    if close_paren:
+        raise ValueError(f"Unbalanced ')' at offset {pos}")
+    if literal:
+        # aioimaplib splits literals onto their own line; not worth stitching back for a structure
+        raise ValueError("Literal inside BODYSTRUCTURE")
+    if quoted is not None:
+        return re.sub(rb"\\(.)", rb"\1", quoted).decode("utf-8", errors="replace"), pos
+    return (None if atom.upper() == b"NIL" else atom.decode("utf-8", errors="replace")), pos
+
+
+def _pairs(value) -> Dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    return {str(k).lower(): v for k, v in zip(value[::2], value[1::2]) if k is not None and v is not None}
+
+
+def flatten_bodystructure(node: list, prefix: str = "") -> Iterator[BodyPart]:
+    """Yields the leaf parts of a parsed BODYSTRUCTURE with their section numbers ("1", "1.2", ...)."""
+    if node and isinstance(node[0], list):
+        children = []
+        for child in node:
+            if not isinstance(child, list):
+                break  # the multipart subtype follows the children
+            children.append(child)
+        for number, child in enumerate(children, 1):
+            yield from flatten_bodystructure(child, f"{prefix}.{number}" if prefix else str(number))
+        return
+
+    content_type = f"{node[0] or 'text'}/{node[1] or 'plain'}".lower()
+    size = node[6] if len(node) > 6 else None
+    # Extension data (md5, disposition, ...) follows the line count for text and envelope/body/lines for message/rfc822
+    md5 = 7 + content_type.startswith("text/") + 3 * (content_type == "message/rfc822")
+    disposition = node[md5 + 1] if len(node) > md5 + 1 else None
+    disposition_type = disposition_params = None
+    if isinstance(disposition, list) and disposition:
+        disposition_type = str(disposition[0]).lower()
+        disposition_params = _pairs(disposition[1] if len(disposition) > 1 else None)
+    params = _pairs(node[2])
+    yield BodyPart(
+        section=prefix or "1",
+        content_type=content_type,
+        params=params,
+        encoding=(node[5] or "7bit").lower() if len(node) > 5 else "7bit",
+        size=int(size) if isinstance(size, str) and size.isdigit() else 0,
+        disposition=disposition_type,
+        filename=(disposition_params or {}).get("filename") or params.get("name"),
+    )
+
+
+def choose_text_part(parts: List[BodyPart]) -> Optional[BodyPart]:
+    """The part the parser would read: first inline text/plain, else first inline text/html."""
+    for content_type in ("text/plain", "text/html"):
+        for part in parts:
+            if part.content_type == content_type and part.disposition != "attachment":
+                return part
+    return None
+
+
+def iter_fetch_structures(lines: List[bytes]) -> Iterator[Tuple[int, bytes, bytes]]:
+    """
+    Walks a `(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER])` response and
+    yields (uid, fetch attributes text, header block) per message.
+    """
+    for index, line in enumerate(lines):
+        if not isinstance(line, (bytes, bytearray)) or not HEADER_LITERAL_RE.search(bytes(line)):
+            continue
+        if index + 1 >= len(lines):
+            break
+        attributes = bytes(line)
+        # Servers may send the remaining attributes after the literal
+        if index + 2 < len(lines) and not FETCH_LITERAL_RE.match(bytes(lines[index + 2])):
+            attributes += b" " + bytes(lines[index + 2])
+        uid_match = FETCH_UID_RE.search(attributes)
+        if uid_match:
+            yield int(uid_match.group(1)), attributes, bytes(lines[index + 1])
+
+
+def rebuild_text_message(header: bytes, part: Optional[BodyPart], body: bytes) -> bytes:
+    """
+    A minimal RFC822 message from the original header block and just the
+    text part, relabelled with that part's type, charset and encoding.
+    """
+    kept: List[bytes] = []
+    skipping = False
+    for line in header.rstrip(b"\r\n").splitlines():
+        if line[:1] in (b" ", b"\t"):
+            if not skipping:
+                kept.append(line)
+            continue
+        skipping = bool(MIME_HEADER_RE.match(line))
+        if not skipping:
+            kept.append(line)
+
+    content_type = part.content_type if part else "text/plain"
+    charset = part.params.get("charset") if part else None
+    kept.append(f"Content-Type: {content_type}".encode() + (f'; charset="{charset}"'.encode() if charset else b""))
+    kept.append(f"Content-Transfer-Encoding: {part.encoding if part else '7bit'}".encode())
+    return b"\r\n".join(kept) + b"\r\n\r\n" + body
+
+
 class IMAPReader:
-    def __init__(self, days_back: int = 1):
-        self.host: str = settings.IMAP_HOST
-        self.user: str = settings.IMAP_USER
-        self.password: str = settings.IMAP_PASSWORD
+    RECONNECT_BACKOFF_MIN = 1
+    RECONNECT_BACKOFF_MAX = 60
+    # Chunk size when header-first fetching is on but fetch_batch_size is not set
+    HEADER_FIRST_BATCH_SIZE = 50
+
+    def __init__(self, days_back: int = 1, fetch_batch_size: int = 0, idle_timeout: float = 5 * 60,
+                 sync_state: Optional[SyncState] = None, host: Optional[str] = None,
+                 user: Optional[str] = None, password: Optional[str] = None, mailbox: str = "INBOX",
+                 header_first: bool = False):
+        # Explicit credentials serve one of several mailboxes; the defaults come from settings
+        self.host: str = host or settings.IMAP_HOST
+        self.user: str = user or settings.IMAP_USER
+        self.password: str = password or settings.IMAP_PASSWORD
+        self.port: int = getattr(settings, "IMAP_PORT", 993)
+        # Plain IMAP is only for local test servers
+        self.use_ssl: bool = True
+        self.mailbox = mailbox
         self.days_back = days_back
+        # 0 keeps the one-RFC822-per-message path, > 0 fetches UID ranges in chunks
+        self.fetch_batch_size = fetch_batch_size
+        # Servers drop IDLE after 30 minutes; re-issue well before that
+        self.idle_timeout = idle_timeout
+        # When set, search `UID <last+1>:*` instead of rescanning the unread window
+        self.sync_state = sync_state
+        # Fetch BODYSTRUCTURE and headers first, then only the text part; attachments stay on the server
+        self.header_first = header_first
+        self._uidvalidity: Optional[int] = None
+        self._uidnext: Optional[int] = None
 
-    async def fetch_unread_stream(self) -> AsyncGenerator[bytes, None]:
+        self.bytes_fetched = 0
+        self.bytes_skipped = 0
+        # Matches of the current search not handed out yet, i.e. the backlog still on the server
+        self.unfetched = 0
+
+    async def fetch_unread_stream(self) -> AsyncGenerator[FetchedEmail, None]:
         """
         Fully async IMAP email fetcher using aioimaplib.
         Streams unread emails from the last N days.
         """
-        imap = IMAP4_SSL(self.host)
+        imap = self._client()
         try:
-            # Connect and wait for server greeting
-            await imap.wait_hello_from_server()
-            await imap.login(self.user, self.password)
-            logger.info(f"Logged in to IMAP as {self.user}")
-
-            # Select INBOX
-            select_result = await imap.select("INBOX")
-            if not is_ok_response(select_result):
-                logger.error("Failed to select INBOX")
+            if not await self._open(imap):
                 return
 
-            # Build search query
-            since_date = (datetime.now() - timedelta(days=self.days_back)).strftime("%d-%b-%Y")
-            search_criteria = f'(UNSEEN SINCE {since_date})'
+            async for fetched in self._fetch_unread(imap):
+                yield fetched
 
-            # Search for unread messages
-            search_result = await imap.search(search_criteria)
-            if not is_ok_response(search_result) or not search_result.lines:
-                logger.info("No unread emails found.")
-                return
+        except Exception as e:
+            logger.exception(f"IMAP error: {e}")
+
+        finally:
+            await imap.logout()
+            logger.info("Logged out from IMAP.")
+
+    async def watch_unread_stream(self, poll_interval: float = 2) -> AsyncGenerator[FetchedEmail, None]:
+        """
+        Long-lived IMAP connection that streams unread emails as they arrive.
+        Waits in IDLE for EXISTS pushes when the server advertises IDLE and falls
+        back to polling every `poll_interval` seconds otherwise. Dropped
+        connections are re-established with exponential backoff.
+        """
+        backoff = self.RECONNECT_BACKOFF_MIN
+        while True:
+            imap = self._client()
+            try:
+                if not await self._open(imap):
+                    raise ConnectionError(f"Failed to select {self.mailbox}")
+                backoff = self.RECONNECT_BACKOFF_MIN
 
-            # Extract message IDs as strings from first line only
-            message_ids = [
-                msg_id.decode() for msg_id in search_result.lines[0].split() if msg_id.isdigit()
-            ]
-            logger.info(f"Found {len(message_ids)} unread emails.")
+                supports_idle = imap.has_capability("IDLE")
+                if not supports_idle:
+                    logger.info(f"IMAP server has no IDLE support, polling every {poll_interval}s")
 
-            # Fetch each email
-            for msg_id in message_ids:
+                while True:
+                    async for fetched in self._fetch_unread(imap):
+                        yield fetched
+
+                    if supports_idle:
+                        await self._idle_until_exists(imap)
+                    else:
+                        await asyncio.sleep(poll_interval)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"IMAP connection error: {e}. Reconnecting in {backoff}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.RECONNECT_BACKOFF_MAX)
+
+            finally:
+                try:
+                    await imap.logout()
+                    logger.info("Logged out from IMAP.")
+                except Exception:
+                    pass
+
+    def _client(self) -> IMAP4_SSL:
+        if self.use_ssl:
+            return IMAP4_SSL(self.host, self.port)
+        return IMAP4(self.host, self.port)
+
+    async def _open(self, imap: IMAP4_SSL) -> bool:
+        """Waits for the server greeting, logs in and selects the mailbox."""
+        await imap.wait_hello_from_server()
+        await imap.login(self.user, self.password)
+        logger.info(f"Logged in to IMAP as {self.user}")
+
+        select_result = await imap.select(self.mailbox)
+        if not is_ok_response(select_result):
+            logger.error(f"Failed to select {self.mailbox}")
+            return False
+
+        self._uidvalidity = self._uidnext = None
+        for line in select_result.lines:
+            if isinstance(line, bytes):
+                if match := UIDVALIDITY_RE.search(line):
+                    self._uidvalidity = int(match.group(1))
+                if match := UIDNEXT_RE.search(line):
+                    self._uidnext = int(match.group(1))
+        return True
+
+    def stats(self) -> dict:
+        return {"bytes_fetched": self.bytes_fetched, "bytes_skipped": self.bytes_skipped, "unfetched": self.unfetched}
+
+    def commit(self, uid: Optional[int], failed: bool = False) -> None:
+        """
+        Advances the incremental-sync mark once a message's workflow and reply
+        are done. A no-op without a sync state or for messages without a UID.
+        """
+        if self.sync_state is not None and uid is not None:
+            self.sync_state.commit(uid, failed=failed)
+
+    def release(self, uid: Optional[int]) -> None:
+        """
+        Hands back a message that was fetched but could not be finished, e.g.
+        its reply was not sent. The mark stays below it and the next search
+        fetches it again. A no-op without a sync state or UID.
+        """
+        if self.sync_state is not None and uid is not None:
+            self.sync_state.release(uid)
+
+    async def flush(self) -> None:
+        """Waits for the sync state's pending writes, e.g. before shutting down."""
+        if self.sync_state is not None:
+            await self.sync_state.flush()
+
+    async def _idle_until_exists(self, imap: IMAP4_SSL) -> None:
+        """
+        Blocks in IMAP IDLE until the server pushes an EXISTS update.
+        IDLE is re-issued every `idle_timeout` seconds so servers do not drop us.
+        """
+        idle = await imap.idle_start(timeout=self.idle_timeout)
+        try:
+            while True:
+                push = await imap.wait_server_push()
+                if push == STOP_WAIT_SERVER_PUSH:
+                    return
+                if any(line.endswith(b"EXISTS") for line in push if isinstance(line, bytes)):
+                    logger.info("IDLE: new mail notification received")
+                    return
+        finally:
+            imap.idle_done()
+            await asyncio.wait_for(idle, timeout=imap.timeout)
+
+    async def _fetch_unread(self, imap: IMAP4_SSL) -> AsyncGenerator[FetchedEmail, None]:
+        """Searches the selected mailbox for unread emails and streams them, counting down `unfetched`."""
+        try:
+            async for fetched in self._search_and_fetch(imap):
+                self.unfetched = max(0, self.unfetched - 1)
+                yield fetched
+        finally:
+            self.unfetched = 0
+
+    async def _search_and_fetch(self, imap: IMAP4_SSL) -> AsyncGenerator[FetchedEmail, None]:
+        if self.sync_state is not None:
+            async for fetched in self._fetch_incremental(imap):
+                yield fetched
+            return
+
+        # Build search query
+        since_date = (datetime.now() - timedelta(days=self.days_back)).strftime("%d-%b-%Y")
+        search_criteria = f'(UNSEEN SINCE {since_date})'
+
+        if self.fetch_batch_size > 0 or self.header_first:
+            async for fetched in self._fetch_batched(imap, search_criteria):
+                yield fetched
+            return
+
+        # Search for unread messages
+        search_result = await imap.search(search_criteria)
+        if not is_ok_response(search_result) or not search_result.lines:
+            logger.info("No unread emails found.")
+            return
+
+        # Extract message IDs as strings from first line only
+        message_ids = [
+            msg_id.decode() for msg_id in search_result.lines[0].split() if msg_id.isdigit()
+        ]
+        logger.info(f"Found {len(message_ids)} unread emails.")
+        self.unfetched = len(message_ids)
+
+        # Fetch each email
+        for msg_id in message_ids:
+            with FETCH_SECONDS.time(mode="single"):
                 fetch_result = await imap.fetch(msg_id, "RFC822")
-                if not is_ok_response(fetch_result) or not fetch_result.lines:
-                    logger.warning(f"Failed to fetch message ID {msg_id}")
-                    continue
+            if not is_ok_response(fetch_result) or not fetch_result.lines:
+                logger.warning(f"Failed to fetch message ID {msg_id}")
+                continue
 
-                # Extract raw email bytes from lines (usually lines[1] has the email body)
-                raw_email: Optional[bytes] = fetch_result.lines[1] if len(fetch_result.lines) > 1 else fetch_result.lines[0]
+            # Extract raw email bytes from lines (usually lines[1] has the email body)
+            raw_email: Optional[bytes] = fetch_result.lines[1] if len(fetch_result.lines) > 1 else fetch_result.lines[0]
 
-                if raw_email:
-                    yield raw_email
+            if raw_email:
+                MESSAGES_FETCHED.inc(mode="single")
+                BYTES_TOTAL.inc(len(raw_email), kind="fetched")
+                yield FetchedEmail(uid=None, raw=raw_email)
 
-        except Exception as e:
-            logger.exception(f"IMAP error: {e}")
+    async def _fetch_incremental(self, imap: IMAP4_SSL) -> AsyncGenerator[FetchedEmail, None]:
+        """Fetches only messages above the persisted UID high-water mark."""
+        state = self.sync_state
+        if self._uidvalidity is None:
+            raise ConnectionError("Server did not report UIDVALIDITY; cannot sync incrementally")
 
+        if not state.is_initialized or state.uidvalidity != self._uidvalidity:
+            if state.is_initialized:
+                logger.warning(f"UIDVALIDITY changed ({state.uidvalidity} -> {self._uidvalidity}), resetting sync state")
+            await self._bootstrap_sync_state(imap)
+
+        search_result = await imap.uid_search(f"UID {state.last_uid + 1}:*")
+        if not is_ok_response(search_result):
+            # An empty answer would read as "every released UID is gone"
+            raise ConnectionError(f"UID SEARCH failed: {search_result.result}")
+        uids = state.claim(search_uids(search_result))
+        if not uids:
+            logger.info("No new emails found.")
+            return
+        logger.info(f"Found {len(uids)} new emails above UID {state.last_uid}.")
+        self.unfetched = len(uids)
+
+        remaining = set(uids)
+        try:
+            async for fetched in self._fetch_uids(imap, uids, self._batch_size()):
+                remaining.discard(fetched.uid)
+                yield fetched
         finally:
-            await imap.logout()
-            logger.info("Logged out from IMAP.")
+            # Anything not handed out stays pending and is fetched again by the next search
+            for uid in remaining:
+                state.release(uid)
+
+    async def _bootstrap_sync_state(self, imap: IMAP4_SSL) -> None:
+        """
+        Seeds the mark from the unread window once: unread UIDs become the work
+        to do and everything else above the oldest of them counts as done.
+        """
+        since_date = (datetime.now() - timedelta(days=self.days_back)).strftime("%d-%b-%Y")
+        unseen = search_uids(await imap.uid_search(f"(UNSEEN SINCE {since_date})"))
+
+        if unseen:
+            first = min(unseen)
+            existing = search_uids(await imap.uid_search(f"UID {first}:*"))
+            self.sync_state.reset(self._uidvalidity, first - 1, done=set(existing) - set(unseen))
+        elif self._uidnext is not None:
+            self.sync_state.reset(self._uidvalidity, self._uidnext - 1)
+        else:
+            existing = search_uids(await imap.uid_search("ALL"))
+            self.sync_state.reset(self._uidvalidity, max(existing, default=0))
+        logger.info(f"Initialized IMAP sync state at UID {self.sync_state.last_uid}")
+
+    async def _fetch_batched(self, imap: IMAP4_SSL, search_criteria: str) -> AsyncGenerator[FetchedEmail, None]:
+        """Runs a UID SEARCH and streams the matches with chunked UID FETCH."""
+        uids = search_uids(await imap.uid_search(search_criteria))
+        if not uids:
+            logger.info("No unread emails found.")
+            return
+        logger.info(f"Found {len(uids)} unread emails.")
+        self.unfetched = len(uids)
+
+        async for fetched in self._fetch_uids(imap, uids, self._batch_size()):
+            yield fetched
+
+    def _batch_size(self) -> int:
+        if self.fetch_batch_size > 0:
+            return self.fetch_batch_size
+        return self.HEADER_FIRST_BATCH_SIZE if self.header_first else 1
+
+    async def _fetch_uids(self, imap: IMAP4_SSL, uids: List[int], batch_size: int) -> AsyncGenerator[FetchedEmail, None]:
+        """
+        Fetches messages with UID FETCH over chunks of `batch_size` UIDs.
+        The next chunk is requested before the current one is handed out, so the
+        network transfer overlaps with downstream processing.
+        """
+        chunks = [uids[i:i + batch_size] for i in range(0, len(uids), batch_size)]
+        pending = asyncio.ensure_future(self._fetch_chunk_timed(imap, chunks[0]))
+        try:
+            for index, chunk in enumerate(chunks):
+                messages = await pending
+                if index + 1 < len(chunks):
+                    pending = asyncio.ensure_future(self._fetch_chunk_timed(imap, chunks[index + 1]))
+
+                for fetched in messages:
+                    yield fetched
+
+                if len(messages) < len(chunk):
+                    logger.warning(f"Fetched {len(messages)}/{len(chunk)} messages for UID chunk {to_message_set(chunk)}")
+        finally:
+            if not pending.done():
+                pending.cancel()
+
+    async def _fetch_chunk_timed(self, imap: IMAP4_SSL, chunk: List[int]) -> List[FetchedEmail]:
+        mode = "header_first" if self.header_first else "rfc822"
+        fetch_chunk = self._fetch_chunk_header_first if self.header_first else self._fetch_chunk
+        with FETCH_SECONDS.time(mode=mode):
+            messages = await fetch_chunk(imap, chunk)
+        MESSAGES_FETCHED.inc(len(messages), mode=mode)
+        return messages
+
+    async def _fetch_chunk(self, imap: IMAP4_SSL, chunk: List[int]) -> List[FetchedEmail]:
+        fetch_result = await imap.uid("fetch", to_message_set(chunk), "(UID RFC822)")
+        if not is_ok_response(fetch_result):
+            logger.warning(f"Failed to fetch UID chunk {to_message_set(chunk)}")
+            return []
+        messages = [FetchedEmail(uid=uid, raw=raw_email) for uid, raw_email in iter_fetch_literals(fetch_result.lines)]
+        fetched = sum(len(m.raw) for m in messages)
+        self.bytes_fetched += fetched
+        BYTES_TOTAL.inc(fetched, kind="fetched")
+        return messages
+
+    async def _fetch_chunk_header_first(self, imap: IMAP4_SSL, chunk: List[int]) -> List[FetchedEmail]:
+        """
+        Phase one peeks at each message's size, BODYSTRUCTURE and header block;
+        phase two fetches only the text part the parser will read, one UID
+        FETCH per distinct section number. Messages without a text part are
+        marked \\Seen with UID STORE instead. Messages whose structure cannot
+        be parsed are fetched whole.
+        """
+        message_set = to_message_set(chunk)
+        fetch_result = await imap.uid("fetch", message_set, "(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER])")
+        if not is_ok_response(fetch_result):
+            logger.warning(f"Failed to fetch headers for UID chunk {message_set}")
+            return []
+
+        planned: Dict[int, Tuple[bytes, Optional[BodyPart], List[BodyPart]]] = {}
+        by_section: Dict[str, List[int]] = {}
+        whole: List[int] = []
+        for uid, attributes, header in iter_fetch_structures(fetch_result.lines):
+            try:
+                structure_at = BODYSTRUCTURE_RE.search(attributes)
+                structure, _ = parse_sexp(attributes, structure_at.end())
+                parts = list(flatten_bodystructure(structure))
+            except (AttributeError, ValueError, IndexError) as e:
+                logger.debug(f"UID {uid}: unusable BODYSTRUCTURE ({e}), fetching whole message")
+                whole.append(uid)
+                continue
+            text_part = choose_text_part(parts)
+            planned[uid] = (header, text_part, [p for p in parts if p is not text_part and p.is_attachment])
+            if text_part is not None:
+                by_section.setdefault(text_part.section, []).append(uid)
+
+            size_match = RFC822_SIZE_RE.search(attributes)
+            size = int(size_match.group(1)) if size_match else 0
+            transferred = len(header) + (text_part.size if text_part else 0)
+            self.bytes_fetched += transferred
+            self.bytes_skipped += max(size - transferred, 0)
+            BYTES_TOTAL.inc(transferred, kind="fetched")
+            BYTES_TOTAL.inc(max(size - transferred, 0), kind="skipped")
+
+        bodies: Dict[int, bytes] = {}
+        for section, uids in by_section.items():
+            # Not PEEK: like an RFC822 fetch this marks the message \Seen, which the UNSEEN search relies on
+            body_result = await imap.uid("fetch", to_message_set(uids), f"(UID BODY[{section}])")
+            if not is_ok_response(body_result):
+                logger.warning(f"Failed to fetch BODY[{section}] for UIDs {to_message_set(uids)}")
+                continue
+            for uid, body in iter_fetch_literals(body_result.lines):
+                if uid is not None:
+                    bodies[uid] = body
+
+        # No text part means no body fetch to set \Seen; without it the message would be found again
+        textless = [uid for uid, (_, text_part, _) in planned.items() if text_part is None]
+        if textless:
+            store_result = await imap.uid("store", to_message_set(textless), "+FLAGS", "(\\Seen)")
+            if not is_ok_response(store_result):
+                logger.warning(f"Failed to mark UIDs {to_message_set(textless)} seen")
+
+        messages = []
+        for uid in chunk:
+            if uid in planned:
+                header, text_part, attachments = planned[uid]
+                if text_part is not None and uid not in bodies:
+                    continue
+                raw = rebuild_text_message(header, text_part, bodies.get(uid, b""))
+                messages.append(FetchedEmail(uid=uid, raw=raw, attachments=tuple(attachments)))
+        if whole:
+            messages.extend(await self._fetch_chunk(imap, whole))
+        return messages
+
+    async def fetch_part(self, uid: int, part: BodyPart) -> bytes:
+        """
+        Downloads one attachment left on the server by a header-first fetch,
+        with its transfer encoding undone. Uses its own short-lived connection
+        so it can be called from workflow handlers while the reader is idling.
+        """
+        imap = self._client()
+        try:
+            await imap.wait_hello_from_server()
+            await imap.login(self.user, self.password)
+            if not is_ok_response(await imap.select(self.mailbox)):
+                raise ConnectionError(f"Failed to select {self.mailbox}")
+            result = await imap.uid("fetch", str(uid), f"(UID BODY.PEEK[{part.section}])")
+            for _, literal in iter_fetch_literals(result.lines if is_ok_response(result) else []):
+                return decode_transfer_encoding(literal, part.encoding)
+            raise LookupError(f"UID {uid} has no BODY[{part.section}]")
+        finally:
+            try:
+                await imap.logout()
+            except Exception:
+                pass
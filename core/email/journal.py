@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.models import LLMResponse
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+# Progress of one email, in order. An email without a row was only fetched.
+CLASSIFIED = "classified"
+TICKETED = "ticketed"
+REPLIED = "replied"
+STAGES = (CLASSIFIED, TICKETED, REPLIED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    email_key TEXT PRIMARY KEY,
+    uid INTEGER,
+    stage TEXT NOT NULL,
+    llm_response TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS journal_updated ON journal (updated_at);
+CREATE TABLE IF NOT EXISTS batches (
+    email_key TEXT PRIMARY KEY,
+    batch_id TEXT NOT NULL,
+    submitted_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class JournalEntry:
+    stage: str
+    llm_response: Optional[LLMResponse] = None
+
+    def reached(self, stage: str) -> bool:
+        return STAGES.index(self.stage) >= STAGES.index(stage)
+
+
+class EmailJournal:
+    """
+    Per-email stage checkpoints in a SQLite file, keyed by the same email
+    key as workflow idempotency and reply Message-IDs.
+
+    An email that is refetched after a shutdown or crash resumes after its
+    last completed stage: a classified email keeps its LLM response, a
+    ticketed one skips the workflows and a replied one is only marked done.
+    A stage only moves forward. Rows are kept for `retention` seconds,
+    which should outlast any IMAP backlog. All database access runs in
+    the default executor.
+
+    Emails sent to the Batch API also record their batch id, under their
+    email key (which is also the batch custom_id), so after a restart the
+    batch is polled again instead of paying for the same answer twice.
+    """
+
+    def __init__(self, db_path: str | Path, retention: float = 7 * 24 * 60 * 60):
+        self.db_path = Path(db_path)
+        self.retention = retention
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.execute("DELETE FROM journal WHERE updated_at < ?", (time.time() - retention,))
+        self._db.execute("DELETE FROM batches WHERE submitted_at < ?", (time.time() - retention,))
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        self.resumed: Dict[str, int] = {stage: 0 for stage in STAGES}
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fn, *args)
+
+    async def get(self, email_key: str) -> Optional[JournalEntry]:
+        entry = await self._run(self._get, email_key)
+        if entry is not None:
+            self.resumed[entry.stage] += 1
+        return entry
+
+    def _get(self, email_key: str) -> Optional[JournalEntry]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT stage, llm_response FROM journal WHERE email_key = ?", (email_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        stage, raw_response = row
+        try:
+            llm_response = LLMResponse.model_validate_json(raw_response) if raw_response else None
+        except ValueError as e:
+            logger.warning(f"Unreadable LLM response in journal for {email_key}, classifying again: {e}")
+            return None
+        return JournalEntry(stage=stage, llm_response=llm_response)
+
+    async def record(self, email_key: str, stage: str, uid: Optional[int] = None,
+                     llm_response: Optional[LLMResponse] = None) -> None:
+        """Checkpoints `stage` for the email; the stored LLM response is kept when none is given."""
+        raw_response = llm_response.model_dump_json() if llm_response is not None else None
+        await self._run(self._record, email_key, stage, uid, raw_response)
+
+    def _record(self, email_key: str, stage: str, uid: Optional[int], raw_response: Optional[str]) -> None:
+        with self._db_lock:
+            row = self._db.execute("SELECT stage FROM journal WHERE email_key = ?", (email_key,)).fetchone()
+            if row is not None and STAGES.index(row[0]) > STAGES.index(stage):
+                stage = row[0]
+            self._db.execute(
+                "INSERT INTO journal (email_key, uid, stage, llm_response, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (email_key) DO UPDATE SET stage = excluded.stage, "
+                "llm_response = COALESCE(excluded.llm_response, journal.llm_response), "
+                "updated_at = excluded.updated_at",
+                (email_key, uid, stage, raw_response, time.time()),
+            )
+            self._db.commit()
+
+    async def record_batch(self, batch_id: str, email_keys: List[str]) -> None:
+        """Remembers which batch job is answering each email."""
+        await self._run(self._record_batch, batch_id, email_keys)
+
+    def _record_batch(self, batch_id: str, email_keys: List[str]) -> None:
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO batches (email_key, batch_id, submitted_at) VALUES (?, ?, ?)",
+                [(email_key, batch_id, now) for email_key in email_keys],
+            )
+            self._db.commit()
+
+    async def get_batch(self, email_key: str) -> Optional[str]:
+        """The batch job submitted for the email, if any."""
+        return await self._run(self._get_batch, email_key)
+
+    def _get_batch(self, email_key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute("SELECT batch_id FROM batches WHERE email_key = ?", (email_key,)).fetchone()
+        return row[0] if row else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._db_lock:
+            rows = self._db.execute("SELECT stage, COUNT(*) FROM journal GROUP BY stage").fetchall()
+        return {
+            **{stage: 0 for stage in STAGES}, **dict(rows),
+            **{f"resumed_{stage}": count for stage, count in self.resumed.items()},
+        }
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
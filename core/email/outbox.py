@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiosmtplib
+
+from core.email.smtp_sender import SMTPSender
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    message_id TEXT PRIMARY KEY,
+    recipient TEXT NOT NULL,
+    cc TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+
+def make_message_id(*parts: str, domain: str = "localhost") -> str:
+    """Deterministic Message-ID, so replaying the same reply dedups instead of sending twice."""
+    digest = hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()[:32]
+    return f"<{digest}@{domain}>"
+
+
+@dataclass
+class OutboundMessage:
+    message_id: str
+    to: str
+    cc: List[str]
+    subject: str
+    body: str
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+
+
+class Outbox:
+    """
+    Durable queue of outgoing replies in a SQLite file.
+
+    Rows go pending -> sending -> sent, or back to pending with a later
+    `next_attempt_at` on failure, or to dead once retries are exhausted.
+    The Message-ID is the primary key, so enqueueing the same reply twice
+    is a no-op. Sent rows are kept for `retention` seconds to dedup late
+    replays. All database access runs in the default executor.
+    """
+
+    def __init__(self, db_path: str | Path, retention: float = 7 * 24 * 60 * 60):
+        self.db_path = Path(db_path)
+        self.retention = retention
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # Anything left 'sending' by a crash may not have gone out; try again
+        self._db.execute("UPDATE outbox SET status = ? WHERE status = ?", (PENDING, SENDING))
+        self._db.commit()
+        self._db_lock = threading.Lock()
+        # Set on enqueue so the sender wakes up without polling
+        self.wakeup = asyncio.Event()
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fn, *args)
+
+    # ---------- PRODUCER ---------- #
+
+    async def enqueue(self, message: OutboundMessage) -> bool:
+        """Persists the message. Returns False when the Message-ID was already queued or sent."""
+        added = await self._run(self._insert, message)
+        if added:
+            self.wakeup.set()
+        else:
+            logger.info("Reply %s already in the outbox, not queueing it again", message.message_id)
+        return added
+
+    def _insert(self, message: OutboundMessage) -> bool:
+        now = time.time()
+        with self._db_lock:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO outbox (message_id, recipient, cc, subject, body, status, attempts, "
+                "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                (message.message_id, message.to, json.dumps(message.cc), message.subject, message.body,
+                 PENDING, now, message.created_at, now),
+            )
+            self._db.commit()
+            return cursor.rowcount == 1
+
+    # ---------- CONSUMER ---------- #
+
+    async def claim_due(self, limit: int) -> List[OutboundMessage]:
+        return await self._run(self._claim_due, limit)
+
+    def _claim_due(self, limit: int) -> List[OutboundMessage]:
+        now = time.time()
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT message_id, recipient, cc, subject, body, attempts, created_at FROM outbox "
+                "WHERE status = ? AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (PENDING, now, limit),
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE outbox SET status = ?, updated_at = ? WHERE message_id = ?",
+                [(SENDING, now, row[0]) for row in rows],
+            )
+            self._db.commit()
+        return [
+            OutboundMessage(message_id=r[0], to=r[1], cc=json.loads(r[2]), subject=r[3], body=r[4],
+                            attempts=r[5], created_at=r[6])
+            for r in rows
+        ]
+
+    def release(self, messages: List[OutboundMessage]) -> None:
+        """Returns claimed messages to pending, e.g. when the sender is cancelled mid-batch."""
+        with self._db_lock:
+            self._db.executemany(
+                "UPDATE outbox SET status = ? WHERE message_id = ? AND status = ?",
+                [(PENDING, message.message_id, SENDING) for message in messages],
+            )
+            self._db.commit()
+
+    async def mark_sent(self, message: OutboundMessage) -> None:
+        await self._run(self._update, message.message_id, SENT, message.attempts + 1, None, time.time())
+
+    async def mark_failed(self, message: OutboundMessage, error: str, retry_at: Optional[float]) -> None:
+        """Schedules another attempt at `retry_at`, or dead-letters the message when it is None."""
+        status = PENDING if retry_at is not None else DEAD
+        await self._run(self._update, message.message_id, status, message.attempts + 1, error,
+                        retry_at if retry_at is not None else time.time())
+
+    def _update(self, message_id: str, status: str, attempts: int, error: Optional[str],
+                next_attempt_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?, updated_at = ? "
+                "WHERE message_id = ?",
+                (status, attempts, error, next_attempt_at, time.time(), message_id),
+            )
+            self._db.commit()
+
+    async def next_due_in(self) -> Optional[float]:
+        """Seconds until the earliest pending message is due, or None if nothing is pending."""
+        return await self._run(self._next_due_in)
+
+    def _next_due_in(self) -> Optional[float]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = ?", (PENDING,)
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    async def prune(self) -> int:
+        return await self._run(self._prune)
+
+    def _prune(self) -> int:
+        with self._db_lock:
+            cursor = self._db.execute(
+                "DELETE FROM outbox WHERE status = ? AND updated_at < ?", (SENT, time.time() - self.retention)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    # ---------- DEAD LETTERS ---------- #
+
+    def dead_letters(self) -> List[Dict[str, object]]:
+        with self._db_lock:
+            rows = self._db.execute(
+                "SELECT message_id, recipient, subject, attempts, last_error, updated_at FROM outbox "
+                "WHERE status = ? ORDER BY updated_at", (DEAD,)
+            ).fetchall()
+        keys = ("message_id", "to", "subject", "attempts", "last_error", "failed_at")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def requeue_dead(self) -> int:
+        """Gives every dead-lettered message a fresh set of attempts."""
+        with self._db_lock:
+            cursor = self._db.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+                (PENDING, time.time(), DEAD),
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        with self._db_lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return {PENDING: 0, SENDING: 0, SENT: 0, DEAD: 0, **dict(rows)}
+
+    def close(self) -> None:
+        with self._db_lock:
+            self._db.close()
+
+
+class OutboxSender:
+    """
+    Drains the outbox over SMTP, independently of the processing pipeline.
+    Failed sends back off exponentially with full jitter; permanent SMTP
+    rejections (5xx) and messages out of attempts go to the dead letters.
+    """
+
+    def __init__(self, outbox: Outbox, smtp: SMTPSender, concurrency: int = 4, max_attempts: int = 8,
+                 backoff_base: float = 5, backoff_max: float = 15 * 60):
+        self.outbox = outbox
+        self.smtp = smtp
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    async def run(self) -> None:
+        """Sends due messages until cancelled, sleeping until the next one is due or a new one arrives."""
+        await self.outbox.prune()
+        while True:
+            self.outbox.wakeup.clear()
+            if await self.send_due():
+                continue
+            due_in = await self.outbox.next_due_in()
+            try:
+                await asyncio.wait_for(self.outbox.wakeup.wait(), timeout=due_in if due_in is not None else 60)
+            except asyncio.TimeoutError:
+                pass
+
+    async def send_due(self) -> int:
+        """Sends one batch of due messages concurrently. Returns how many were attempted."""
+        batch = await self.outbox.claim_due(self.concurrency)
+        try:
+            await asyncio.gather(*(self._send(message) for message in batch))
+        except asyncio.CancelledError:
+            # Whatever wasn't marked yet goes back to pending; a duplicate beats a lost reply
+            self.outbox.release(batch)
+            raise
+        return len(batch)
+
+    async def drain(self) -> None:
+        """Sends everything that is due now, e.g. at the end of a polling cycle."""
+        while await self.send_due():
+            pass
+
+    async def _send(self, message: OutboundMessage) -> None:
+        msg = self.smtp.build_message(message.to, message.cc, message.subject, message.body, message.message_id)
+        try:
+            await self.smtp.deliver(msg)
+        except aiosmtplib.SMTPResponseException as e:
+            retry_at = None if e.code >= 500 else self._retry_at(message.attempts + 1)
+            await self._failed(message, f"{e.code} {e.message}", retry_at)
+        except (aiosmtplib.SMTPRecipientsRefused, ValueError) as e:
+            # Retrying won't change the recipients or the message
+            await self._failed(message, str(e), None)
+        except Exception as e:
+            await self._failed(message, str(e) or type(e).__name__, self._retry_at(message.attempts + 1))
+        else:
+            await self.outbox.mark_sent(message)
+
+    def _retry_at(self, attempts: int) -> Optional[float]:
+        if attempts >= self.max_attempts:
+            return None
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempts))
+        return time.time() + delay
+
+    async def _failed(self, message: OutboundMessage, error: str, retry_at: Optional[float]) -> None:
+        if retry_at is None:
+            logger.error(f"Dead-lettering reply to {message.to} after {message.attempts + 1} attempts: {error}")
+        else:
+            logger.warning(
+                f"Reply to {message.to} failed (attempt {message.attempts + 1}), "
+                f"retrying in {retry_at - time.time():.1f}s: {error}"
+            )
+        await self.outbox.mark_failed(message, error, retry_at)
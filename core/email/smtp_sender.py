@@ -1,22 +1,164 @@
-from typing import List
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
 import aiosmtplib
 from email.mime.text import MIMEText
 import logging
 from config.settings import settings
 from contextlib import asynccontextmanager
+from core.metrics import REGISTRY
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
+POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "smtp_pool_wait_seconds", "Time a sender waited for a pooled SMTP connection, connecting included"
+)
+SEND_SECONDS = REGISTRY.histogram("smtp_send_seconds", "SMTP delivery time by outcome (ok, error)", ["outcome"])
+
+# Errors after which a connection can't be trusted for another message
+CONNECTION_ERRORS = (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError, ConnectionError, OSError)
+# The message was rejected (by the server or before it was sent); the session itself is still usable
+REJECTION_ERRORS = (aiosmtplib.SMTPResponseException, aiosmtplib.SMTPRecipientsRefused, ValueError)
+
+
+@dataclass
+class PooledConnection:
+    conn: aiosmtplib.SMTP
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    messages: int = 0
+    broken: bool = False
+
+
+class SMTPConnectionPool:
+    """
+    Up to `size` SMTP connections shared by concurrent senders.
+
+    Idle connections are handed out most-recently-used first. One that sat
+    idle longer than `health_check_after` is probed with NOOP before reuse;
+    one idle past `idle_timeout` or that has sent `max_messages` is closed
+    and replaced, as is any connection that failed mid-send.
+    """
+
+    def __init__(self, connect: Callable[[], Awaitable[aiosmtplib.SMTP]], size: int = 4,
+                 max_messages: int = 100, idle_timeout: float = 60, health_check_after: float = 10):
+        self._connect = connect
+        self.size = size
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._idle: List[PooledConnection] = []
+        self._slots = asyncio.Semaphore(size)
+
+        self.opened = 0
+        self.recycled = 0
+        self.failed_health_checks = 0
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[PooledConnection]:
+        """Holds one connection for the duration of the block; mark it `broken` to have it replaced."""
+        started = time.monotonic()
+        async with self._slots:
+            pooled = await self._checkout()
+            POOL_WAIT_SECONDS.observe(time.monotonic() - started)
+            try:
+                yield pooled
+            except REJECTION_ERRORS:
+                raise
+            except BaseException:
+                pooled.broken = True
+                raise
+            finally:
+                await self._checkin(pooled)
+
+    async def _checkout(self) -> PooledConnection:
+        while self._idle:
+            pooled = self._idle.pop()
+            idle_for = time.monotonic() - pooled.last_used
+            if idle_for > self.idle_timeout or pooled.messages >= self.max_messages \
+                    or not pooled.conn.is_connected:
+                self.recycled += 1
+                await self._close(pooled)
+                continue
+            if idle_for > self.health_check_after:
+                try:
+                    await pooled.conn.noop()
+                except Exception as e:
+                    logger.info("Dropping stale SMTP connection: %s", e)
+                    self.failed_health_checks += 1
+                    await self._close(pooled)
+                    continue
+            return pooled
+
+        conn = await self._connect()
+        self.opened += 1
+        return PooledConnection(conn)
+
+    async def _checkin(self, pooled: PooledConnection) -> None:
+        pooled.last_used = time.monotonic()
+        if pooled.broken or pooled.messages >= self.max_messages:
+            self.recycled += not pooled.broken
+            await self._close(pooled)
+        else:
+            self._idle.append(pooled)
+
+    @staticmethod
+    async def _close(pooled: PooledConnection) -> None:
+        try:
+            if pooled.conn.is_connected:
+                await pooled.conn.quit()
+        except Exception:
+            pooled.conn.close()
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, []
+        for pooled in idle:
+            await self._close(pooled)
+
+    def stats(self) -> dict:
+        return {
+            "idle": len(self._idle),
+            "opened": self.opened,
+            "recycled": self.recycled,
+            "failed_health_checks": self.failed_health_checks,
+        }
+
 
 class SMTPSender:
-    def __init__(self) -> None:
-        self.host: str = settings.SMTP_HOST
+    def __init__(self, pool_size: int = 4, max_messages_per_connection: int = 100,
+                 idle_timeout: float = 60, host: Optional[str] = None, user: Optional[str] = None,
+                 password: Optional[str] = None) -> None:
+        self.host: str = host or settings.SMTP_HOST
         self.port: int = getattr(settings, "SMTP_PORT", 465)
-        self.user: str = settings.SMTP_USER
-        self.password: str = settings.SMTP_PASSWORD
-        
+        self.user: str = user or settings.SMTP_USER
+        self.password: str = password or settings.SMTP_PASSWORD
+        self.use_tls: bool = True
+        # Used whenever send_email_async isn't given an explicit connection
+        self.pool = SMTPConnectionPool(
+            self._connect,
+            size=pool_size,
+            max_messages=max_messages_per_connection,
+            idle_timeout=idle_timeout,
+        )
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        conn = aiosmtplib.SMTP(
+            hostname=self.host,
+            port=self.port,
+            username=self.user,
+            password=self.password,
+            use_tls=self.use_tls,
+        )
+        await conn.connect()
+        logger.debug("Connected to SMTP server %s:%s", self.host, self.port)
+        return conn
+
+    async def close(self) -> None:
+        await self.pool.close()
+
     @asynccontextmanager
     async def connection(self):
         """
@@ -25,50 +167,70 @@ class SMTPSender:
             async with smtp_sender.connection() as conn:
                 await smtp_sender.send_email_async(..., connection=conn)
         """
-        conn = aiosmtplib.SMTP(
-            hostname=self.host,
-            port=self.port,
-            username=self.user,
-            password=self.password,
-            use_tls=True,
-        )
+        conn = await self._connect()
         try:
-            await conn.connect()
-            logger.debug("Connected to SMTP server %s:%s", self.host, self.port)
             yield conn
         finally:
             await conn.quit()
             logger.debug("Disconnected from SMTP server %s:%s", self.host, self.port)
 
     async def send_email_async(
-        self, to: str, cc: List[str], subject: str, body: str, connection: aiosmtplib.SMTP | None = None
-    ) -> None:
+        self, to: str, cc: List[str], subject: str, body: str, connection: aiosmtplib.SMTP | None = None,
+        message_id: Optional[str] = None,
+    ) -> bool:
         """
-        Sends an email asynchronously. If a connection is provided, reuse it.
+        Sends an email asynchronously. If a connection is provided, reuse it;
+        otherwise borrow one from the pool, retrying once on a fresh
+        connection if the pooled one turns out to be dead.
+        Returns True once the server accepted the message.
         """
+        msg = self.build_message(to, cc, subject, body, message_id)
+
+        try:
+            await self.deliver(msg, connection)
+            return True
+
+        except aiosmtplib.SMTPException as e:
+            logger.error("SMTP send error to %s: %s", to, e)
+        except Exception as e:
+            logger.exception("Unexpected error while sending email to %s: %s", to, e)
+        return False
+
+    def build_message(self, to: str, cc: List[str], subject: str, body: str,
+                      message_id: Optional[str] = None) -> MIMEText:
         msg = MIMEText(body)
         msg["From"] = self.user
         msg["To"] = to
         msg["Cc"] = ", ".join(cc)
         msg["Subject"] = subject
+        if message_id:
+            msg["Message-ID"] = message_id
+        return msg
 
+    async def deliver(self, msg: MIMEText, connection: aiosmtplib.SMTP | None = None) -> None:
+        """Sends a built message, raising on failure."""
+        started = time.monotonic()
         try:
             if connection:
                 await connection.send_message(msg)
             else:
-                # One-off connection
-                await aiosmtplib.send(
-                    msg,
-                    hostname=self.host,
-                    port=self.port,
-                    username=self.user,
-                    password=self.password,
-                    use_tls=True,
-                )
-
-            logger.info("Sent email to %s with subject '%s'", to, subject)
+                await self._send_pooled(msg)
+        except BaseException:
+            SEND_SECONDS.observe(time.monotonic() - started, outcome="error")
+            raise
+        SEND_SECONDS.observe(time.monotonic() - started, outcome="ok")
+        logger.info("Sent email to %s with subject '%s'", msg["To"], msg["Subject"])
 
-        except aiosmtplib.SMTPException as e:
-            logger.error("SMTP send error to %s: %s", to, e)
-        except Exception as e:
-            logger.exception("Unexpected error while sending email to %s: %s", to, e)
+    async def _send_pooled(self, msg: MIMEText) -> None:
+        for attempt in (1, 2):
+            async with self.pool.acquire() as pooled:
+                try:
+                    await pooled.conn.send_message(msg)
+                    pooled.messages += 1
+                    return
+                except CONNECTION_ERRORS as e:
+                    # The server dropped us; the pool replaces the connection
+                    pooled.broken = True
+                    if attempt == 2:
+                        raise
+                    logger.info("SMTP connection lost (%s), reconnecting", e)
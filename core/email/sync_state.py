@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+
+class SyncState:
+    """
+    Persisted IMAP high-water mark for incremental UID sync.
+
+    `last_uid` only moves forward once every claimed UID at or below it has
+    been committed, so a crash never skips a message. UIDs committed out of
+    order are kept in `done` until the mark catches up with them, which lets
+    a restart skip work that already finished.
+
+    A released UID (its fetch failed or came back short) keeps holding the
+    mark and is fetched again by the next search. It is only dropped once
+    that search no longer finds it, i.e. it was deleted from the mailbox,
+    or given up on as failed after `MAX_RELEASES` attempts.
+    """
+
+    MAX_FAILED = 500
+    MAX_RELEASES = 5
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.uidvalidity: Optional[int] = None
+        self.last_uid: int = 0
+        self.done: Set[int] = set()
+        self.failed: List[int] = []
+
+        # Claimed by a search this session and not yet committed
+        self.pending: Set[int] = set()
+        # Handed out to the pipeline and not yet committed or released
+        self.in_flight: Set[int] = set()
+        # How often each pending UID was released without being handed out
+        self.releases: Dict[int, int] = {}
+        # Write-behind on the event loop: one write at a time, later saves coalesce into the next
+        self._writer: Optional[asyncio.Task] = None
+        self._dirty = False
+
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.uidvalidity = data.get("uidvalidity")
+            self.last_uid = data.get("last_uid", 0)
+            self.done = set(data.get("done", []))
+            self.failed = data.get("failed", [])
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load IMAP sync state from {self.path}: {e}")
+
+    def save(self) -> None:
+        """
+        Persists the state. On the event loop the file is written in a
+        thread, and saves made while a write is running are coalesced into
+        the next one, so commits never block the loop on an fsync. Call
+        `flush()` before shutting down. A crash can lose the last few
+        commits; those messages are then fetched again and resumed from
+        the journal.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(self._snapshot())
+            return
+        self._dirty = True
+        if self._writer is None or self._writer.done():
+            self._writer = loop.create_task(self._write_behind())
+
+    async def flush(self) -> None:
+        """Waits until every save so far is on disk."""
+        while self._writer is not None and not self._writer.done():
+            await self._writer
+
+    async def _write_behind(self) -> None:
+        while self._dirty:
+            self._dirty = False
+            try:
+                await asyncio.to_thread(self._write, self._snapshot())
+            except OSError as e:
+                logger.error(f"Failed to save IMAP sync state to {self.path}: {e}")
+
+    def _snapshot(self) -> dict:
+        return {
+            "uidvalidity": self.uidvalidity,
+            "last_uid": self.last_uid,
+            "done": sorted(self.done),
+            "failed": self.failed[-self.MAX_FAILED:],
+        }
+
+    def _write(self, snapshot: dict) -> None:
+        """Writes the state atomically so a crash never leaves a torn file."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    @property
+    def is_initialized(self) -> bool:
+        return self.uidvalidity is not None
+
+    def reset(self, uidvalidity: int, last_uid: int, done: Iterable[int] = ()) -> None:
+        """Starts a fresh mark, e.g. on first run or after a UIDVALIDITY change."""
+        self.uidvalidity = uidvalidity
+        self.last_uid = last_uid
+        self.done = {uid for uid in done if uid > last_uid}
+        self.pending.clear()
+        self.in_flight.clear()
+        self.releases.clear()
+        self.save()
+
+    def claim(self, uids: Iterable[int]) -> List[int]:
+        """
+        Filters a UID SEARCH result for `last_uid + 1:*` down to messages that
+        still need work and marks them in flight. Released UIDs the search no
+        longer finds are gone from the mailbox and stop holding the mark.
+        """
+        found = set(uids)
+        gone = [uid for uid in self.pending - self.in_flight if uid > self.last_uid and uid not in found]
+        for uid in gone:
+            logger.warning(f"UID {uid} is no longer in the mailbox, not retrying it")
+            self.pending.discard(uid)
+            self.releases.pop(uid, None)
+        if gone:
+            self._advance()
+            self.save()
+
+        claimed = sorted(
+            uid for uid in found
+            if uid > self.last_uid and uid not in self.done and uid not in self.in_flight
+        )
+        self.pending.update(claimed)
+        self.in_flight.update(claimed)
+        return claimed
+
+    def release(self, uid: int) -> None:
+        """
+        Hands back a claimed UID that was not delivered, e.g. after a failed
+        or short FETCH or a reply that could not be sent. It stays pending, so the mark cannot move past it,
+        and the next search claims it again.
+        """
+        if uid not in self.in_flight:
+            return
+        self.in_flight.discard(uid)
+        self.releases[uid] = self.releases.get(uid, 0) + 1
+        if self.releases[uid] >= self.MAX_RELEASES:
+            logger.error(f"UID {uid} could not be fetched after {self.releases[uid]} attempts")
+            self.commit(uid, failed=True)
+
+    def commit(self, uid: int, failed: bool = False) -> None:
+        """Records a message as fully handled and advances the mark if possible."""
+        if uid <= self.last_uid:
+            return
+        if failed:
+            self.failed.append(uid)
+            logger.error(f"Giving up on UID {uid}; recorded in {self.path}")
+
+        self.pending.discard(uid)
+        self.in_flight.discard(uid)
+        self.releases.pop(uid, None)
+        self.done.add(uid)
+        self._advance()
+        self.save()
+
+    def _advance(self) -> None:
+        """Walks the mark forward over committed UIDs until it hits one that is still pending."""
+        for candidate in sorted(self.done | self.pending):
+            if candidate not in self.done:
+                break
+            self.last_uid = candidate
+            self.done.discard(candidate)
@@ -0,0 +1,252 @@
+"""
+Local pre-classifier that answers trivial mail without an LLM call.
+
+Keyword rules catch auto-replies, delivery receipts and plain thank-you
+notes; a small naive-Bayes model trained on logged LLM outputs catches
+the rest of the "general, no action items" traffic. Anything the
+classifier is not confident about goes to the LLM as before.
+
+Train and evaluate against the LLM response log:
+
+    python -m core.fast_path train --log state/llm_responses.jsonl --model state/fast_path_model.json
+    python -m core.fast_path evaluate --log state/llm_responses.jsonl
+"""
+import argparse
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Protocol, Tuple
+
+from core.models import EmailMessage, Intent, LLMResponse
+from core.prioritizer import HIGH_RE, URGENT_RE
+
+TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+AUTOREPLY_SUBJECT_RE = re.compile(
+    r"^\s*(automatic reply|auto(matic)?[\s-]?reply|out of (the )?office|ooo\b|away from (the )?office)", re.IGNORECASE
+)
+RECEIPT_SUBJECT_RE = re.compile(
+    r"^\s*(read:|delivered:|delivery status notification|undeliver(able|ed)|mail delivery (failed|subsystem)|"
+    r"returned mail|read receipt)",
+    re.IGNORECASE,
+)
+NO_REPLY_SENDER_RE = re.compile(r"(mailer-daemon|postmaster|no-?reply|do-?not-?reply)@", re.IGNORECASE)
+# Whole body: a thank-you, an optional "for your help" and an optional sign-off that is just a
+# name (1-3 capitalized words, maybe after "-" or "Best,"). Any other second line goes to the LLM.
+THANKS_RE = re.compile(
+    r"(many |great )?(thanks?( you)?( so much| very much| a lot)?|thx|much appreciated|appreciate it|got it)"
+    r"( for (the|your) \w+( \w+){0,2})?[\s!.]*"
+    r"(\n+\s*([-\u2013\u2014]\s*|(best|cheers|regards|best regards|kind regards|thanks),?\s+)?"
+    r"(?-i:[A-Z][a-z'.-]*( [A-Z][a-z'.-]*){0,2}))?",
+    re.IGNORECASE,
+)
+
+TEMPLATES: Dict[str, str] = {
+    "thanks": "You're welcome! We are happy to help. Don't hesitate to reach out if you need anything else.",
+    "acknowledgement": "Thank you for your message. Please let us know if there is anything else we can help with.",
+    # Never reply to machines: answering an auto-reply starts a mail loop
+    "autoreply": "",
+    "receipt": "",
+}
+
+TRIVIAL = "trivial"
+NEEDS_LLM = "llm"
+
+
+def tokenize(text: str) -> List[str]:
+    words = TOKEN_RE.findall(text.lower())
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def email_text(subject: str, body: str) -> str:
+    return f"{subject}\n{body}"
+
+
+def is_trivial_response(response: dict) -> bool:
+    """The label the model learns: the LLM said general and asked for no action."""
+    return response.get("intent") == Intent.general.value and not response.get("action_items")
+
+
+class PreClassifier(Protocol):
+    def classify(self, email: EmailMessage, context: Optional[dict]) -> Optional[LLMResponse]:
+        """Returns a response when confident, None to defer to the LLM."""
+        ...
+
+
+class NaiveBayesModel:
+    """Multinomial naive Bayes over unigrams and bigrams with Laplace smoothing."""
+
+    def __init__(self):
+        self.class_counts: Counter = Counter()
+        self.token_counts: Dict[str, Counter] = {TRIVIAL: Counter(), NEEDS_LLM: Counter()}
+        self.vocabulary: set = set()
+
+    def train(self, samples: Iterable[Tuple[str, str]]) -> "NaiveBayesModel":
+        for text, label in samples:
+            tokens = tokenize(text)
+            self.class_counts[label] += 1
+            self.token_counts[label].update(tokens)
+            self.vocabulary.update(tokens)
+        return self
+
+    def probability(self, text: str, label: str = TRIVIAL) -> float:
+        """Posterior probability of `label` for the given text."""
+        total = sum(self.class_counts.values())
+        if total == 0 or not self.class_counts[label]:
+            return 0.0
+
+        tokens = tokenize(text)
+        vocab_size = len(self.vocabulary) + 1
+        log_scores = {}
+        for cls, counts in self.token_counts.items():
+            if not self.class_counts[cls]:
+                continue
+            denominator = sum(counts.values()) + vocab_size
+            score = math.log(self.class_counts[cls] / total)
+            for token in tokens:
+                score += math.log((counts[token] + 1) / denominator)
+            log_scores[cls] = score
+
+        top = max(log_scores.values())
+        norm = sum(math.exp(score - top) for score in log_scores.values())
+        return math.exp(log_scores[label] - top) / norm
+
+    def save(self, path: str | Path) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "class_counts": dict(self.class_counts),
+                    "token_counts": {cls: dict(counts) for cls, counts in self.token_counts.items()},
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: str | Path) -> "NaiveBayesModel":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        model = cls()
+        model.class_counts = Counter(data["class_counts"])
+        for label, counts in data["token_counts"].items():
+            model.token_counts[label] = Counter(counts)
+            model.vocabulary.update(counts)
+        return model
+
+
+class FastPathClassifier:
+    """Keyword rules first, then the optional model above a confidence threshold."""
+
+    def __init__(self, model: Optional[NaiveBayesModel] = None, threshold: float = 0.97):
+        self.model = model
+        self.threshold = threshold
+
+    @classmethod
+    def from_path(cls, model_path: Optional[str], threshold: float = 0.97) -> "FastPathClassifier":
+        model = NaiveBayesModel.load(model_path) if model_path and Path(model_path).exists() else None
+        return cls(model=model, threshold=threshold)
+
+    def category(self, email: EmailMessage) -> Optional[str]:
+        """Name of the template to answer with, or None when the LLM is needed."""
+        text = email_text(email.subject, email.body)
+        # Anything that might be a real problem always goes to the LLM
+        if URGENT_RE.search(text) or HIGH_RE.search(text):
+            return None
+
+        if AUTOREPLY_SUBJECT_RE.search(email.subject):
+            return "autoreply"
+        if RECEIPT_SUBJECT_RE.search(email.subject) or NO_REPLY_SENDER_RE.search(email.sender):
+            return "receipt"
+        if THANKS_RE.fullmatch(email.body.strip()):
+            return "thanks"
+        if "?" in email.body:
+            return None
+        if self.model is not None and self.model.probability(text) >= self.threshold:
+            return "acknowledgement"
+        return None
+
+    def classify(self, email: EmailMessage, context: Optional[dict]) -> Optional[LLMResponse]:
+        category = self.category(email)
+        if category is None:
+            return None
+        return LLMResponse(reply=TEMPLATES[category], intent=Intent.general, action_items=[])
+
+
+# ---------- OFFLINE TRAINING / EVALUATION ---------- #
+
+
+def load_log(path: str) -> List[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def split_log(records: List[dict], test_fraction: float = 0.2) -> Tuple[List[dict], List[dict]]:
+    """Deterministic split on a hash of the email, so reruns compare like with like."""
+    train, test = [], []
+    for record in records:
+        digest = hashlib.sha256(email_text(record["subject"], record["body"]).encode("utf-8")).digest()
+        (test if digest[0] < 256 * test_fraction else train).append(record)
+    return train, test
+
+
+def train_model(records: Iterable[dict]) -> NaiveBayesModel:
+    return NaiveBayesModel().train(
+        (email_text(r["subject"], r["body"]), TRIVIAL if is_trivial_response(r["response"]) else NEEDS_LLM)
+        for r in records
+    )
+
+
+def evaluate(classifier: FastPathClassifier, records: List[dict]) -> Dict[str, float]:
+    """
+    Replays logged emails through the classifier.
+    `avoided` is the fraction of LLM calls the fast path would skip and
+    `agreement` how often the LLM had also treated those emails as trivial.
+    """
+    avoided = agreed = trivial_total = 0
+    for record in records:
+        email = EmailMessage(subject=record["subject"], body=record["body"], sender=record.get("sender", ""))
+        llm_trivial = is_trivial_response(record["response"])
+        trivial_total += llm_trivial
+        if classifier.category(email) is not None:
+            avoided += 1
+            agreed += llm_trivial
+
+    total = len(records)
+    return {
+        "emails": total,
+        "avoided": avoided / total if total else 0.0,
+        "agreement": agreed / avoided if avoided else 1.0,
+        "trivial_recall": agreed / trivial_total if trivial_total else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Train or evaluate the fast-path classifier.")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--log", required=True, help="JSONL log of LLM responses")
+    parser.add_argument("--model", default="state/fast_path_model.json")
+    parser.add_argument("--threshold", type=float, default=0.97)
+    args = parser.parse_args()
+
+    records = load_log(args.log)
+    if args.command == "train":
+        train_model(records).save(args.model)
+        print(f"Trained on {len(records)} emails -> {args.model}")
+        return
+
+    train, test = split_log(records)
+    rules_only = evaluate(FastPathClassifier(), test)
+    with_model = evaluate(FastPathClassifier(train_model(train), threshold=args.threshold), test)
+    print(f"Held-out emails: {len(test)} (trained on {len(train)})")
+    for name, result in (("rules", rules_only), ("rules+model", with_model)):
+        print(
+            f"{name:>12}: avoided {result['avoided']:.1%} of LLM calls, "
+            f"agreement {result['agreement']:.1%}, trivial recall {result['trivial_recall']:.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+SCALAR_RE = re.compile(r"[^,}\]\s]*")
+
+
+class JSONFieldStream:
+    """
+    Incrementally parses a JSON object arriving in chunks (a streamed
+    completion) and returns each top-level field as soon as its value is
+    complete, so `{"intent": "maintenance", ...` is usable long before the
+    closing brace. Text before the opening brace (a code fence) is skipped;
+    malformed input just stops producing fields. The fields are only hints:
+    the complete text is still validated with `LLMResponse.model_validate_json`,
+    which reports the error and gets one repair call if it fails.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._key: Optional[str] = None
+        self._state = "start"
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._text += chunk
+        fields = []
+        while self._state not in ("done", "failed"):
+            if not self._step(fields):
+                break
+        return fields
+
+    def _step(self, fields: List[Tuple[str, Any]]) -> bool:
+        """Advances by one token; returns False when more input is needed."""
+        text = self._text
+        if self._state == "start":
+            start = text.find("{", self._pos)
+            if start < 0:
+                self._pos = len(text)
+                return False
+            self._pos, self._state = start + 1, "key"
+            return True
+
+        pos = self._skip_whitespace(self._pos, ",") if self._state == "key" else self._skip_whitespace(self._pos)
+        if pos >= len(text):
+            self._pos = pos
+            return False
+        char = text[pos]
+
+        if self._state == "key":
+            if char == "}":
+                self._state = "done"
+                return True
+            if char != '"':
+                self._state = "failed"
+                return True
+            end = self._scan_string(pos)
+            if end is None:
+                self._pos = pos
+                return False
+            self._key, self._pos, self._state = json.loads(text[pos:end]), end, "colon"
+            return True
+
+        if self._state == "colon":
+            if char != ":":
+                self._state = "failed"
+                return True
+            self._pos, self._state = pos + 1, "value"
+            return True
+
+        # value
+        end = self._scan_value(pos)
+        if end is None:
+            self._pos = pos
+            return False
+        try:
+            fields.append((self._key, json.loads(text[pos:end])))
+        except json.JSONDecodeError:
+            self._state = "failed"
+            return True
+        self._pos, self._state = end, "key"
+        return True
+
+    def _skip_whitespace(self, pos: int, extra: str = "") -> int:
+        text = self._text
+        while pos < len(text) and (text[pos].isspace() or text[pos] in extra):
+            pos += 1
+        return pos
+
+    def _scan_string(self, pos: int) -> Optional[int]:
+        """`pos` is an opening quote; returns the index after the closing one."""
+        text = self._text
+        index = pos + 1
+        while index < len(text):
+            char = text[index]
+            if char == "\\":
+                index += 2
+                continue
+            if char == '"':
+                return index + 1
+            index += 1
+        return None
+
+    def _scan_value(self, pos: int) -> Optional[int]:
+        text = self._text
+        char = text[pos]
+        if char == '"':
+            return self._scan_string(pos)
+        if char in "{[":
+            depth, index = 0, pos
+            while index < len(text):
+                char = text[index]
+                if char == '"':
+                    end = self._scan_string(index)
+                    if end is None:
+                        return None
+                    index = end
+                    continue
+                if char in "{[":
+                    depth += 1
+                elif char in "}]":
+                    depth -= 1
+                    if depth == 0:
+                        return index + 1
+                index += 1
+            return None
+        # Numbers, true/false/null: complete only once something follows them
+        end = SCALAR_RE.match(text, pos).end()
+        return end if end < len(text) else None
@@ -0,0 +1,275 @@
+"""
+Backlog answering through the OpenAI Batch API.
+
+`LLMBatcher.generate` queues a request and waits for its answer. Queued
+requests are written to one JSONL file and submitted as a single batch job
+once `max_batch_size` have gathered or `max_wait` seconds have passed. The
+job is polled every `poll_interval` seconds until it finishes. Requests
+the batch could not answer (failed, expired, invalid output) fall back to
+the realtime client, so every caller always gets a response.
+
+Callers may name their requests with a stable `custom_id`; `on_submit`
+hears which ids went into which batch, so it can persist them. After a
+restart `resume` picks such a batch up again and polls it, instead of
+paying for the same answers in a new one.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pydantic import ValidationError
+
+from core.llm_cache import make_cache_key
+from core.llm_client import RESPONSE_FORMAT, LLMClient
+from core.metrics import REGISTRY
+from core.models import EmailMessage, LLMResponse
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+BATCH_SECONDS = REGISTRY.histogram(
+    "llm_batch_seconds", "Time from submitting a batch job until its results were read",
+    buckets=(1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 12 * 3600, 24 * 3600),
+)
+BATCH_REQUESTS_TOTAL = REGISTRY.counter(
+    "llm_batch_requests_total", "Batched requests by result (answered, realtime_fallback)", ["result"]
+)
+
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+ENDPOINT = "/v1/chat/completions"
+
+# (batch id, custom_ids in the batch)
+SubmitCallback = Callable[[str, List[str]], Awaitable[None]]
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    email: EmailMessage
+    context: Optional[dict]
+    body: Dict[str, Any]
+    future: asyncio.Future
+    cache_key: Optional[str] = None
+
+
+@dataclass
+class BatchStats:
+    submitted: int = 0
+    requests: int = 0
+    answered: int = 0
+    fallbacks: int = 0
+    running: int = 0
+    queued: int = 0
+    resumed: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return dict(self.__dict__)
+
+
+class LLMBatcher:
+    def __init__(self, llm: LLMClient, max_batch_size: int = 500, max_wait: float = 30,
+                 poll_interval: float = 30, completion_window: str = "24h",
+                 on_submit: Optional[SubmitCallback] = None):
+        self.llm = llm
+        self.client = llm.client
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self.on_submit = on_submit
+        # Batches submitted before a restart, polled once however many of their emails come back
+        self._resumed: Dict[str, asyncio.Task] = {}
+        self._queued: List[BatchRequest] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._jobs: Set[asyncio.Task] = set()
+        self._ids = itertools.count(1)
+        self._stats = BatchStats()
+
+    @property
+    def pending(self) -> int:
+        """Requests queued or inside a submitted batch, still waiting for an answer."""
+        return len(self._queued) + self._stats.running
+
+    async def generate(self, email: EmailMessage, context: Optional[dict],
+                       custom_id: Optional[str] = None) -> LLMResponse:
+        """Answers one email through the next batch job; cached answers return immediately."""
+        cache_key = self._cache_key(email, context)
+        if cache_key is not None:
+            cached = await self.llm.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        body = {"model": self.llm.MODEL, "messages": self.llm.prompts.build(email, context), "temperature": 0.2}
+        if self.llm.structured:
+            body["response_format"] = RESPONSE_FORMAT
+        if custom_id is None or any(queued.custom_id == custom_id for queued in self._queued):
+            # A batch rejects duplicate ids
+            custom_id = f"email-{next(self._ids)}"
+        request = BatchRequest(
+            custom_id=custom_id, email=email, context=context, body=body,
+            future=asyncio.get_running_loop().create_future(), cache_key=cache_key,
+        )
+        self._queued.append(request)
+        if len(self._queued) >= self.max_batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self.flush)
+        return await request.future
+
+    async def resume(self, batch_id: str, email: EmailMessage, context: Optional[dict],
+                     custom_id: str) -> LLMResponse:
+        """
+        Answers an email from a batch submitted before a restart. The first
+        email of a batch starts polling it, the others wait on the same poll.
+        An answer the batch lacks falls back to the realtime client.
+        """
+        poll = self._resumed.get(batch_id)
+        if poll is None:
+            logger.info(f"Resuming batch {batch_id} submitted before a restart")
+            poll = self._resumed[batch_id] = asyncio.create_task(self._poll(batch_id))
+            self._jobs.add(poll)
+            poll.add_done_callback(self._jobs.discard)
+        self._stats.resumed += 1
+
+        results: Dict[str, str] = {}
+        try:
+            # Shielded: one waiter being cancelled must not stop the poll for the rest
+            results = await asyncio.shield(poll)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Resumed batch {batch_id} failed, answering in realtime: {e}")
+
+        request = BatchRequest(
+            custom_id=custom_id, email=email, context=context, body={},
+            future=asyncio.get_running_loop().create_future(), cache_key=self._cache_key(email, context),
+        )
+        await self._resolve(request, results.get(custom_id))
+        return await request.future
+
+    def flush(self) -> None:
+        """Submits whatever is queued as one batch job, without waiting for it."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        requests, self._queued = self._queued, []
+        if not requests:
+            return
+        self._stats.running += len(requests)
+        job = asyncio.create_task(self._run(requests))
+        self._jobs.add(job)
+        job.add_done_callback(self._jobs.discard)
+
+    async def close(self) -> None:
+        """Submits the queue and waits for every running batch to be answered."""
+        self.flush()
+        if self._jobs:
+            await asyncio.gather(*self._jobs, return_exceptions=True)
+
+    async def _run(self, requests: List[BatchRequest]) -> None:
+        results: Dict[str, str] = {}
+        try:
+            results = await self._submit_and_wait(requests)
+        except asyncio.CancelledError:
+            for request in requests:
+                request.future.cancel()
+            self._stats.running -= len(requests)
+            raise
+        except Exception as e:
+            logger.error(f"Batch of {len(requests)} requests failed, answering them in realtime: {e}")
+
+        await asyncio.gather(*(self._resolve(request, results.get(request.custom_id)) for request in requests))
+        self._stats.running -= len(requests)
+
+    def _cache_key(self, email: EmailMessage, context: Optional[dict]) -> Optional[str]:
+        if self.llm.cache is None:
+            return None
+        return make_cache_key(email, context, self.llm.MODEL, self.llm.PROMPT_VERSION)
+
+    async def _submit_and_wait(self, requests: List[BatchRequest]) -> Dict[str, str]:
+        """Runs one batch job; returns the completion text per custom_id for the requests it answered."""
+        lines = "\n".join(
+            json.dumps({"custom_id": r.custom_id, "method": "POST", "url": ENDPOINT, "body": r.body}, ensure_ascii=False)
+            for r in requests
+        )
+        uploaded = await self.client.files.create(
+            file=("batch.jsonl", (lines + "\n").encode("utf-8"), "application/jsonl"), purpose="batch",
+        )
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id, endpoint=ENDPOINT, completion_window=self.completion_window,
+        )
+        self._stats.submitted += 1
+        self._stats.requests += len(requests)
+        logger.info(f"Submitted batch {batch.id} with {len(requests)} requests")
+        if self.on_submit is not None:
+            try:
+                await self.on_submit(batch.id, [r.custom_id for r in requests])
+            except Exception as e:
+                # Only costs answering these emails again if we restart before the batch finishes
+                logger.warning(f"Failed to record batch {batch.id}: {e}")
+        return await self._wait(batch)
+
+    async def _poll(self, batch_id: str) -> Dict[str, str]:
+        return await self._wait(await self.client.batches.retrieve(batch_id))
+
+    async def _wait(self, batch) -> Dict[str, str]:
+        """Polls a batch job until it finishes; returns the completion text per custom_id it answered."""
+        started = time.monotonic()
+        while batch.status not in TERMINAL_STATUSES:
+            await asyncio.sleep(self.poll_interval)
+            batch = await self.client.batches.retrieve(batch.id)
+        BATCH_SECONDS.observe(time.monotonic() - started)
+        logger.info(f"Batch {batch.id} finished with status {batch.status} after {time.monotonic() - started:.0f}s")
+
+        # Expired and cancelled batches still return whatever they finished
+        if not batch.output_file_id:
+            return {}
+        output = await self.client.files.content(batch.output_file_id)
+        results = {}
+        for line in output.text.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                continue
+            try:
+                results[item["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                continue
+        return results
+
+    async def _resolve(self, request: BatchRequest, raw: Optional[str]) -> None:
+        if request.future.done():
+            return
+        response = None
+        if raw is not None:
+            try:
+                response = LLMResponse.model_validate_json(raw)
+            except ValidationError as e:
+                logger.warning(f"Invalid batch output for {request.email.sender}, answering in realtime: {e}")
+
+        if response is not None:
+            self._stats.answered += 1
+            BATCH_REQUESTS_TOTAL.inc(result="answered")
+            if request.cache_key is not None:
+                await self.llm.cache.set(request.cache_key, response)
+            await self.llm._log_response(request.email, response)
+            request.future.set_result(response)
+            return
+
+        self._stats.fallbacks += 1
+        BATCH_REQUESTS_TOTAL.inc(result="realtime_fallback")
+        try:
+            request.future.set_result(await self.llm.generate_response_async(request.email, request.context))
+        except Exception as e:
+            request.future.set_exception(e)
+
+    def stats(self) -> Dict[str, int]:
+        self._stats.queued = len(self._queued)
+        return self._stats.as_dict()
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from core.models import LLMResponse
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+REPLY_PREFIX_RE = re.compile(r"^\s*((re|fwd?|aw|tr)\s*:\s*)+", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
+EMAIL_RE = re.compile(r"<(.+?)>")
+
+
+def _normalize(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def make_cache_key(email, context, model: str, prompt_version: str) -> str:
+    """
+    Content address for an LLM call: normalized subject/body/sender, the
+    serialized context, and the model and prompt version that produced it.
+    """
+    match = EMAIL_RE.search(email.sender)
+    sender = (match.group(1) if match else email.sender).strip().lower()
+    payload = json.dumps(
+        {
+            "subject": _normalize(REPLY_PREFIX_RE.sub("", email.subject)),
+            "body": _normalize(email.body),
+            "sender": sender,
+            "context": context,
+            "model": model,
+            "prompt_version": prompt_version,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache for LLM responses.
+    An in-memory LRU with TTL sits in front of an optional sqlite file that
+    survives restarts. Disk access runs in the default executor; counters
+    are only updated on the event loop.
+
+    The cache only saves the LLM call. A duplicate email still goes through
+    dispatch and send like any other, so it gets its own ticket and reply:
+    a tenant re-sending the same complaint tomorrow should be answered.
+    """
+
+    def __init__(self, ttl_seconds: float = 24 * 60 * 60, max_entries: int = 1024, db_path: Optional[str] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._memory: "OrderedDict[str, Tuple[float, LLMResponse]]" = OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, expires_at REAL, response TEXT)"
+            )
+            self._db.commit()
+
+    async def get(self, key: str) -> Optional[LLMResponse]:
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return response
+            del self._memory[key]
+            self.evictions += 1
+
+        if self._db is not None:
+            loop = asyncio.get_running_loop()
+            row, expired = await loop.run_in_executor(None, self._db_get, key, now)
+            if expired:
+                self.evictions += 1
+            if row is not None:
+                expires_at, raw = row
+                response = LLMResponse.model_validate_json(raw)
+                self._remember(key, response, expires_at)
+                self.hits += 1
+                self.disk_hits += 1
+                return response
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: LLMResponse) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, response, expires_at)
+
+        if self._db is not None:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._db_set, key, expires_at, response.model_dump_json())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._memory),
+        }
+
+    def _remember(self, key: str, response: LLMResponse, expires_at: float) -> None:
+        self._memory[key] = (expires_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _db_get(self, key: str, now: float) -> Tuple[Optional[Tuple[float, str]], bool]:
+        """Returns the live row, if any, and whether an expired one was deleted."""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT expires_at, response FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[0] <= now:
+                self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._db.commit()
+                return None, True
+            return row, False
+
+    def _db_set(self, key: str, expires_at: float, raw: str) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, expires_at, response) VALUES (?, ?, ?)",
+                (key, expires_at, raw),
+            )
+            self._db.commit()
@@ -1,7 +1,19 @@
+import asyncio
 import json
 import logging
-from openai import AsyncOpenAI
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import httpx
+from pydantic import ValidationError
+from openai import APIConnectionError, AsyncOpenAI, DefaultAsyncHttpxClient, InternalServerError, RateLimitError
 from config.settings import settings
+from core.json_stream import JSONFieldStream
+from core.llm_cache import LLMResponseCache, make_cache_key
+from core.metrics import REGISTRY
+from core.prompt_builder import PromptBuilder
+from core.rate_limiter import RateLimiter, estimate_tokens
 from core.models import LLMResponse
 from core.models import Intent
 
@@ -9,142 +21,377 @@ from core.models import Intent
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
+REQUEST_SECONDS = REGISTRY.histogram(
+    "llm_request_seconds",
+    "Chat completion latency by outcome (ok, rate_limited, transient, timeout, invalid_output, error)",
+    ["outcome"],
+)
+TOKENS_TOTAL = REGISTRY.counter("llm_tokens_total", "Tokens reported by the API (prompt, cached, completion)", ["kind"])
+ERRORS_TOTAL = REGISTRY.counter("llm_errors_total", "Failed chat completion attempts by kind", ["kind"])
+FALLBACK_TOTAL = REGISTRY.counter("llm_fallback_total", "Emails answered with the fallback reply")
+REPAIRS_TOTAL = REGISTRY.counter("llm_repairs_total", "Repair calls for invalid outputs by result", ["result"])
+CACHE_LOOKUPS_TOTAL = REGISTRY.counter(
+    "llm_cache_lookups_total", "Response cache lookups by result (hit, shared, miss)", ["result"]
+)
+TIME_TO_INTENT_SECONDS = REGISTRY.histogram(
+    "llm_time_to_intent_seconds", "Time from sending a streamed request until its intent and action items arrived"
+)
 
-class LLMClient:
-    SYSTEM_PROMPT = """
-You are an assistant for a property management company.
-Read tenant emails and provide a professional, helpful response.
-
-Rules:
-1. Understand the tenant's request fully.
-2. Use the provided context to enhance your reply.
-3. Generate a clear, concise, human-sounding response.
-4. Determine the intent of the email (locked_out, maintenance, rent, general).
-5. List any action items needed.
-6. NEVER reveal that you are an AI.
-7. Output **strict JSON only**, no extra text, no greetings, no commentary.
-
-Output JSON schema:
-{
-  "reply": "<string>",
-  "intent": "<locked_out | maintenance | rent | general>",
-  "action_items": [
-      { "type": "<string>", "details": "<string>" }
-  ]
-}
+# Called with the intent and action items of a streamed response, before its reply is complete
+IntentCallback = Callable[[Intent, List[dict]], None]
+# Failures worth another attempt; mid-stream transport errors surface from httpx directly
+TRANSIENT_ERRORS = (APIConnectionError, InternalServerError, httpx.TransportError)
 
-Intent rules:
-- "locked_out": tenant is locked out of property. Action required.
-- "maintenance": tenant mentions repairs or issues. Action required.
-- "rent": tenant asks about rent or payment. Action may be required.
-- "general": anything else. Action may be optional.
-
-Rules for action_items:
-- Provide a list of actionable tasks if needed
-- Leave empty list [] if no action required
-- Always provide concrete action items if the email implies a task.
-- Use structured tasks: "type" = short identifier, "details" = clear description.
-
-Examples:
-
-Example 1:
-Email: "I locked myself out of my apartment."
-Output:
-{
-  "reply": "I understand that you are locked out. We are arranging access immediately.",
-  "intent": "locked_out",
-  "action_items": [
-    { "type": "call_locksmith", "details": "Call locksmith to provide access to tenant" }
-  ]
-}
+REPAIR_PROMPT = (
+    "Your previous output was not valid ({errors}). "
+    "Return only the corrected JSON object, with the same content, matching the required schema."
+)
 
-Example 2:
-Email: "The heating is broken in my apartment."
-Output:
-{
-  "reply": "Thank you for reporting the heating issue. We will send a technician as soon as possible.",
-  "intent": "maintenance",
-  "action_items": [
-    { "type": "assign_technician", "details": "Send technician to repair heating" }
-  ]
-}
 
-Example 3:
-Email: "I need information about my rent payment."
-Output:
-{
-  "reply": "You can pay your rent via your online account or contact us for assistance.",
-  "intent": "rent",
-  "action_items": []
-}
+def strict_json_schema(schema: Any) -> Any:
+    """
+    Adapts a Pydantic JSON schema to the API's strict structured outputs:
+    every object closed and every property required, no defaults or titles.
+    """
+    if isinstance(schema, list):
+        return [strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    result = {}
+    for key, value in schema.items():
+        if key in ("default", "title"):
+            continue
+        if key in ("properties", "$defs"):
+            # Names here are data, not keywords, even when one is called "title"
+            result[key] = {name: strict_json_schema(sub) for name, sub in value.items()}
+        else:
+            result[key] = strict_json_schema(value)
+    if result.get("type") == "object" and "properties" in result:
+        result["additionalProperties"] = False
+        result["required"] = list(result["properties"])
+    return result
 
-Example 4:
-Email: "I just wanted to say thank you."
-Output:
-{
-  "reply": "You're welcome! We are happy to help.",
-  "intent": "general",
-  "action_items": []
+
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "email_response", "strict": True, "schema": strict_json_schema(LLMResponse.model_json_schema())},
 }
-""".strip()
 
-    USER_PROMPT_TEMPLATE = """
-EMAIL RECEIVED:
-Subject: {subject}
-From: {sender}
-Body: {body}
 
-CONTEXT:
-{context_json}
-""".strip()
+class LLMResponseError(Exception):
+    """No usable response: the call failed, or its output stayed invalid after the repair call."""
+
 
-    def __init__(self):
-        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
+class LLMClient:
+    MODEL = "gpt-4o-mini"
+    # Completion budget reserved up front; the real usage is reconciled afterwards
+    EXPECTED_COMPLETION_TOKENS = 300
+    MAX_ATTEMPTS = 4
 
-    async def generate_response_async(self, email, context) -> LLMResponse:
+    # Changes whenever the prompts change, so cached responses never outlive them
+    PROMPT_VERSION = PromptBuilder.VERSION
+
+    def __init__(self, cache: Optional[LLMResponseCache] = None, response_log_path: Optional[str] = None,
+                 limiter: Optional[RateLimiter] = None, prompt_builder: Optional[PromptBuilder] = None,
+                 stream: bool = False, max_connections: int = 20, keepalive_expiry: float = 30,
+                 connect_timeout: float = 5, read_timeout: float = 30, request_timeout: float = 60,
+                 http2: bool = False, structured: bool = False):
+        # Retries are ours: the SDK's own retries would bypass the rate limiter
+        self.client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None,
+            max_retries=0,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            http_client=self._http_client(max_connections, keepalive_expiry, http2),
+        )
+        # Hard deadline per attempt, streaming included, so a stalled call can't hold a limiter slot
+        self.request_timeout = request_timeout
+        # Stream completions and report the intent before the reply text is done
+        self.stream = stream
+        # Constrain output to the LLMResponse schema, and raise instead of answering with the fallback
+        self.structured = structured
+        self.limiter = limiter or RateLimiter()
+        self.prompts = prompt_builder or PromptBuilder()
+        self.cache = cache
+        # JSONL log of real LLM outputs, used to train and evaluate the fast path
+        self.response_log_path = Path(response_log_path) if response_log_path else None
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _http_client(max_connections: int, keepalive_expiry: float, http2: bool) -> httpx.AsyncClient:
+        """Connection pool sized to the LLM concurrency; idle connections stay warm for `keepalive_expiry`."""
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+                http2 = False
+        return DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=http2,
+        )
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    async def generate_response_async(self, email, context, on_intent: Optional[IntentCallback] = None) -> LLMResponse:
         """
         Generate LLM response asynchronously using precompiled prompts.
+        With a cache, repeated emails are answered without an API call and
+        concurrent duplicates share a single in-flight request.
+        In streaming mode `on_intent` gets the intent and action items as soon
+        as they arrive; cache hits and shared requests return the full
+        response instead.
+        In structured mode a failed call raises LLMResponseError rather than
+        returning the apology fallback, so it is never sent to a tenant.
         """
-        context_json = json.dumps(context, separators=(",", ":"), ensure_ascii=False)
-        user_prompt = self.USER_PROMPT_TEMPLATE.format(
-            subject=email.subject,
-            sender=email.sender,
-            body=email.body,
-            context_json=context_json
-        )
+        if self.cache is None:
+            response = await self._complete(email, context, on_intent)
+            if response is not None:
+                await self._log_response(email, response)
+            return response or self._fallback_response(email)
 
+        key = make_cache_key(email, context, self.MODEL, self.PROMPT_VERSION)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            logger.info("LLM cache hit for %s", email.sender)
+            CACHE_LOOKUPS_TOTAL.inc(result="hit")
+            return cached
+
+        shared = self._in_flight.get(key)
+        if shared is not None:
+            CACHE_LOOKUPS_TOTAL.inc(result="shared")
+            try:
+                return await asyncio.shield(shared)
+            except asyncio.CancelledError:
+                if not shared.cancelled():
+                    raise
+                # The call we were waiting on was cancelled; make our own
+
+        CACHE_LOOKUPS_TOTAL.inc(result="miss")
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
         try:
-            completion = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
-                    {"role": "user", "content": user_prompt},
-                ],
+            response = await self._complete(email, context, on_intent)
+            if response is not None:
+                await self.cache.set(key, response)
+                await self._log_response(email, response)
+            result = response or self._fallback_response(email)
+            future.set_result(result)
+            return result
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def _complete(self, email, context, on_intent: Optional[IntentCallback] = None) -> Optional[LLMResponse]:
+        """
+        Runs the chat completion. Output that fails validation gets one repair
+        call, which shows the model its output and the errors. Returns None
+        when no usable response came back.
+        """
+        messages = self.prompts.build(email, context)
+        estimated_tokens = self._estimate_tokens(messages)
+        repaired = False
+
+        if on_intent is not None:
+            on_intent = self._once(on_intent)
+
+        raw = None
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            started = None
+            try:
+                async with self.limiter.slot(estimated_tokens):
+                    started = time.monotonic()
+                    raw, usage, headers = await asyncio.wait_for(
+                        self._request(messages, on_intent), self.request_timeout
+                    )
+                    latency = time.monotonic() - started
+                    started = None
+                    REQUEST_SECONDS.observe(latency, outcome="ok")
+
+                self._log_usage(email, usage, latency)
+                self.limiter.on_success(latency, estimated_tokens, usage.total_tokens if usage else None, headers)
+
+                response = LLMResponse.model_validate_json(raw or "")
+                if repaired:
+                    REPAIRS_TOTAL.inc(result="fixed")
+                return response
+
+            except RateLimitError as e:
+                self._record_failure(started, "rate_limited")
+                retry_after = self._retry_after(e.response.headers)
+                self.limiter.on_throttle(retry_after, e.response.headers, estimated_tokens)
+                delay = retry_after or 2 ** attempt
+                logger.warning("LLM rate limited (attempt %d/%d), retrying in %.1fs", attempt, self.MAX_ATTEMPTS, delay)
+                await asyncio.sleep(delay)
+            except asyncio.TimeoutError:
+                self._record_failure(started, "timeout")
+                logger.warning("LLM call exceeded %.1fs (attempt %d/%d)", self.request_timeout, attempt, self.MAX_ATTEMPTS)
+                await asyncio.sleep(2 ** attempt)
+            except TRANSIENT_ERRORS as e:
+                self._record_failure(started, "transient")
+                delay = 2 ** attempt
+                logger.warning("LLM transient error (attempt %d/%d): %s", attempt, self.MAX_ATTEMPTS, e)
+                await asyncio.sleep(delay)
+            except ValidationError as e:
+                self._record_failure(started, "invalid_output")
+                errors = "; ".join(
+                    f"{'.'.join(str(part) for part in error['loc']) or 'output'}: {error['msg']}"
+                    for error in e.errors()[:5]
+                )
+                if repaired:
+                    REPAIRS_TOTAL.inc(result="failed")
+                    logger.warning("LLM output still invalid after repair (%s). Raw output:\n%s", errors, raw)
+                    return None
+                logger.warning("LLM returned invalid output (%s), asking for a repair", errors)
+                repaired = True
+                messages = messages + [
+                    {"role": "assistant", "content": raw or ""},
+                    {"role": "user", "content": REPAIR_PROMPT.format(errors=errors)},
+                ]
+                estimated_tokens = self._estimate_tokens(messages)
+            except Exception as e:
+                self._record_failure(started, "error")
+                logger.error("LLM error: %s", e)
+                return None
+
+        logger.error("LLM call failed after %d attempts", self.MAX_ATTEMPTS)
+        return None
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return sum(estimate_tokens(message["content"]) for message in messages) + self.EXPECTED_COMPLETION_TOKENS
+
+    async def _request(self, messages: List[Dict[str, str]],
+                       on_intent: Optional[IntentCallback]) -> Tuple[Optional[str], Any, Mapping[str, str]]:
+        """One API call; returns the completion text, token usage and response headers."""
+        options = {"response_format": RESPONSE_FORMAT} if self.structured else {}
+        if not self.stream:
+            raw_response = await self.client.chat.completions.with_raw_response.create(
+                model=self.MODEL,
+                messages=messages,
                 temperature=0.2,
+                **options,
             )
+            completion = raw_response.parse()
+            return completion.choices[0].message.content, completion.usage, raw_response.headers
 
-            raw = completion.choices[0].message.content
-            data = json.loads(raw)
+        started = time.monotonic()
+        raw_response = await self.client.chat.completions.with_raw_response.create(
+            model=self.MODEL,
+            messages=messages,
+            temperature=0.2,
+            stream=True,
+            stream_options={"include_usage": True},
+            **options,
+        )
+        fields = JSONFieldStream()
+        parsed: Dict[str, Any] = {}
+        parts: List[str] = []
+        usage = None
+        async for chunk in raw_response.parse():
+            if chunk.usage is not None:
+                usage = chunk.usage
+            for choice in chunk.choices:
+                text = choice.delta.content
+                if not text:
+                    continue
+                parts.append(text)
+                if on_intent is None:
+                    continue
+                parsed.update(fields.feed(text))
+                if "intent" in parsed and "action_items" in parsed:
+                    TIME_TO_INTENT_SECONDS.observe(time.monotonic() - started)
+                    self._report_intent(on_intent, parsed["intent"], parsed["action_items"])
+                    on_intent = None
+        return "".join(parts), usage, raw_response.headers
 
-            # Convert intent string to Intent enum
-            intent_value = data.get("intent", "general")
-            if intent_value not in Intent.__members__:
-                intent_enum = Intent.general
-            else:
-                intent_enum = Intent(intent_value)
+    @staticmethod
+    def _once(on_intent: IntentCallback) -> IntentCallback:
+        """A stream that fails after reporting its intent is retried; the retry must not report it again."""
+        reported = False
 
-            return LLMResponse(
-                reply=data.get("reply", ""),
-                intent=intent_enum,
-                action_items=data.get("action_items", [])
-            )
+        def report(intent: Intent, action_items: List[dict]) -> None:
+            nonlocal reported
+            if not reported:
+                reported = True
+                on_intent(intent, action_items)
+        return report
 
-        except json.JSONDecodeError:
-            logger.warning("LLM returned invalid JSON. Raw output:\n%s", raw)
+    @staticmethod
+    def _report_intent(on_intent: IntentCallback, intent_value: Any, action_items: Any) -> None:
+        if intent_value not in Intent.__members__:
+            return
+        try:
+            on_intent(Intent(intent_value), action_items if isinstance(action_items, list) else [])
         except Exception as e:
-            logger.error("LLM error: %s", e)
+            logger.warning("Early intent callback failed: %s", e)
+
+    @staticmethod
+    def _record_failure(started: Optional[float], kind: str) -> None:
+        """`started` is still set when the request itself failed, so its latency is recorded too."""
+        ERRORS_TOTAL.inc(kind=kind)
+        if started is not None:
+            REQUEST_SECONDS.observe(time.monotonic() - started, outcome=kind)
+
+    @staticmethod
+    def _log_usage(email, usage, latency: float) -> None:
+        """Per-call token counts; cached tokens show how much of the prompt prefix was reused."""
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        TOKENS_TOTAL.inc(usage.prompt_tokens, kind="prompt")
+        TOKENS_TOTAL.inc(cached, kind="cached")
+        TOKENS_TOTAL.inc(usage.completion_tokens, kind="completion")
+        logger.info(
+            "LLM usage for %s: prompt=%d (cached=%d) completion=%d latency=%.2fs",
+            email.sender, usage.prompt_tokens, cached, usage.completion_tokens, latency,
+        )
+
+    async def _log_response(self, email, response: LLMResponse) -> None:
+        if self.response_log_path is None:
+            return
+        line = json.dumps(
+            {
+                "subject": email.subject,
+                "body": email.body,
+                "sender": email.sender,
+                "response": response.model_dump(mode="json"),
+            },
+            ensure_ascii=False,
+        )
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._append_log_line, line)
+        except OSError as e:
+            logger.warning("Failed to write LLM response log: %s", e)
+
+    def _append_log_line(self, line: str) -> None:
+        self.response_log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.response_log_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    @staticmethod
+    def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+        try:
+            if "retry-after-ms" in headers:
+                return float(headers["retry-after-ms"]) / 1000
+            if "retry-after" in headers:
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return None
 
-        # Fallback response
+    def _fallback_response(self, email) -> LLMResponse:
+        if self.structured:
+            raise LLMResponseError(f"No valid LLM response for email from {email.sender}")
+        FALLBACK_TOTAL.inc()
         return LLMResponse(
             reply="Sorry, something went wrong while generating a response.",
             intent=Intent.general,
@@ -1,3 +1,5 @@
 from .email_message import EmailMessage
+from .action_item import ActionItem
 from .llm_response import LLMResponse
 from .intent import Intent
+from .priority import Priority
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+
+
+class ActionItem(BaseModel):
+    type: str
+    details: str = ""
@@ -1,6 +1,12 @@
+from typing import List, Optional
+
 from pydantic import BaseModel
 
 class EmailMessage(BaseModel):
     subject: str
     body: str
-    sender: str
\ No newline at end of file
+    sender: str
+    # Threading headers; angle-bracketed ids as they appear in the message
+    message_id: Optional[str] = None
+    in_reply_to: Optional[str] = None
+    references: List[str] = []
@@ -1,9 +1,18 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, field_validator
+from typing import List
+from core.models.action_item import ActionItem
 from core.models.intent import Intent
 
 
 class LLMResponse(BaseModel):
-    reply: str
+    # Field order is the order the model is asked to write them in, so a
+    # streamed response yields the intent and action items before the reply
     intent: Intent
-    action_items: Optional[List[dict]] = None
+    action_items: List[ActionItem] = []
+    reply: str
+
+    @field_validator("action_items", mode="before")
+    @classmethod
+    def _none_as_empty(cls, value):
+        # Responses cached before action items were typed stored null
+        return [] if value is None else value
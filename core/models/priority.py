@@ -0,0 +1,9 @@
+from enum import IntEnum
+
+
+class Priority(IntEnum):
+    """Scheduling priority; lower values are served first."""
+    urgent = 0
+    high = 1
+    normal = 2
+    low = 3
@@ -0,0 +1,53 @@
+import re
+from typing import Optional
+
+from core.models import EmailMessage, Intent, Priority
+
+# Cheap keyword pre-classification, applied before the LLM has seen the email.
+# Urgent needs a phrase, not a bare word: "gas bill" or "fire drill" is ordinary mail.
+URGENT_RE = re.compile(
+    r"\b(lock(ed)?[\s-]?out|lost (my |the )?keys?|leak(ing)?|flood(ed|ing)?|gas leak|smell(s|ing)? (of )?gas|"
+    r"fire (in|alarm going)|smoke (coming|in))\b",
+    re.IGNORECASE,
+)
+HIGH_RE = re.compile(r"\b(broken|not working|no (heat|heating|hot water|power)|repair)\b", re.IGNORECASE)
+LOW_RE = re.compile(r"\b(thanks?( you)?|out of (the )?office|auto-?reply|delivery status)\b", re.IGNORECASE)
+
+INTENT_PRIORITY = {
+    Intent.locked_out: Priority.urgent,
+    Intent.maintenance: Priority.high,
+    Intent.rent: Priority.normal,
+    Intent.general: Priority.low,
+}
+
+
+def estimate_priority(email_message: EmailMessage, context: Optional[dict]) -> Priority:
+    """
+    Initial priority from subject/body keywords and tenant context.
+    Mail from unknown senders is bumped down one level unless it looks urgent.
+    """
+    text = f"{email_message.subject}\n{email_message.body}"
+
+    if URGENT_RE.search(text):
+        return Priority.urgent
+    if HIGH_RE.search(text):
+        priority = Priority.high
+    elif LOW_RE.search(text):
+        priority = Priority.low
+    else:
+        priority = Priority.normal
+
+    if not context:
+        priority = Priority(min(priority + 1, Priority.low))
+    return priority
+
+
+def final_priority(intent: Intent, initial: Priority) -> Priority:
+    """
+    Priority once the LLM intent is known. The intent decides, except that a
+    maintenance email flagged as an emergency (leak, flood...) stays urgent.
+    """
+    priority = INTENT_PRIORITY.get(intent, Priority.normal)
+    if intent == Intent.maintenance:
+        return min(priority, initial)
+    return priority
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import re
+from typing import Dict, List, Optional
+
+from core.models import EmailMessage
+
+# Everything from the first of these lines on is a quoted reply chain
+QUOTE_HEADER_RE = re.compile(
+    r"^(On .{0,200}wrote:\s*$|-{2,}\s*Original Message\s*-{2,}|-{2,}\s*Forwarded message\s*-{2,}|"
+    r"From: .+$\n^(Sent|Date): )",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Everything from the first of these lines on is a signature
+SIGNATURE_RE = re.compile(
+    r"^(-- ?$|Sent from my \w+|Get Outlook for \w+|Best regards,?$|Kind regards,?$|Regards,?$|Sincerely,?$)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+RENT_RE = re.compile(r"\b(rent|pay(ment|ing)?|paid|balance|due|lease|invoice|late fee|deposit)\b", re.IGNORECASE)
+
+# Tenant/unit fields every prompt gets; the rest only when the email is about them
+BASE_TENANT_FIELDS = ("name", "unit_id")
+RENT_TENANT_FIELDS = ("balance_due", "lease_terms")
+
+
+def clean_body(body: str, max_chars: int = 2000) -> str:
+    """Drops quoted reply chains, '>' quoted lines and signatures, then caps the length."""
+    original = body
+    match = QUOTE_HEADER_RE.search(body)
+    if match:
+        body = body[:match.start()]
+    match = SIGNATURE_RE.search(body)
+    if match:
+        body = body[:match.start()]
+
+    body = "\n".join(line for line in body.splitlines() if not line.lstrip().startswith(">"))
+    body = re.sub(r"\n{3,}", "\n\n", body).strip()
+    if not body:
+        # Everything looked like quoting; better the raw text than nothing
+        body = original.strip()
+    if len(body) > max_chars:
+        body = body[:max_chars].rstrip() + " [...]"
+    return body
+
+
+def project_context(context: Optional[dict], email: EmailMessage) -> Optional[dict]:
+    """Keeps only the tenant/unit fields relevant to what the email is about."""
+    if not context:
+        return context
+
+    fields = BASE_TENANT_FIELDS
+    if RENT_RE.search(f"{email.subject}\n{email.body}"):
+        fields += RENT_TENANT_FIELDS
+
+    tenant = context.get("tenant") or {}
+    unit = context.get("unit") or {}
+    return {
+        "tenant": {key: tenant[key] for key in fields if key in tenant},
+        "unit": {key: unit[key] for key in ("unit_id", "address") if key in unit},
+    }
+
+
+class PromptBuilder:
+    """Builds chat messages: the static system prompt followed by a trimmed user message."""
+
+    # Kept byte-identical across calls and placed first, so provider-side
+    # prompt caching can reuse it. Only the user message varies per email.
+    SYSTEM_PROMPT = """
+You are an assistant for a property management company.
+Read tenant emails and provide a professional, helpful response.
+
+Rules:
+1. Understand the tenant's request fully.
+2. Use the provided context to enhance your reply.
+3. Generate a clear, concise, human-sounding response.
+4. Determine the intent of the email (locked_out, maintenance, rent, general).
+5. List any action items needed.
+6. NEVER reveal that you are an AI.
+7. Output **strict JSON only**, no extra text, no greetings, no commentary.
+
+Output JSON schema, with the fields in this order:
+{"intent": "<locked_out | maintenance | rent | general>", "action_items": [{"type": "<string>", "details": "<string>"}], "reply": "<string>"}
+
+Intent rules:
+- "locked_out": tenant is locked out of property. Action required.
+- "maintenance": tenant mentions repairs or issues. Action required.
+- "rent": tenant asks about rent or payment. Action may be required.
+- "general": anything else. Action may be optional.
+
+Rules for action_items:
+- Leave empty list [] if no action required.
+- Always provide concrete action items if the email implies a task.
+- "type" = short identifier, "details" = clear description.
+
+Examples:
+Email: "I locked myself out of my apartment."
+{"intent": "locked_out", "action_items": [{"type": "call_locksmith", "details": "Call locksmith to provide access to tenant"}], "reply": "I understand that you are locked out. We are arranging access immediately."}
+
+Email: "The heating is broken in my apartment."
+{"intent": "maintenance", "action_items": [{"type": "assign_technician", "details": "Send technician to repair heating"}], "reply": "Thank you for reporting the heating issue. We will send a technician as soon as possible."}
+
+Email: "I need information about my rent payment."
+{"intent": "rent", "action_items": [], "reply": "You can pay your rent via your online account or contact us for assistance."}
+
+Email: "I just wanted to say thank you."
+{"intent": "general", "action_items": [], "reply": "You're welcome! We are happy to help."}
+""".strip()
+
+    USER_PROMPT_TEMPLATE = """
+CONTEXT:
+{context_json}
+
+EMAIL RECEIVED:
+Subject: {subject}
+From: {sender}
+Body: {body}
+""".strip()
+
+    # Changes whenever the prompts change, so cached responses never outlive them
+    VERSION = hashlib.sha256((SYSTEM_PROMPT + USER_PROMPT_TEMPLATE).encode("utf-8")).hexdigest()[:12]
+
+    def __init__(self, max_body_chars: int = 2000):
+        self.max_body_chars = max_body_chars
+
+    def build_user_prompt(self, email: EmailMessage, context: Optional[dict]) -> str:
+        context_json = json.dumps(project_context(context, email), separators=(",", ":"), ensure_ascii=False)
+        return self.USER_PROMPT_TEMPLATE.format(
+            subject=email.subject,
+            sender=email.sender,
+            body=clean_body(email.body, self.max_body_chars),
+            context_json=context_json,
+        )
+
+    def build(self, email: EmailMessage, context: Optional[dict]) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": self.build_user_prompt(email, context)},
+        ]
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Mapping, Optional
+
+from core.metrics import REGISTRY
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+WAIT_SECONDS = REGISTRY.histogram(
+    "llm_limiter_wait_seconds", "Time a call waited for a concurrency slot and request/token budget"
+)
+
+DURATION_RE = re.compile(r"(?P<value>\d+(?:\.\d+)?)(?P<unit>ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parses OpenAI reset durations such as '20ms', '1s' or '6m0s' into seconds."""
+    if not value:
+        return None
+    matches = list(DURATION_RE.finditer(value))
+    if not matches:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(m.group("value")) * DURATION_UNITS[m.group("unit")] for m in matches)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English prose)."""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """Refills continuously at `per_minute / 60` units per second up to `per_minute`."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if now <= self.updated_at:
+            # Still inside a server-imposed reset window
+            return
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float) -> None:
+        """Waits until `amount` units are available and takes them, first come first served."""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = max(self.updated_at - time.monotonic(), 0) + (amount - self.level) / self.rate
+                await asyncio.sleep(wait)
+
+    def adjust(self, delta: float) -> None:
+        """Gives back (positive) or charges (negative) units, e.g. after an estimate was off."""
+        self._refill()
+        self.level = min(self.capacity, self.level + delta)
+
+    def sync(self, remaining: Optional[float], reset_seconds: Optional[float]) -> None:
+        """Trusts the server's view when it is stricter than ours."""
+        if remaining is None:
+            return
+        self._refill()
+        if remaining < self.level:
+            self.level = remaining
+        if remaining <= 0 and reset_seconds:
+            # Empty until the server resets the window
+            self.updated_at = time.monotonic() + reset_seconds
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: grows by roughly one slot per window of
+    successful calls and halves on throttling or latency spikes.
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 32,
+                 spike_factor: float = 3.0, warmup: int = 10):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.spike_factor = spike_factor
+        self.warmup = warmup
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.samples = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        self.samples += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+            return
+
+        if self.samples > self.warmup and latency > self.spike_factor * self.latency_ewma:
+            self._decrease(f"latency spike {latency:.2f}s (baseline {self.latency_ewma:.2f}s)")
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self.latency_ewma = 0.9 * self.latency_ewma + 0.1 * latency
+
+    def on_throttle(self) -> None:
+        self._decrease("rate limited")
+
+    def _decrease(self, reason: str) -> None:
+        previous = int(self.limit)
+        self.limit = max(self.minimum, self.limit / 2)
+        if int(self.limit) != previous:
+            logger.warning(f"LLM concurrency {previous} -> {int(self.limit)}: {reason}")
+
+
+class RateLimiter:
+    """
+    Client-side budget for the OpenAI API: requests per minute, tokens per
+    minute and an adaptive concurrency limit, corrected from the
+    x-ratelimit-* response headers.
+    """
+
+    def __init__(self, requests_per_minute: int = 500, tokens_per_minute: int = 200_000,
+                 initial_concurrency: int = 2, max_concurrency: int = 16):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, maximum=max_concurrency)
+        self.throttled = 0
+        self._paused_until = 0.0
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int) -> AsyncIterator[None]:
+        """Holds one concurrency slot with request and token budget for a single call."""
+        started = time.monotonic()
+        await self.concurrency.acquire()
+        try:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            WAIT_SECONDS.observe(time.monotonic() - started)
+            yield
+        finally:
+            await self.concurrency.release()
+
+    def on_success(self, latency: float, estimated_tokens: int, used_tokens: Optional[int],
+                   headers: Optional[Mapping[str, str]] = None) -> None:
+        self.concurrency.on_success(latency)
+        if used_tokens is not None:
+            self.tokens.adjust(estimated_tokens - used_tokens)
+        if headers:
+            self.update_from_headers(headers)
+
+    def on_throttle(self, retry_after: Optional[float], headers: Optional[Mapping[str, str]] = None,
+                    estimated_tokens: int = 0) -> None:
+        """
+        Called on HTTP 429: back off concurrency and pause new calls until the
+        server resets. A rejected call used no tokens, so its reservation is
+        given back before the retry reserves again.
+        """
+        self.throttled += 1
+        self.concurrency.on_throttle()
+        self.tokens.adjust(estimated_tokens)
+        if headers:
+            self.update_from_headers(headers)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        def number(name: str) -> Optional[float]:
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        self.requests.sync(number("x-ratelimit-remaining-requests"),
+                           parse_duration(headers.get("x-ratelimit-reset-requests")))
+        self.tokens.sync(number("x-ratelimit-remaining-tokens"),
+                         parse_duration(headers.get("x-ratelimit-reset-tokens")))
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight,
+            "throttled": self.throttled,
+            "request_budget": int(self.requests.level),
+            "token_budget": int(self.tokens.level),
+        }
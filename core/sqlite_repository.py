@@ -0,0 +1,246 @@
+"""
+SQLite-backed tenant/unit repository for large portfolios.
+
+Same lookup interface as DataRepository, but nothing is loaded up front:
+each lookup is an indexed query, with a small read-through LRU in front
+for repeat senders. Import the JSON data files once with:
+
+    python -m core.sqlite_repository --data data --db state/data.sqlite3
+"""
+import argparse
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from core.data_repository import normalize_address, normalize_email
+from core.models.intent import Intent
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenants (
+    tenant_id TEXT PRIMARY KEY,
+    email_key TEXT,
+    unit_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tenants_email_key ON tenants (email_key);
+CREATE TABLE IF NOT EXISTS units (
+    unit_id TEXT PRIMARY KEY,
+    address_key TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS units_address_key ON units (address_key);
+CREATE TABLE IF NOT EXISTS stakeholders (
+    intent TEXT NOT NULL,
+    email TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stakeholders_intent ON stakeholders (intent);
+"""
+
+CONTEXT_SQL = """
+SELECT t.data, u.data FROM tenants t LEFT JOIN units u ON u.unit_id = t.unit_id
+WHERE t.email_key = ? ORDER BY t.rowid LIMIT 1
+"""
+
+_MISSING = object()
+
+
+def import_json(data_dir: str | Path, db_path: str | Path, batch_size: int = 10_000) -> Tuple[int, int]:
+    """
+    Replaces the database contents with the tenants/units/stakeholders JSON
+    files in `data_dir`, in a single transaction. Returns (tenants, units).
+    """
+    data_dir = Path(data_dir)
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+
+    def load(name: str):
+        with open(data_dir / name, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    tenants = load("tenants.json")
+    units = load("units.json")
+    stakeholders = load("stakeholders.json")
+
+    db = sqlite3.connect(db_path)
+    try:
+        db.executescript(SCHEMA)
+        with db:
+            db.execute("DELETE FROM tenants")
+            db.execute("DELETE FROM units")
+            db.execute("DELETE FROM stakeholders")
+            for start in range(0, len(tenants), batch_size):
+                db.executemany(
+                    "INSERT OR IGNORE INTO tenants (tenant_id, email_key, unit_id, data) VALUES (?, ?, ?, ?)",
+                    [
+                        (t["tenant_id"], normalize_email(t["email"]) if t.get("email") else None,
+                         t.get("unit_id"), json.dumps(t, ensure_ascii=False))
+                        for t in tenants[start:start + batch_size]
+                    ],
+                )
+            for start in range(0, len(units), batch_size):
+                db.executemany(
+                    "INSERT OR IGNORE INTO units (unit_id, address_key, data) VALUES (?, ?, ?)",
+                    [
+                        (u["unit_id"], normalize_address(u["address"]) if u.get("address") else None,
+                         json.dumps(u, ensure_ascii=False))
+                        for u in units[start:start + batch_size]
+                    ],
+                )
+            db.executemany(
+                "INSERT INTO stakeholders (intent, email) VALUES (?, ?)",
+                [(intent, email) for intent, emails in stakeholders.items() for email in emails],
+            )
+        db.execute("ANALYZE")
+    finally:
+        db.close()
+    return len(tenants), len(units)
+
+
+class SQLiteDataRepository:
+    """
+    Drop-in alternative to DataRepository backed by an indexed SQLite file.
+    Each thread gets its own read-only connection. The LRU holds misses too,
+    so unknown senders don't hit the database on every email.
+    """
+
+    def __init__(self, db_path: str | Path, cache_size: int = 4096, cache_ttl: float = 60.0):
+        self.db_path = Path(db_path)
+        if not self.db_path.exists():
+            raise FileNotFoundError(f"{self.db_path} not found; run `python -m core.sqlite_repository` first")
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            self._local.db = db
+        return db
+
+    # ---------- READ-THROUGH CACHE ---------- #
+
+    def _cached(self, key: Tuple[str, str]) -> Any:
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._cache[key]
+                return _MISSING
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _remember(self, key: Tuple[str, str], value: Any) -> Any:
+        with self._cache_lock:
+            self.misses += 1
+            self._cache[key] = (time.monotonic() + self.cache_ttl, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return value
+
+    # ---------- QUERIES ---------- #
+
+    def _query_one(self, sql: str, params: tuple) -> Optional[dict]:
+        row = self._connection().execute(sql, params).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _query_context(self, email_key: str) -> Optional[dict]:
+        row = self._connection().execute(CONTEXT_SQL, (email_key,)).fetchone()
+        if row is None:
+            return None
+        tenant_data, unit_data = row
+        return {
+            "tenant": json.loads(tenant_data),
+            "unit": json.loads(unit_data) if unit_data else None,
+        }
+
+    def _query_stakeholders(self, intent: str) -> List[str]:
+        rows = self._connection().execute(
+            "SELECT email FROM stakeholders WHERE intent = ? ORDER BY rowid", (intent,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    # ---------- LOOKUPS ---------- #
+
+    def find_tenant_by_email(self, sender: str) -> Optional[dict]:
+        return self._query_one(
+            "SELECT data FROM tenants WHERE email_key = ? ORDER BY rowid LIMIT 1", (normalize_email(sender),)
+        )
+
+    def find_tenant_by_id(self, tenant_id: str) -> Optional[dict]:
+        return self._query_one("SELECT data FROM tenants WHERE tenant_id = ?", (tenant_id,))
+
+    def find_unit(self, unit_id: str) -> Optional[dict]:
+        return self._query_one("SELECT data FROM units WHERE unit_id = ?", (unit_id,))
+
+    def find_unit_by_address(self, address: str) -> Optional[dict]:
+        return self._query_one(
+            "SELECT data FROM units WHERE address_key = ? ORDER BY rowid LIMIT 1", (normalize_address(address),)
+        )
+
+    def get_full_context_for_email(self, sender_email: str) -> Optional[dict]:
+        """
+        Returns combined tenant + unit context, or None.
+        """
+        key = ("context", normalize_email(sender_email))
+        cached = self._cached(key)
+        if cached is not _MISSING:
+            return cached
+        return self._remember(key, self._query_context(key[1]))
+
+    async def get_full_context_for_email_async(self, sender_email: str) -> Optional[dict]:
+        """Cache hits return on the event loop; misses query in the default executor."""
+        key = ("context", normalize_email(sender_email))
+        cached = self._cached(key)
+        if cached is not _MISSING:
+            return cached
+        loop = asyncio.get_running_loop()
+        context = await loop.run_in_executor(None, self._query_context, key[1])
+        return self._remember(key, context)
+
+    def get_stakeholders_for_intent(self, intent: Intent) -> List[str]:
+        """
+        Returns a list of stakeholder emails for a given intent.
+        """
+        intent = intent.value if isinstance(intent, Intent) else intent
+        key = ("stakeholders", intent)
+        cached = self._cached(key)
+        if cached is not _MISSING:
+            return cached
+        return self._remember(key, self._query_stakeholders(intent))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._cache)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import the JSON data files into a SQLite repository.")
+    parser.add_argument("--data", default="data", help="Directory with tenants/units/stakeholders JSON")
+    parser.add_argument("--db", default="state/data.sqlite3")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    tenants, units = import_json(args.data, args.db)
+    print(f"Imported {tenants} tenants and {units} units into {args.db} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
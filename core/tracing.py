@@ -0,0 +1,72 @@
+"""
+Optional per-email span trace, one JSON line per email:
+
+    {"uid": 42, "sender": "...", "intent": "maintenance", "priority": 1,
+     "outcome": "done", "last_stage": "send", "total_seconds": 1.84,
+     "spans": [{"stage": "parse", "start": 0.0, "wait": 0.0, "seconds": 0.002, "outcome": "passed"}, ...]}
+
+`start` is relative to when the email was fetched, `wait` is the time spent
+queued in front of the stage and `seconds` the time in its handler, so the
+gaps between stages show where an email sat.
+"""
+import asyncio
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+
+class EmailTracer:
+    """Buffers finished traces and appends them to a JSONL file off the event loop."""
+
+    def __init__(self, path: str, flush_every: int = 50):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self._buffer: List[str] = []
+        self._write_lock = threading.Lock()
+        self._flushes: Set[asyncio.Future] = set()
+        self.written = 0
+
+    def finish(self, record: Dict[str, Any]) -> None:
+        """Queues one finished trace; a write is scheduled once enough have accumulated."""
+        self._buffer.append(json.dumps(record, ensure_ascii=False, default=str))
+        if len(self._buffer) >= self.flush_every:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> Optional[asyncio.Future]:
+        lines, self._buffer = self._buffer, []
+        if not lines:
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(lines)
+            return None
+        future = loop.run_in_executor(None, self._write, lines)
+        self._flushes.add(future)
+        future.add_done_callback(self._flushes.discard)
+        return future
+
+    async def flush(self) -> None:
+        """Writes everything buffered and waits for writes still in flight."""
+        self._schedule_flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _write(self, lines: List[str]) -> None:
+        try:
+            with self._write_lock:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines) + "\n")
+                self.written += len(lines)
+        except OSError as e:
+            logger.warning("Failed to write email traces: %s", e)
+
+    def stats(self) -> dict:
+        return {"written": self.written, "buffered": len(self._buffer)}
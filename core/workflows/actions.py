@@ -1,15 +1,13 @@
 import uuid
-import json
-import os
 from datetime import datetime
 
 
-def create_locked_out_ticket(context, action_items):
+def create_locked_out_ticket(context, action_items, ticket_id=None):
     """
     Example: tenant locked out → create urgent access request.
     """
     ticket = {
-        "id": str(uuid.uuid4()),
+        "id": ticket_id or str(uuid.uuid4()),
         "type": "locked_out",
         "priority": "urgent",
         "timestamp": datetime.utcnow().isoformat(),
@@ -21,12 +19,12 @@ def create_locked_out_ticket(context, action_items):
     return ticket
 
 
-def create_maintenance_ticket(context, action_items):
+def create_maintenance_ticket(context, action_items, ticket_id=None):
     """
     Example: maintenance issue → dispatch maintenance worker.
     """
     ticket = {
-        "id": str(uuid.uuid4()),
+        "id": ticket_id or str(uuid.uuid4()),
         "type": "maintenance",
         "priority": "normal",
         "timestamp": datetime.utcnow().isoformat(),
@@ -38,12 +36,12 @@ def create_maintenance_ticket(context, action_items):
     return ticket
 
 
-def create_rent_info_event(context):
+def create_rent_info_event(context, ticket_id=None):
     """
     Rent info log event.
     """
     event = {
-        "id": str(uuid.uuid4()),
+        "id": ticket_id or str(uuid.uuid4()),
         "type": "rent_request",
         "timestamp": datetime.utcnow().isoformat(),
         "tenant": context.get("tenant"),
@@ -52,15 +50,3 @@ def create_rent_info_event(context):
     }
     return event
 
-
-def save_action_item(data):
-    """
-    Generic save: writes JSON to output/
-    """
-    os.makedirs("output", exist_ok=True)
-    file_path = f"output/{data['id']}.json"
-
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-    return file_path
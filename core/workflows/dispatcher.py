@@ -1,29 +1,240 @@
-from core.models import Intent
-from core.workflows.actions import create_locked_out_ticket, create_maintenance_ticket, create_rent_info_event, save_action_item
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.email.imap_reader import BodyPart
+from core.metrics import REGISTRY
+from core.models import EmailMessage, Intent
+from core.workflows.actions import create_locked_out_ticket, create_maintenance_ticket, create_rent_info_event
+from core.workflows.ticket_sink import JsonlTicketSink, TicketSink
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "workflow_handler_seconds", "Workflow handler run time by outcome (ok, error, timeout)", ["handler", "outcome"]
+)
+
+
+@dataclass
+class WorkflowEvent:
+    """Everything a workflow handler gets to act on."""
+    intent: Intent
+    action_items: List[dict]
+    email_message: Optional[EmailMessage]
+    context: Optional[dict]
+    idempotency_key: Optional[str] = None
+    # Parts a header-first fetch left on the server; `fetch_attachment(part)` downloads one
+    attachments: Tuple[BodyPart, ...] = ()
+    fetch_attachment: Optional[Callable[[BodyPart], Awaitable[bytes]]] = None
+
+    def ticket_id(self, handler_name: str) -> Optional[str]:
+        """Stable per email and handler, so a replayed ticket overwrites instead of duplicating."""
+        if self.idempotency_key is None:
+            return None
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{self.idempotency_key}/{handler_name}"))
+
+
+WorkflowHandler = Callable[[WorkflowEvent], Awaitable[Any]]
+
+
+@dataclass
+class RegisteredHandler:
+    name: str
+    handler: WorkflowHandler
+    timeout: float
+    # Safe to run on a streamed intent that may still change or fail validation
+    early: bool = False
+
+
+@dataclass
+class HandlerStats:
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.calls += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "avg_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+            "max_seconds": self.max_seconds,
+        }
 
 
 class WorkflowDispatcher:
-    def dispatch(self, intent, action_items, email_message, context):
+    """
+    Maps each intent to a list of async handlers and runs them concurrently,
+    each under its own timeout.
+
+    With an idempotency key, handlers that already succeeded for that key
+    are not run again, so a retried dispatch only repeats what failed.
+    Handlers registered with `early=True` may also run on a streamed intent
+    before the response is validated (`early_only`); they must only have
+    side effects that are harmless if the final intent differs. Tickets
+    are not early.
+    Those keys live in memory only. After a restart a replayed handler
+    writes its ticket again under the same id, and stored tickets are
+    deduplicated by id when read (see `ticket_sink.iter_tickets`).
+    """
+
+    def __init__(self, sink: Optional[TicketSink] = None, default_timeout: float = 10.0,
+                 idempotency_size: int = 10_000, register_defaults: bool = True):
+        # Tickets are batched and written off the event loop
+        self.sink = sink or JsonlTicketSink()
+        self.default_timeout = default_timeout
+        self.idempotency_size = idempotency_size
+        self._handlers: Dict[Intent, List[RegisteredHandler]] = defaultdict(list)
+        self._stats: Dict[str, HandlerStats] = defaultdict(HandlerStats)
+        # idempotency key -> results of the handlers that succeeded
+        self._completed: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Serializes concurrent dispatches of the same key; dropped when unused
+        self._key_locks: Dict[str, asyncio.Lock] = {}
+        self._key_users: Dict[str, int] = defaultdict(int)
+
+        if register_defaults:
+            self.register(Intent.locked_out, self._locked_out_ticket, name="locked_out_ticket")
+            self.register(Intent.maintenance, self._maintenance_ticket, name="maintenance_ticket")
+            self.register(Intent.rent, self._rent_event, name="rent_event")
+
+    # ---------- REGISTRY ---------- #
+
+    def register(self, intent: Intent, handler: WorkflowHandler, name: Optional[str] = None,
+                 timeout: Optional[float] = None, early: bool = False) -> None:
+        name = name or handler.__name__
+        if any(h.name == name for h in self._handlers[intent]):
+            raise ValueError(f"Handler {name!r} is already registered for {intent.value}")
+        self._handlers[intent].append(RegisteredHandler(name, handler, timeout or self.default_timeout, early))
+
+    def handler(self, *intents: Intent, name: Optional[str] = None, timeout: Optional[float] = None,
+                early: bool = False):
+        """Decorator form of `register` for one or more intents."""
+        def decorator(fn: WorkflowHandler) -> WorkflowHandler:
+            for intent in intents:
+                self.register(intent, fn, name=name, timeout=timeout, early=early)
+            return fn
+        return decorator
+
+    def has_handlers(self, intent: Intent, early_only: bool = False) -> bool:
+        return any(h.early or not early_only for h in self._handlers.get(intent, ()))
+
+    # ---------- DISPATCH ---------- #
+
+    async def dispatch(self, intent, action_items, email_message, context,
+                       idempotency_key: Optional[str] = None, attachments: Tuple[BodyPart, ...] = (),
+                       fetch_attachment: Optional[Callable[[BodyPart], Awaitable[bytes]]] = None,
+                       early_only: bool = False) -> Optional[Dict[str, Any]]:
         """
-        Map LLM intent → workflow generator.
+        Runs every handler registered for the intent, or only the early ones.
+        Returns their results by handler name, or None when the intent has no
+        such handlers. Raises if any handler failed, after the others have
+        finished.
         """
+        handlers = [h for h in self._handlers.get(intent, ()) if h.early or not early_only]
+        if not handlers:
+            return None
+
+        event = WorkflowEvent(intent, action_items or [], email_message, context, idempotency_key,
+                              attachments, fetch_attachment)
+        if idempotency_key is None:
+            return await self._run_handlers(event, handlers, {})
+
+        lock = self._key_locks.setdefault(idempotency_key, asyncio.Lock())
+        self._key_users[idempotency_key] += 1
+        try:
+            async with lock:
+                done = self._completed.setdefault(idempotency_key, {})
+                self._completed.move_to_end(idempotency_key)
+                while len(self._completed) > self.idempotency_size:
+                    self._completed.popitem(last=False)
+                return await self._run_handlers(event, handlers, done)
+        finally:
+            self._key_users[idempotency_key] -= 1
+            if not self._key_users[idempotency_key]:
+                del self._key_users[idempotency_key]
+                del self._key_locks[idempotency_key]
+
+    async def _run_handlers(self, event: WorkflowEvent, handlers: List[RegisteredHandler],
+                            done: Dict[str, Any]) -> Dict[str, Any]:
+        pending = [h for h in handlers if h.name not in done]
+        if len(pending) < len(handlers):
+            logger.info(f"Skipping {len(handlers) - len(pending)} workflow handler(s) already done for this email")
+
+        outcomes = await asyncio.gather(*(self._run_one(h, event) for h in pending), return_exceptions=True)
+        errors = {}
+        for registered, outcome in zip(pending, outcomes):
+            if isinstance(outcome, BaseException):
+                errors[registered.name] = outcome
+            else:
+                done[registered.name] = outcome
+
+        if errors:
+            raise WorkflowError(errors)
+        return {h.name: done[h.name] for h in handlers}
+
+    async def _run_one(self, registered: RegisteredHandler, event: WorkflowEvent) -> Any:
+        stats = self._stats[registered.name]
+        started = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await asyncio.wait_for(registered.handler(event), registered.timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            outcome = "timeout"
+            raise
+        except Exception:
+            stats.errors += 1
+            outcome = "error"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.record(elapsed)
+            HANDLER_SECONDS.observe(elapsed, handler=registered.name, outcome=outcome)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+    # ---------- DEFAULT HANDLERS ---------- #
+
+    async def _locked_out_ticket(self, event: WorkflowEvent):
+        ticket = create_locked_out_ticket(event.context or {}, event.action_items,
+                                          ticket_id=event.ticket_id("locked_out_ticket"))
+        return await self.save_and_return(ticket)
+
+    async def _maintenance_ticket(self, event: WorkflowEvent):
+        ticket = create_maintenance_ticket(event.context or {}, event.action_items,
+                                           ticket_id=event.ticket_id("maintenance_ticket"))
+        return await self.save_and_return(ticket)
 
-        if intent == Intent.locked_out:
-            ticket = create_locked_out_ticket(context, action_items)
-            return save_and_return(ticket)
+    async def _rent_event(self, event: WorkflowEvent):
+        rent_event = create_rent_info_event(event.context or {}, ticket_id=event.ticket_id("rent_event"))
+        return await self.save_and_return(rent_event)
 
-        if intent == Intent.maintenance:
-            ticket = create_maintenance_ticket(context, action_items)
-            return save_and_return(ticket)
+    async def save_and_return(self, action):
+        path = await self.sink.write(action)
+        return {"saved_to": path, "intent": action['type']}
 
-        if intent == Intent.rent:
-            event = create_rent_info_event(context)
-            return save_and_return(event)
+    async def close(self):
+        await self.sink.close()
 
-        # general → no action
-        return None
 
+class WorkflowError(Exception):
+    """One or more workflow handlers failed; the rest completed."""
 
-def save_and_return(action):
-    path = save_action_item(action)
-    return {"saved_to": path, "intent": action['type']}
+    def __init__(self, errors: Dict[str, BaseException]):
+        self.errors = errors
+        details = ", ".join(f"{name}: {type(e).__name__}: {e}" for name, e in errors.items())
+        super().__init__(f"Workflow handlers failed ({details})")
@@ -0,0 +1,278 @@
+"""
+Batched, off-loop persistence for workflow tickets.
+
+Tickets are queued in memory and written by a background task in
+batches: one executor call and one fsync per batch instead of a file per
+ticket. `write` returns once the ticket's batch is on disk.
+
+Stream stored tickets back out, e.g. for a CRM export:
+
+    python -m core.workflows.ticket_sink output/tickets > tickets.jsonl
+    python -m core.workflows.ticket_sink output/tickets.sqlite3 --since 2025-01-01
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Iterator, List, Optional, Protocol, Tuple
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+SEGMENT_GLOB = "tickets-*.jsonl"
+
+
+class TicketSink(Protocol):
+    async def write(self, ticket: dict) -> str:
+        """Persists the ticket and returns where it was stored."""
+        ...
+
+    async def close(self) -> None:
+        ...
+
+
+class BatchingTicketSink(ABC):
+    """
+    Group commit: everything queued while the previous batch was being
+    written (up to `batch_size`) goes out as the next batch, handed to
+    `_write_batch` in the default executor. A non-zero `flush_interval`
+    additionally waits that long for more tickets before writing.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.0):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+        self.written = 0
+        self.batches = 0
+
+    async def write(self, ticket: dict) -> str:
+        if self._writer is None:
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((ticket, future))
+        return await future
+
+    async def close(self) -> None:
+        """Flushes whatever is queued and stops the writer task."""
+        if self._writer is None:
+            return
+        await self._queue.put(None)
+        await self._writer
+        self._writer = None
+        await asyncio.get_running_loop().run_in_executor(None, self._close)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+
+            tickets = [ticket for ticket, _ in batch]
+            try:
+                locations = await loop.run_in_executor(None, self._write_batch, tickets)
+            except Exception as e:
+                logger.error(f"Failed to write {len(tickets)} tickets: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.written += len(tickets)
+            self.batches += 1
+            for (_, future), location in zip(batch, locations):
+                if not future.done():
+                    future.set_result(location)
+
+    @abstractmethod
+    def _write_batch(self, tickets: List[dict]) -> List[str]:
+        """Durably stores the batch, off the event loop, and returns each ticket's location."""
+
+    def _close(self) -> None:
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "batches": self.batches,
+            "queued": self._queue.qsize() if self._queue else 0,
+        }
+
+
+class JsonlTicketSink(BatchingTicketSink):
+    """
+    Appends tickets as JSON lines to segment files in `directory`.
+    A new segment starts once the current one passes `max_segment_bytes`
+    or is older than `max_segment_age` seconds. Segment names sort in
+    write order.
+    """
+
+    def __init__(self, directory: str | Path = "output/tickets", batch_size: int = 100,
+                 flush_interval: float = 0.0, max_segment_bytes: int = 64 * 1024 * 1024,
+                 max_segment_age: float = 60 * 60):
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval)
+        self.directory = Path(directory)
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segment_age = max_segment_age
+        self._segment: Optional[IO[str]] = None
+        self._segment_path: Optional[Path] = None
+        self._segment_opened_at = 0.0
+
+    def _write_batch(self, tickets: List[dict]) -> List[str]:
+        self._rotate_if_needed()
+        self._segment.write("".join(json.dumps(ticket, ensure_ascii=False) + "\n" for ticket in tickets))
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+        return [str(self._segment_path)] * len(tickets)
+
+    def _rotate_if_needed(self) -> None:
+        if self._segment is not None:
+            too_big = self._segment.tell() >= self.max_segment_bytes
+            too_old = time.monotonic() - self._segment_opened_at >= self.max_segment_age
+            if not (too_big or too_old):
+                return
+            self._segment.close()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        self._segment_path = self.directory / f"tickets-{stamp}.jsonl"
+        self._segment = open(self._segment_path, "a", encoding="utf-8")
+        self._segment_opened_at = time.monotonic()
+
+    def _close(self) -> None:
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+
+class SQLiteTicketSink(BatchingTicketSink):
+    """Stores tickets in one SQLite table, one transaction per batch."""
+
+    def __init__(self, db_path: str | Path = "output/tickets.sqlite3", batch_size: int = 100,
+                 flush_interval: float = 0.0):
+        super().__init__(batch_size=batch_size, flush_interval=flush_interval)
+        self.db_path = Path(db_path)
+        self._db: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.db_path, check_same_thread=False)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS tickets (id TEXT PRIMARY KEY, type TEXT, timestamp TEXT, data TEXT NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS tickets_timestamp ON tickets (timestamp)")
+        db.commit()
+        return db
+
+    def _write_batch(self, tickets: List[dict]) -> List[str]:
+        if self._db is None:
+            # Opened lazily so the sink can be written to again after close()
+            self._db = self._connect()
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tickets (id, type, timestamp, data) VALUES (?, ?, ?, ?)",
+                [(t["id"], t.get("type"), t.get("timestamp"), json.dumps(t, ensure_ascii=False)) for t in tickets],
+            )
+        return [f"{self.db_path}#{t['id']}" for t in tickets]
+
+    def _close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# ---------- READING ---------- #
+
+
+def _iter_segments(directory: Path) -> Iterator[Tuple[Tuple[int, int], dict]]:
+    """Yields ((segment index, line number), ticket) for every readable line, in write order."""
+    for index, segment in enumerate(sorted(directory.glob(SEGMENT_GLOB))):
+        with open(segment, "r", encoding="utf-8") as f:
+            for number, line in enumerate(f):
+                if not line.strip():
+                    continue
+                try:
+                    ticket = json.loads(line)
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    logger.warning(f"Skipping unreadable line in {segment}")
+                    continue
+                yield (index, number), ticket
+
+
+def iter_tickets(path: str | Path, since: Optional[str] = None) -> Iterator[dict]:
+    """
+    Streams tickets from a JSONL segment directory or a SQLite sink file in
+    write order, holding one ticket (plus the ids) in memory at a time.
+    `since` is an ISO timestamp prefix compared against each ticket's
+    `timestamp`.
+
+    Segments are append-only, so a ticket replayed after a restart (same
+    idempotency key, same id) appears twice on disk. The reader resolves
+    that the way the SQLite sink's INSERT OR REPLACE does: a first pass
+    keeps only the ids and where each was last written, and only that
+    last copy is yielded.
+    """
+    path = Path(path)
+    if path.is_dir():
+        latest = {ticket["id"]: position for position, ticket in _iter_segments(path) if "id" in ticket}
+        for position, ticket in _iter_segments(path):
+            if "id" in ticket and latest.get(ticket["id"]) != position:
+                continue
+            if since is None or ticket.get("timestamp", "") >= since:
+                yield ticket
+        return
+
+    db = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        query: Tuple[str, tuple] = ("SELECT data FROM tickets ORDER BY rowid", ())
+        if since is not None:
+            query = ("SELECT data FROM tickets WHERE timestamp >= ? ORDER BY rowid", (since,))
+        for (data,) in db.execute(*query):
+            yield json.loads(data)
+    finally:
+        db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stream stored tickets as JSON lines to stdout.")
+    parser.add_argument("path", help="JSONL segment directory or SQLite sink file")
+    parser.add_argument("--since", help="Only tickets with timestamp >= this ISO prefix")
+    args = parser.parse_args()
+
+    for ticket in iter_tickets(args.path, since=args.since):
+        sys.stdout.write(json.dumps(ticket, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
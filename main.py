@@ -1,21 +1,70 @@
 import asyncio
 import logging
+import signal
+from config.mailboxes import MailboxConfig, load_mailboxes
+from config.settings import settings
+from core.fast_path import FastPathClassifier
+from core.metrics import MetricsServer
+from core.workflows.ticket_sink import JsonlTicketSink
 from services.property_manager_ai import PropertyManagerAi
+from services.sharded_runner import ShardedRunner
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
 
+def build_processor(mailbox: MailboxConfig | None = None) -> PropertyManagerAi:
+    """One processor per mailbox; each mailbox keeps its own state and ticket directories."""
+    state = f"state/{mailbox.name}" if mailbox else "state"
+    share = mailbox.llm_share if mailbox else 1.0
+    return PropertyManagerAi(
+        **{
+            "concurrency": 2, "polling": 2, "max_retries": 2, "unread_days_back": 1, "fetch_batch_size": 200,
+            "sync_state_path": f"{state}/imap_sync.json",
+            "llm_cache_path": f"{state}/llm_cache.sqlite3",
+            "llm_log_path": f"{state}/llm_responses.jsonl",
+            "outbox_path": f"{state}/outbox.sqlite3",
+            "pre_classifier": FastPathClassifier.from_path("state/fast_path_model.json"),
+            "requests_per_minute": max(1, int(500 * share)),
+            "tokens_per_minute": max(1, int(200_000 * share)),
+            "ticket_sink": JsonlTicketSink(f"output/tickets/{mailbox.name}" if mailbox else "output/tickets"),
+            "mailbox": mailbox,
+            "trace_path": f"{state}/traces.jsonl" if settings.TRACE_EMAILS else None,
+            "batch_threshold": settings.BATCH_THRESHOLD,
+            "journal_path": f"{state}/journal.sqlite3",
+            "drain_timeout": settings.DRAIN_TIMEOUT,
+            **(mailbox.options if mailbox else {}),
+        }
+    )
+
+
 async def main():
-    processor = PropertyManagerAi(concurrency=2, polling=2, max_retries=2, unread_days_back=1)
+    processor = build_processor()
     logger.info("Starting async email property manager assistant...")
+    if settings.METRICS_PORT:
+        await MetricsServer(port=settings.METRICS_PORT).start()
+
+    # SIGTERM (deploys) and Ctrl-C stop fetching and drain what is in flight
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, processor.stop)
 
-    while True:
+    while not processor.stopping:
         try:
-            await processor.run_once()
+            # Push mode: IMAP IDLE when available, polling otherwise
+            await processor.run_forever()
         except Exception as e:
-            logger.error("Error:", e)
+            logger.error(f"Error: {e}")
+            await asyncio.sleep(processor.polling)
+    logger.info("Shut down cleanly")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if settings.MAILBOXES_FILE:
+        # Several buildings: shard their mailboxes across worker processes
+        mailboxes = load_mailboxes(settings.MAILBOXES_FILE)
+        logger.info(f"Starting sharded runner for {len(mailboxes)} mailboxes...")
+        ShardedRunner(mailboxes, build_processor, metrics_port=settings.METRICS_PORT or None,
+                      drain_timeout=settings.DRAIN_TIMEOUT).run()
+    else:
+        asyncio.run(main())
@@ -0,0 +1,277 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional, Set
+
+from core.metrics import REGISTRY
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+Handler = Callable[[Any], Awaitable[Any]]
+ErrorHandler = Callable[[Any, Exception], Awaitable[None]]
+PriorityKey = Callable[[Any], int]
+# (stage name, item, seconds queued, seconds in the handler, outcome)
+Observer = Callable[[str, Any, float, float, str], None]
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "pipeline_stage_seconds", "Time an item spent in a stage handler, retries included", ["stage"]
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "pipeline_queue_wait_seconds", "Time an item waited in a stage's input queue", ["stage"]
+)
+ITEMS_TOTAL = REGISTRY.counter(
+    "pipeline_items_total", "Items leaving a stage by outcome (passed, dropped, failed, deferred)", ["stage", "outcome"]
+)
+
+# Returned by Pipeline._handle when an item exhausted its retries
+_FAILED = object()
+# Returned by a stage handler that handed its item to Pipeline.defer
+DEFERRED = object()
+
+
+class StageStats:
+    """Counters for a single pipeline stage."""
+
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried = 0
+        self.busy_seconds = 0.0
+        self.first_item_at: Optional[float] = None
+
+    def throughput(self) -> float:
+        """Items per second since the stage saw its first item."""
+        if self.first_item_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self.first_item_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retried": self.retried,
+            "avg_seconds": self.busy_seconds / self.processed if self.processed else 0.0,
+            "throughput": self.throughput(),
+        }
+
+
+class Stage:
+    """
+    One step of the pipeline.
+    The handler returns the item for the next stage, or None to drop it.
+    With a `priority` key the input queue becomes a priority queue: lower
+    values are served first and equal values keep arrival order.
+    """
+
+    def __init__(self, name: str, handler: Handler, workers: int = 1, queue_size: int = 100,
+                 retries: int = 0, on_error: Optional[ErrorHandler] = None,
+                 priority: Optional[PriorityKey] = None):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue_size = queue_size
+        self.retries = retries
+        self.on_error = on_error
+        self.priority = priority
+        self.stats = StageStats()
+        self.queue: Optional[asyncio.Queue] = None
+
+
+class Pipeline:
+    """
+    Runs items from an async source through stages joined by bounded queues.
+    A full queue blocks the stage feeding it, so backpressure flows upstream
+    all the way to the source while every stage keeps working in parallel.
+    """
+
+    def __init__(self, stages: List[Stage], source_name: str = "fetch", stats_interval: float = 30,
+                 extra_stats: Optional[Dict[str, Callable[[], Dict[str, Any]]]] = None,
+                 observer: Optional[Observer] = None):
+        self.stages = stages
+        # Called after every item leaves a stage, e.g. to build per-item traces
+        self.observer = observer
+        # Components outside the stages (caches, limiters) that report alongside them
+        self.extra_stats = extra_stats or {}
+        self.source_name = source_name
+        self.source_stats = StageStats()
+        self.stats_interval = stats_interval
+        self._sequence = itertools.count()
+        # Items waiting on outside work without holding a worker, see defer()
+        self._deferred: Set[asyncio.Task] = set()
+
+    async def run(self, source: AsyncIterable[Any]) -> None:
+        """Feeds the source through every stage and returns once all items drained."""
+        for stage in self.stages:
+            queue_type = asyncio.PriorityQueue if stage.priority is not None else asyncio.Queue
+            stage.queue = queue_type(maxsize=stage.queue_size)
+
+        workers = [
+            asyncio.create_task(self._worker(index, stage), name=f"{stage.name}-{n}")
+            for index, stage in enumerate(self.stages)
+            for n in range(stage.workers)
+        ]
+        monitor = asyncio.create_task(self._monitor())
+
+        try:
+            async for item in source:
+                if self.source_stats.first_item_at is None:
+                    self.source_stats.first_item_at = time.monotonic()
+                self.source_stats.processed += 1
+                await self._put(self.stages[0], item)
+
+            # Stages drain in order: once a queue is empty nothing upstream can refill it,
+            # except a deferred item coming back, after which the stages drain again
+            while True:
+                for stage in self.stages:
+                    await stage.queue.join()
+                if not self._deferred:
+                    break
+                await asyncio.wait(set(self._deferred))
+        finally:
+            for task in workers:
+                task.cancel()
+            for task in self._deferred:
+                task.cancel()
+            monitor.cancel()
+            await asyncio.gather(*workers, *self._deferred, monitor, return_exceptions=True)
+            self.log_stats()
+
+    def defer(self, item: Any, work: Awaitable[Any], resume_at: str) -> object:
+        """
+        Lets a stage hand its item to slow outside work, e.g. a batch job that
+        takes hours, without holding one of its workers. The handler returns
+        the result of this call. Once `work` finishes, its result enters the
+        `resume_at` stage (None drops it); if it raises, the item goes to that
+        stage's on_error. run() does not return while deferred work is running.
+        """
+        stage = next(stage for stage in self.stages if stage.name == resume_at)
+        task = asyncio.ensure_future(self._resume(stage, item, work))
+        self._deferred.add(task)
+        task.add_done_callback(self._deferred.discard)
+        return DEFERRED
+
+    async def _resume(self, stage: Stage, item: Any, work: Awaitable[Any]) -> None:
+        try:
+            result = await work
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            stage.stats.failed += 1
+            logger.error(f"[{stage.name}] Deferred work failed: {e}")
+            if stage.on_error is not None:
+                await stage.on_error(item, e)
+            return
+        if result is not None:
+            await self._put(stage, result)
+
+    async def _put(self, stage: Stage, item: Any) -> None:
+        if stage.priority is not None:
+            await stage.queue.put((stage.priority(item), next(self._sequence), time.monotonic(), item))
+        else:
+            await stage.queue.put((time.monotonic(), item))
+
+    async def _worker(self, index: int, stage: Stage) -> None:
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        stats = stage.stats
+
+        while True:
+            *_, enqueued_at, item = await stage.queue.get()
+            try:
+                started = time.monotonic()
+                if stats.first_item_at is None:
+                    stats.first_item_at = started
+                result = await self._handle(stage, item)
+                duration = time.monotonic() - started
+                stats.busy_seconds += duration
+                stats.processed += 1
+
+                if result is DEFERRED:
+                    outcome = "deferred"
+                    result = None
+                elif result is None or result is _FAILED:
+                    outcome = "failed" if result is _FAILED else "dropped"
+                    result = None
+                    stats.dropped += 1
+                else:
+                    outcome = "passed"
+                waited = started - enqueued_at
+                QUEUE_WAIT_SECONDS.observe(waited, stage=stage.name)
+                STAGE_SECONDS.observe(duration, stage=stage.name)
+                ITEMS_TOTAL.inc(stage=stage.name, outcome=outcome)
+                if self.observer is not None:
+                    self._observe(stage.name, item, waited, duration, outcome)
+
+                if result is not None and next_stage is not None:
+                    await self._put(next_stage, result)
+            finally:
+                stage.queue.task_done()
+            if asyncio.current_task().cancelling():
+                # A handler swallowed our cancellation (e.g. wait_for racing a finished read);
+                # waiting for the next item would hang run()'s shutdown
+                raise asyncio.CancelledError
+
+    def _observe(self, stage_name: str, item: Any, waited: float, duration: float, outcome: str) -> None:
+        try:
+            self.observer(stage_name, item, waited, duration, outcome)
+        except Exception as e:
+            logger.warning(f"[{stage_name}] Observer failed: {e}")
+
+    async def _handle(self, stage: Stage, item: Any) -> Any:
+        """Runs the stage handler with retries; exhausted items go to on_error and come back as _FAILED."""
+        attempt = 0
+        while True:
+            try:
+                return await stage.handler(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < stage.retries:
+                    attempt += 1
+                    stage.stats.retried += 1
+                    logger.warning(f"[{stage.name}] Retry {attempt}/{stage.retries}: {e}")
+                    await asyncio.sleep(1 * attempt)
+                    continue
+
+                stage.stats.failed += 1
+                logger.error(f"[{stage.name}] Giving up after {attempt} retries: {e}")
+                if stage.on_error is not None:
+                    await stage.on_error(item, e)
+                return _FAILED
+
+    async def _monitor(self) -> None:
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.log_stats()
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage counters plus the current depth of each stage's input queue."""
+        result = {self.source_name: self.source_stats.as_dict()}
+        for stage in self.stages:
+            stats = stage.stats.as_dict()
+            stats["queue_depth"] = stage.queue.qsize() if stage.queue is not None else 0
+            stats["workers"] = stage.workers
+            result[stage.name] = stats
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        """Stage snapshot plus the extra components' stats, as plain data for reporting elsewhere."""
+        return {
+            "stages": self.snapshot(),
+            **{name: get_stats() for name, get_stats in self.extra_stats.items()},
+        }
+
+    def log_stats(self) -> None:
+        for name, stats in self.snapshot().items():
+            logger.info(
+                "[%s] processed=%d failed=%d queue=%s throughput=%.2f/s avg=%.3fs",
+                name, stats["processed"], stats["failed"], stats.get("queue_depth", "-"),
+                stats["throughput"], stats["avg_seconds"],
+            )
+        for name, get_stats in self.extra_stats.items():
+            logger.info("[%s] %s", name, " ".join(f"{key}={value}" for key, value in get_stats().items()))
@@ -1,52 +1,297 @@
 import asyncio
+import hashlib
 import logging
+import time
+import uuid
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Awaitable, Dict, Iterator, List, Optional
 
+from config.mailboxes import MailboxConfig
+from core.coalescer import EmailCoalescer
 from core.data_repository import DataRepository
-from core.llm_client import LLMClient
-from core.email.imap_reader import IMAPReader
+from core.fast_path import FastPathClassifier, PreClassifier
+from core.llm_batch import LLMBatcher
+from core.llm_cache import LLMResponseCache
+from core.llm_client import LLMClient, LLMResponseError
+from core.metrics import REGISTRY, Sample
+from core.rate_limiter import RateLimiter
+from core.sqlite_repository import SQLiteDataRepository
+from core.email.imap_reader import FetchedEmail, IMAPReader
+from core.email.journal import CLASSIFIED, REPLIED, TICKETED, EmailJournal, JournalEntry
+from core.email.outbox import OutboundMessage, Outbox, OutboxSender, make_message_id
+from core.email.sync_state import SyncState
 from core.email.email_parser import parse_email
 from core.email.smtp_sender import SMTPSender
-from core.models import EmailMessage
+from core.models import EmailMessage, Intent, LLMResponse, Priority
+from core.prioritizer import estimate_priority, final_priority
+from core.tracing import EmailTracer
 from core.workflows.dispatcher import WorkflowDispatcher
+from core.workflows.ticket_sink import TicketSink
+from services.pipeline import Pipeline, Stage
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
 
+CONTEXT_SECONDS = REGISTRY.histogram("context_lookup_seconds", "Tenant and unit context lookup time")
+
+
+@dataclass
+class EmailJob:
+    """State carried through the pipeline for a single fetched email."""
+    fetched: FetchedEmail
+    email_message: Optional[EmailMessage] = None
+    context: Optional[dict] = None
+    llm_response: Optional[LLMResponse] = None
+    priority: Priority = Priority.normal
+    received_at: float = field(default_factory=time.monotonic)
+    # Follow-ups coalesced into this email; committed together with it
+    followers: List[FetchedEmail] = field(default_factory=list)
+    llm_started: bool = False
+    done: bool = False
+    # Per-stage timings, only collected when tracing is on
+    spans: List[dict] = field(default_factory=list)
+    # Early-safe workflows started from a streamed intent while the reply was still being written
+    early_dispatch: Optional[asyncio.Task] = None
+    # Progress checkpointed by an earlier run, when this email is being resumed
+    resumed: Optional[JournalEntry] = None
+    # Identifies the fetched email for the journal, workflow idempotency and the
+    # reply Message-ID; set once at parse time, before coalescing edits the body
+    key: Optional[str] = None
+
 
 class PropertyManagerAi:
-    def __init__(self, concurrency: int = 2, polling: int = 2, max_retries: int = 2, unread_days_back: int = 1):
+    # Workers per stage; the LLM stage defaults to `max_concurrency` and send to `smtp_pool_size`
+    DEFAULT_STAGE_WORKERS: Dict[str, int] = {
+        "parse": 1,
+        "enrich": 2,
+        "classify": 1,
+        "coalesce": 1,
+        "batch": 2,
+        "dispatch": 4,
+    }
+
+    def __init__(self, concurrency: int = 2, polling: int = 2, max_retries: int = 2, unread_days_back: int = 1,
+                 fetch_batch_size: int = 0, sync_state_path: str | None = None,
+                 stage_workers: Dict[str, int] | None = None, queue_size: int = 50,
+                 prioritize: bool = True, priority_queue_size: int = 1000,
+                 llm_cache_path: str | None = None, llm_cache_ttl: float = 24 * 60 * 60,
+                 llm_log_path: str | None = None, pre_classifier: PreClassifier | None = None,
+                 max_concurrency: int | None = None, requests_per_minute: int = 500,
+                 tokens_per_minute: int = 200_000, data_db_path: str | None = None,
+                 smtp_pool_size: int = 4, outbox_path: str | None = None,
+                 ticket_sink: TicketSink | None = None, mailbox: MailboxConfig | None = None,
+                 coalesce_window: float = 120, imap_header_first: bool = False,
+                 trace_path: str | None = None, llm_stream: bool = False, llm_request_timeout: float = 60,
+                 llm_http2: bool = False, llm_structured: bool = False, batch_threshold: int = 0,
+                 batch_max_size: int = 500, batch_max_wait: float = 30, batch_poll_interval: float = 30,
+                 batch_max_pending: int | None = None, journal_path: str | None = None, drain_timeout: float = 30):
+        # Starting LLM concurrency; the rate limiter adapts it between 1 and max_concurrency
         self.concurrency = concurrency
+        self.max_concurrency = max_concurrency or 4 * concurrency
         self.max_retries = max_retries
         self.polling = polling
-    
-        self.imap = IMAPReader(days_back=unread_days_back)
-        self.smtp = SMTPSender()
-        self.data_repo = DataRepository()
-        self.llm = LLMClient()
-        self.dispatcher = WorkflowDispatcher()
-        self.semaphore = asyncio.Semaphore(self.concurrency)
+        # Labels this processor's metrics when several mailboxes share a process
+        self.name = mailbox.name if mailbox else "default"
+
+        self.imap = IMAPReader(
+            days_back=unread_days_back,
+            fetch_batch_size=fetch_batch_size,
+            sync_state=SyncState(sync_state_path) if sync_state_path else None,
+            host=mailbox.imap_host if mailbox else None,
+            user=mailbox.imap_user if mailbox else None,
+            password=mailbox.imap_password if mailbox else None,
+            mailbox=mailbox.mailbox if mailbox else "INBOX",
+            header_first=imap_header_first,
+        )
+        self.smtp = SMTPSender(
+            pool_size=smtp_pool_size,
+            host=mailbox.smtp_host if mailbox else None,
+            user=mailbox.smtp_user if mailbox else None,
+            password=mailbox.smtp_password if mailbox else None,
+        )
+        # With an outbox the send stage only persists replies; a separate
+        # worker delivers them, so SMTP trouble never re-runs the LLM
+        self.outbox = Outbox(outbox_path) if outbox_path else None
+        self.outbox_sender = OutboxSender(self.outbox, self.smtp, concurrency=smtp_pool_size) if self.outbox else None
+        # The SQLite backend keeps startup memory flat for large portfolios
+        self.data_repo = SQLiteDataRepository(data_db_path) if data_db_path else DataRepository()
+        self.llm = LLMClient(
+            cache=LLMResponseCache(ttl_seconds=llm_cache_ttl, db_path=llm_cache_path),
+            response_log_path=llm_log_path,
+            limiter=RateLimiter(
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                initial_concurrency=self.concurrency,
+                max_concurrency=self.max_concurrency,
+            ),
+            # Streaming starts workflows as soon as the intent arrives, ahead of the reply text
+            stream=llm_stream,
+            max_connections=self.max_concurrency,
+            request_timeout=llm_request_timeout,
+            http2=llm_http2,
+            # Schema-constrained output; an email without a valid response gets no reply at all
+            structured=llm_structured,
+        )
+        # Answers trivial mail (thanks, auto-replies, receipts) without an LLM call
+        self.pre_classifier = pre_classifier if pre_classifier is not None else FastPathClassifier()
+        self.dispatcher = WorkflowDispatcher(sink=ticket_sink)
+        # Follow-ups in a burst ("still locked out!!") share one LLM call, ticket and reply
+        self.coalescer = EmailCoalescer(window=coalesce_window)
+        # One JSONL line per email with the time spent queued and working in each stage
+        self.tracer = EmailTracer(trace_path) if trace_path else None
+        # Backlog mode: while at least `batch_threshold` emails are unread or in
+        # flight, non-urgent ones are answered through the Batch API instead of
+        # realtime calls
+        self.batch_threshold = batch_threshold
+        # Per-email stage checkpoints, so a refetched email resumes instead of starting over
+        self.journal = EmailJournal(journal_path) if journal_path else None
+        # With a journal, submitted batches are resumed after a restart instead of paid for again
+        self.batcher = LLMBatcher(
+            self.llm, max_batch_size=batch_max_size, max_wait=batch_max_wait, poll_interval=batch_poll_interval,
+            on_submit=self.journal.record_batch if self.journal else None,
+        ) if batch_threshold > 0 else None
+        # Emails waiting on batches at once, several batches' worth: while one
+        # batch runs, the next ones fill up and are submitted in turn
+        self.batch_max_pending = batch_max_pending or 4 * batch_max_size
+        # Fetched emails not yet committed, followers included
+        self.in_flight = 0
+        # After stop(), in-flight emails get this long to finish before they are cancelled
+        self.drain_timeout = drain_timeout
+        self._stopping = asyncio.Event()
+
+        workers = {
+            **self.DEFAULT_STAGE_WORKERS,
+            "llm": self.max_concurrency,
+            "send": smtp_pool_size,
+            **(stage_workers or {}),
+        }
+        # The LLM and send stages are where emails wait, so that is where urgent
+        # mail overtakes the backlog. Their queues are larger so cheap upstream
+        # stages can drain the backlog into them instead of blocking in FIFO order.
+        priority_key = self._job_priority if prioritize else None
+        priority_queue_size = priority_queue_size if prioritize else queue_size
+        self.pipeline = Pipeline([
+            # Every stage commits an email it gives up on, or it would stay in flight and pin the sync mark
+            Stage("parse", self._parse_stage, workers["parse"], queue_size, on_error=self._on_stage_error),
+            Stage("enrich", self._enrich_stage, workers["enrich"], queue_size,
+                  retries=self.max_retries, on_error=self._on_stage_error),
+            Stage("classify", self._classify_stage, workers["classify"], queue_size, on_error=self._on_stage_error),
+            Stage("coalesce", self._coalesce_stage, workers["coalesce"], queue_size, on_error=self._on_stage_error),
+            *([Stage("batch", self._batch_stage, workers["batch"], priority_queue_size,
+                     on_error=self._on_stage_error, priority=priority_key)]
+              if self.batcher else []),
+            Stage("llm", self._llm_stage, workers["llm"], priority_queue_size,
+                  retries=self.max_retries, on_error=self._on_stage_error, priority=priority_key),
+            Stage("dispatch", self._dispatch_stage, workers["dispatch"], queue_size,
+                  retries=self.max_retries, on_error=self._on_stage_error),
+            Stage("send", self._send_stage, workers["send"], priority_queue_size,
+                  retries=self.max_retries, on_error=self._on_send_error, priority=priority_key),
+        ], extra_stats={
+            "imap": self.imap.stats,
+            "llm_cache": self.llm.cache.stats,
+            "llm_limiter": self.llm.limiter.stats,
+            "smtp_pool": self.smtp.pool.stats,
+            "workflows": self.dispatcher.stats,
+            "coalescer": self.coalescer.stats,
+            **({"outbox": self.outbox.stats} if self.outbox else {}),
+            **({"traces": self.tracer.stats} if self.tracer else {}),
+            **({"llm_batch": self.batcher.stats} if self.batcher else {}),
+            **({"journal": self.journal.stats} if self.journal else {}),
+        }, observer=self._trace_stage if self.tracer else None)
+        REGISTRY.register_collector(f"mailbox:{self.name}", self._collect_metrics)
 
     async def run_once(self):
-        """Fetch unread emails and process them asynchronously using a persistent SMTP connection."""
+        """Fetch unread emails and stream them through the pipeline; replies go out over pooled SMTP connections."""
         logger.info("Checking for unread emails...")
 
         try:
-            async with self.smtp.connection() as smtp_conn:
-                # Collect tasks but ensure they all run inside the connection context
-                tasks = [
-                    self.process_email(raw_email, smtp_conn)
-                    async for raw_email in self.fetch_unread_stream()
-                ]
-
-                if tasks:
-                    # Run all tasks concurrently with semaphore control
-                    await asyncio.gather(*tasks)
-
-            await asyncio.sleep(self.polling)
+            async with self._outbox_worker():
+                await self._run_until_drained(self.pipeline.run(self._jobs(self.fetch_unread_stream())))
+            if self.outbox_sender:
+                await self.outbox_sender.drain()
+            # Flush this cycle's tickets; the sink restarts on the next write
+            await self.dispatcher.close()
+            await self.imap.flush()
+            if self.tracer:
+                await self.tracer.flush()
+            if not self.stopping:
+                await asyncio.sleep(self.polling)
         except Exception as e:
             logger.error(f"Error in run_once: {e}")
 
+    async def run_forever(self):
+        """
+        Keep a single IMAP connection open and process emails as soon as the
+        server pushes them (IDLE), instead of reconnecting every polling cycle.
+        """
+        logger.info("Watching mailbox for new emails...")
+        try:
+            async with self._outbox_worker():
+                await self._run_until_drained(
+                    self.pipeline.run(self._jobs(self.imap.watch_unread_stream(poll_interval=self.polling)))
+                )
+        finally:
+            await self.dispatcher.close()
+            await self.imap.flush()
+            await self.smtp.close()
+            if self.tracer:
+                await self.tracer.flush()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopping.is_set()
+
+    def stop(self) -> None:
+        """
+        Stops fetching new email, e.g. from a SIGTERM handler. Emails already
+        in the pipeline get `drain_timeout` seconds to finish; whatever is
+        cancelled after that stays uncommitted and is refetched on restart,
+        resuming from its journal checkpoint.
+        """
+        if self.stopping:
+            return
+        logger.info(f"Stopping: no new emails, draining {self.in_flight} in flight for up to {self.drain_timeout}s")
+        self._stopping.set()
+        if self.batcher:
+            # Submit what is queued now rather than after max_wait
+            self.batcher.flush()
+
+    async def _run_until_drained(self, run: Awaitable[None]) -> None:
+        """Runs the pipeline until it finishes, or until `drain_timeout` seconds after stop()."""
+        task = asyncio.ensure_future(run)
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        try:
+            await asyncio.wait({task, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            if not task.done():
+                await asyncio.wait({task}, timeout=self.drain_timeout)
+            if not task.done():
+                logger.warning(f"Drain deadline passed, cancelling {self.in_flight} emails still in flight")
+        finally:
+            stopping.cancel()
+            if not task.done():
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        if not task.cancelled():
+            task.result()
+
+    @asynccontextmanager
+    async def _outbox_worker(self):
+        """Runs the outbox sender alongside the pipeline, if there is an outbox."""
+        if self.outbox_sender is None:
+            yield
+            return
+        task = asyncio.create_task(self.outbox_sender.run())
+        try:
+            yield
+        finally:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+
     async def fetch_unread_stream(self):
         """Async generator yielding unread emails one by one."""
         try:
@@ -55,22 +300,29 @@ class PropertyManagerAi:
         except Exception as e:
             logger.error(f"Failed to fetch emails: {e}")
 
-    async def process_email(self, raw_email: bytes, smtp_conn):
-        """Parse and reply to a single email with concurrency control."""
-        async with self.semaphore:
-            email_message = await self.safe_parse_email(raw_email)
-            if not email_message:
-                return
-
-            retries = 0
-            while retries <= self.max_retries:
+    async def _jobs(self, stream):
+        """Wraps fetched emails into jobs until stop(), which also interrupts a fetch waiting in IDLE."""
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        fetch: Optional[asyncio.Future] = None
+        try:
+            while True:
+                fetch = asyncio.ensure_future(anext(stream))
+                await asyncio.wait({fetch, stopping}, return_when=asyncio.FIRST_COMPLETED)
+                if not fetch.done():
+                    return
                 try:
-                    await self.handle_email(email_message, smtp_conn)
-                    break  # success
-                except Exception as e:
-                    retries += 1
-                    logger.warning(f"Retry {retries}/{self.max_retries} for {email_message.sender}: {e}")
-                    await asyncio.sleep(1 * retries)  # exponential backoff
+                    fetched = fetch.result()
+                except StopAsyncIteration:
+                    return
+                self.in_flight += 1
+                yield EmailJob(fetched=fetched)
+        finally:
+            stopping.cancel()
+            if fetch is not None and not fetch.done():
+                fetch.cancel()
+                with suppress(asyncio.CancelledError, StopAsyncIteration):
+                    await fetch
+            await stream.aclose()
 
     @staticmethod
     async def safe_parse_email(raw: bytes) -> EmailMessage | None:
@@ -82,37 +334,358 @@ class PropertyManagerAi:
             logger.error(f"Failed to parse email: {e}")
             return None
 
-    async def handle_email(self, email_message: EmailMessage, smtp_conn):
-        """Generate LLM response and send email using a persistent SMTP connection."""
-        logger.info(f"Processing email from {email_message.sender}, subject: {email_message.subject}")
+    # ---------- PIPELINE STAGES ---------- #
+
+    async def _parse_stage(self, job: EmailJob) -> EmailJob | None:
+        job.email_message = await self.safe_parse_email(job.fetched.raw)
+        if not job.email_message:
+            self._commit(job, failed=True)
+            return None
+
+        # The raw bytes are no longer needed; don't hold them while queued
+        job.fetched = job.fetched._replace(raw=b"")
+        job.key = self._email_key(job)
+        logger.info(f"Processing email from {job.email_message.sender}, subject: {job.email_message.subject}")
+
+        if self.journal is not None:
+            job.resumed = await self.journal.get(job.key)
+        if job.resumed is not None:
+            if job.resumed.reached(REPLIED):
+                # Answered before a restart, but the commit never made it to the sync state
+                logger.info(f"Email from {job.email_message.sender} was already answered, marking it done")
+                self._commit(job)
+                return None
+            logger.info(f"Resuming email from {job.email_message.sender} after stage {job.resumed.stage}")
+            job.llm_response = job.resumed.llm_response
+        return job
+
+    async def _enrich_stage(self, job: EmailJob) -> EmailJob:
+        job.context = await self._get_context(job.email_message.sender)
+        job.priority = estimate_priority(job.email_message, job.context)
+        return job
+
+    async def _classify_stage(self, job: EmailJob) -> EmailJob:
+        if job.llm_response is not None:
+            # Restored from the journal
+            return job
+        job.llm_response = self.pre_classifier.classify(job.email_message, job.context)
+        if job.llm_response is not None:
+            logger.info(f"Fast path answered email from {job.email_message.sender} without an LLM call")
+        return job
+
+    async def _coalesce_stage(self, job: EmailJob) -> EmailJob | None:
+        """
+        Folds a follow-up into the open conversation it belongs to, as long as
+        the leader's LLM call has not started: the follow-up's text is appended
+        to the leader's body so the single call sees both, and it gets no call,
+        ticket or reply of its own. Once the call is under way its prompt is
+        fixed, so a later follow-up is answered on its own and leads the
+        conversation from then on.
+        """
+        if job.llm_response is not None:
+            # Fast-path mail costs nothing to answer on its own
+            return job
+        group = self.coalescer.add(job.email_message, job)
+        if group is None:
+            return job
+
+        leader: EmailJob = group.leader
+        if leader.llm_started or leader.done:
+            logger.info(
+                f"Follow-up from {job.email_message.sender} (subject: {job.email_message.subject}) "
+                f"arrived after its conversation's LLM call started, processing it on its own"
+            )
+            self.coalescer.lead(group, job)
+            return job
+
+        logger.info(
+            f"Coalescing email from {job.email_message.sender} (subject: {job.email_message.subject}) "
+            f"into conversation of {group.size} messages"
+        )
+        leader.email_message = leader.email_message.model_copy(update={
+            "body": f"{leader.email_message.body}\n\nFollow-up from the sender:\n{job.email_message.body}",
+        })
+        leader.priority = min(leader.priority, job.priority)
+        leader.followers.append(job.fetched)
+        return None
+
+    @property
+    def backlog(self) -> int:
+        """Emails found unread but not yet answered: still on the server or inside the pipeline."""
+        return self.imap.unfetched + self.in_flight
+
+    async def _batch_stage(self, job: EmailJob) -> EmailJob | None:
+        """
+        Answers non-urgent mail through the Batch API while the backlog is over
+        the threshold; once a batch is full the next one starts filling. Only
+        past `batch_max_pending` waiting emails does more mail go realtime.
+        A batched email does not hold a worker while its batch runs: it is
+        deferred and rejoins the pipeline at the dispatch stage. An email
+        whose batch was submitted before a restart waits for that batch.
+        Everything else goes straight on to the realtime LLM stage, which
+        skips the call for jobs that already carry a response.
+        """
+        if job.llm_response is not None:
+            return job
+        batch_id = await self.journal.get_batch(job.key) if self.journal is not None else None
+        if batch_id is None and (
+            self.stopping
+            or job.priority < Priority.normal
+            or self.backlog < self.batch_threshold
+            or self.batcher.pending >= self.batch_max_pending
+        ):
+            return job
+
+        # Follow-ups arriving from now on are not part of the prompt and get their own reply
+        job.llm_started = True
+        if batch_id is not None:
+            answer = self.batcher.resume(batch_id, job.email_message, job.context, custom_id=job.key)
+        else:
+            answer = self.batcher.generate(job.email_message, job.context, custom_id=job.key)
+        return self.pipeline.defer(job, self._answer_from_batch(job, answer), resume_at="dispatch")
+
+    async def _answer_from_batch(self, job: EmailJob, answer: Awaitable[LLMResponse]) -> EmailJob | None:
+        """Deferred part of the batch stage: waits for the batch, then does what the LLM stage would."""
+        try:
+            job.llm_response = await answer
+        except LLMResponseError as e:
+            logger.error(f"Not replying to email from {job.email_message.sender}: {e}")
+            self._commit(job, failed=True)
+            return None
+        await self._checkpoint(job, CLASSIFIED, llm_response=job.llm_response)
+        job.priority = final_priority(job.llm_response.intent, job.priority)
+        return job
+
+    async def _llm_stage(self, job: EmailJob) -> EmailJob | None:
+        job.llm_started = True
+        if job.llm_response is None:
+            try:
+                job.llm_response = await self.llm.generate_response_async(
+                    email=job.email_message, context=job.context,
+                    on_intent=(lambda intent, action_items: self._dispatch_early(job, intent, action_items))
+                    if self.llm.stream else None,
+                )
+            except LLMResponseError as e:
+                # Already retried and repaired inside the client; better no reply than a wrong one
+                logger.error(f"Not replying to email from {job.email_message.sender}: {e}")
+                self._commit(job, failed=True)
+                return None
+            await self._checkpoint(job, CLASSIFIED, llm_response=job.llm_response)
+        job.priority = final_priority(job.llm_response.intent, job.priority)
+        return job
 
-        context = await self._get_context(email_message.sender)
+    def _dispatch_early(self, job: EmailJob, intent: Intent, action_items: List[dict]) -> None:
+        """
+        Raises the priority for a streamed intent and starts the handlers
+        registered as early-safe; the dispatch stage waits for them later.
+        Tickets wait for the validated response, since the streamed intent
+        can still change or fail validation.
+        """
+        job.priority = final_priority(intent, job.priority)
+        if job.early_dispatch is not None or not self.dispatcher.has_handlers(intent, early_only=True):
+            # A retried LLM call reports its intent again; the first dispatch stands
+            return
+        logger.info(f"Intent {intent.value} for email from {job.email_message.sender} known early, starting workflows")
+        job.early_dispatch = asyncio.create_task(self._trigger_workflows(
+            llm_response=LLMResponse(reply="", intent=intent, action_items=action_items),
+            context=job.context, email_message=job.email_message, idempotency_key=job.key,
+            fetched=job.fetched, early_only=True,
+        ))
 
-        # LLM call is async
-        llm_response = await self.llm.generate_response_async(email=email_message, context=context)
+    async def _dispatch_stage(self, job: EmailJob) -> EmailJob:
+        if job.resumed is not None and job.resumed.reached(TICKETED):
+            # Tickets were filed before a restart; filing them again would duplicate them
+            return job
+        early, job.early_dispatch = job.early_dispatch, None
+        if early is not None:
+            try:
+                await early
+            except Exception as e:
+                # Early handlers that failed run again below with the rest
+                logger.warning(f"Early workflow dispatch failed: {e}")
+        # Handlers that already succeeded early are skipped by the idempotency key
+        await self._trigger_workflows(
+            llm_response=job.llm_response, context=job.context, email_message=job.email_message,
+            idempotency_key=job.key, fetched=job.fetched,
+        )
+        await self._checkpoint(job, TICKETED)
+        return job
+
+    async def _send_stage(self, job: EmailJob) -> EmailJob:
+        if not job.llm_response.reply:
+            # Auto-replies and receipts get no answer
+            self._commit(job)
+            return job
 
-        await self._trigger_workflows(llm_response=llm_response, context=context, email_message=email_message)
+        to = job.email_message.sender
+        cc = self.data_repo.get_stakeholders_for_intent(job.llm_response.intent)
+        subject = f"Re: {job.email_message.subject}"
 
-        # Send reply
-        await self.smtp.send_email_async(
-            to=email_message.sender,
-            cc=self.data_repo.get_stakeholders_for_intent(llm_response.intent),
-            subject=f"Re: {email_message.subject}",
-            body=llm_response.reply,
-            connection=smtp_conn
+        if self.outbox is not None:
+            # Durably queued counts as done: delivery retries belong to the outbox
+            await self.outbox.enqueue(OutboundMessage(
+                message_id=self._reply_message_id(job),
+                to=to, cc=cc, subject=subject, body=job.llm_response.reply,
+            ))
+            await self._checkpoint(job, REPLIED)
+            self._commit(job)
+            return job
+
+        sent = await self.smtp.send_email_async(
+            to=to, cc=cc, subject=subject, body=job.llm_response.reply, message_id=self._reply_message_id(job),
         )
+        if not sent:
+            # Retried by the stage, then handed back by _on_send_error
+            raise ConnectionError(f"SMTP server did not accept the reply to {to}")
+        await self._checkpoint(job, REPLIED)
+        # Only now is the message done; the sync mark may move past it
+        self._commit(job)
+        return job
+
+    def _commit(self, job: EmailJob, failed: bool = False) -> None:
+        """Marks the email and any follow-ups coalesced into it as done."""
+        job.done = True
+        self._drop_early_dispatch(job)
+        self.in_flight -= 1 + len(job.followers)
+        self.imap.commit(job.fetched.uid, failed=failed)
+        for follower in job.followers:
+            self.imap.commit(follower.uid, failed=failed)
+        job.followers.clear()
+
+    def _release(self, job: EmailJob) -> None:
+        """Hands the email and its follow-ups back unanswered; the next search fetches them again."""
+        job.done = True
+        self._drop_early_dispatch(job)
+        self.in_flight -= 1 + len(job.followers)
+        self.imap.release(job.fetched.uid)
+        for follower in job.followers:
+            self.imap.release(follower.uid)
+        job.followers.clear()
+
+    @staticmethod
+    def _drop_early_dispatch(job: EmailJob) -> None:
+        """Cancels early workflows of an email that will not be dispatched, e.g. after a failed LLM call."""
+        early, job.early_dispatch = job.early_dispatch, None
+        if early is None:
+            return
+        if not early.done():
+            early.cancel()
+        elif not early.cancelled() and early.exception() is not None:
+            logger.warning(f"Early workflow dispatch failed: {early.exception()}")
+
+    async def _checkpoint(self, job: EmailJob, stage: str, llm_response: LLMResponse | None = None) -> None:
+        """Journals a completed stage; a failed write only costs repeating the stage after a restart."""
+        if self.journal is None:
+            return
+        try:
+            await self.journal.record(job.key, stage, uid=job.fetched.uid, llm_response=llm_response)
+        except Exception as e:
+            logger.warning(f"Failed to journal stage {stage} for email from {job.email_message.sender}: {e}")
+
+    def _reply_message_id(self, job: EmailJob) -> str:
+        """Same incoming email, same reply Message-ID, so a replay is deduplicated by the outbox."""
+        domain = self.smtp.user.rpartition("@")[2] or "localhost"
+        return make_message_id(job.key, domain=domain)
+
+    @staticmethod
+    def _email_key(job: EmailJob) -> str:
+        """
+        Identifies the incoming email across retries and restarts; computed
+        once per job, see `EmailJob.key`. Without sync state there is no UID,
+        so the email's own Message-ID tells two identical messages apart; a
+        message with neither gets a key that only lasts while it is in flight.
+        """
+        email = job.email_message
+        if job.fetched.uid is not None:
+            fetch = f"uid:{job.fetched.uid}"
+        elif email.message_id:
+            fetch = f"message-id:{email.message_id}"
+        else:
+            fetch = f"fetch:{uuid.uuid4().hex}"
+        parts = (fetch, email.sender, email.subject, email.body)
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _job_priority(job: EmailJob) -> int:
+        return job.priority
+
+    async def _on_stage_error(self, job: EmailJob, error: Exception):
+        if job.done:
+            # Failed after it was already committed, e.g. in the send stage's bookkeeping
+            return
+        sender = job.email_message.sender if job.email_message else "unknown sender"
+        logger.error(f"Dropping email from {sender}: {error}")
+        self._commit(job, failed=True)
+
+    async def _on_send_error(self, job: EmailJob, error: Exception):
+        """
+        A reply that could not be sent is not given up on: the email stays
+        pending in the sync state, is fetched again by the next search and
+        resumes from its journal checkpoint, up to `SyncState.MAX_RELEASES`
+        times. Without a UID to hand back it is dropped as before.
+        """
+        if job.done or job.fetched.uid is None or self.imap.sync_state is None:
+            await self._on_stage_error(job, error)
+            return
+        logger.warning(f"Reply to {job.email_message.sender} not sent, retrying the email later: {error}")
+        self._release(job)
 
     async def _get_context(self, sender: str):
-        """Retrieve context using executor to avoid blocking."""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, self.data_repo.get_full_context_for_email, sender)
+        """Retrieve context without blocking; each repository decides whether it needs an executor."""
+        with CONTEXT_SECONDS.time():
+            return await self.data_repo.get_full_context_for_email_async(sender)
+
+    # ---------- OBSERVABILITY ---------- #
+
+    def _trace_stage(self, stage: str, job: EmailJob, waited: float, seconds: float, outcome: str) -> None:
+        """Pipeline observer: records the stage span and writes the trace once the email leaves the pipeline."""
+        now = time.monotonic()
+        job.spans.append({
+            "stage": stage,
+            "start": round(now - seconds - waited - job.received_at, 6),
+            "wait": round(waited, 6),
+            "seconds": round(seconds, 6),
+            "outcome": outcome,
+        })
+        if outcome in ("passed", "deferred") and stage != self.pipeline.stages[-1].name:
+            return
+        self.tracer.finish({
+            "mailbox": self.name,
+            "uid": job.fetched.uid,
+            "sender": job.email_message.sender if job.email_message else None,
+            "intent": job.llm_response.intent.value if job.llm_response else None,
+            "priority": job.priority.name,
+            "outcome": "done" if outcome == "passed" else "coalesced" if stage == "coalesce" else outcome,
+            "last_stage": stage,
+            "followers": len(job.followers),
+            "total_seconds": round(now - job.received_at, 6),
+            "spans": job.spans,
+        })
+
+    def _collect_metrics(self) -> Iterator[Sample]:
+        """Scrape-time gauges: queue depths plus the numeric stats of the components beside the stages."""
+        for stage in self.pipeline.stages:
+            depth = stage.queue.qsize() if stage.queue is not None else 0
+            yield "pipeline_queue_depth", {"mailbox": self.name, "stage": stage.name}, depth
+        for component, get_stats in self.pipeline.extra_stats.items():
+            for stat, value in get_stats().items():
+                if isinstance(value, (int, float)):
+                    yield "component_stat", {"mailbox": self.name, "component": component, "stat": stat}, value
 
-    async def _trigger_workflows(self, email_message, context, llm_response):
-        workflow_result = self.dispatcher.dispatch(
+    async def _trigger_workflows(self, email_message, context, llm_response, idempotency_key=None,
+                                 fetched: FetchedEmail | None = None, early_only: bool = False):
+        # Retries of the dispatch stage reuse the key and only re-run failed handlers
+        attachments = fetched.attachments if fetched is not None and fetched.uid is not None else ()
+        workflow_result = await self.dispatcher.dispatch(
             intent=llm_response.intent,
-            action_items=llm_response.action_items,
+            action_items=[item.model_dump() for item in llm_response.action_items],
             email_message=email_message,
-            context=context
+            context=context,
+            idempotency_key=idempotency_key,
+            # Handlers download attachments they need, e.g. a photo of the damage, on demand
+            attachments=attachments,
+            fetch_attachment=partial(self.imap.fetch_part, fetched.uid) if attachments else None,
+            early_only=early_only,
         )
 
         if workflow_result:
@@ -0,0 +1,258 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.mailboxes import MailboxConfig
+from core.metrics import MetricsServer
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+# Builds the processor for one mailbox inside a worker process. Must be a
+# module-level function so it can be pickled to the workers.
+ProcessorFactory = Callable[[MailboxConfig], Any]
+
+# Counters that add up across mailboxes; everything else is recomputed
+SUMMED_STAGE_FIELDS = ("processed", "dropped", "failed", "retried", "queue_depth", "workers", "throughput")
+
+
+async def _run_mailbox(mailbox: MailboxConfig, processor) -> None:
+    """Keeps one mailbox's processor running, restarting it after unexpected errors, until it is stopped."""
+    backoff = 1
+    while not processor.stopping:
+        started = time.monotonic()
+        try:
+            await processor.run_forever()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"[{mailbox.name}] Processor crashed: {e}")
+        if processor.stopping:
+            break
+        if time.monotonic() - started > 60:
+            backoff = 1
+        logger.info(f"[{mailbox.name}] Restarting processor in {backoff}s")
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 60)
+
+
+async def _report_metrics(shard: int, processors: Dict[str, Any], metrics_queue, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        snapshot = {name: processor.pipeline.metrics() for name, processor in processors.items()}
+        try:
+            metrics_queue.put_nowait((shard, os.getpid(), snapshot))
+        except queue.Full:
+            pass
+
+
+async def _serve_shard(shard: int, mailboxes: List[MailboxConfig], factory: ProcessorFactory,
+                       metrics_queue, metrics_interval: float, metrics_port: Optional[int] = None) -> None:
+    processors = {mailbox.name: factory(mailbox) for mailbox in mailboxes}
+    logger.info(f"Shard {shard} (pid {os.getpid()}) serving {', '.join(processors)}")
+    if metrics_port:
+        # Each worker process has its own registry, so each gets its own scrape port
+        await MetricsServer(port=metrics_port + shard).start()
+
+    # The supervisor terminates workers with SIGTERM; every mailbox drains before the process exits
+    def stop_all() -> None:
+        for processor in processors.values():
+            processor.stop()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_all)
+
+    reporter = asyncio.create_task(_report_metrics(shard, processors, metrics_queue, metrics_interval))
+    try:
+        await asyncio.gather(*(_run_mailbox(mailbox, processors[mailbox.name]) for mailbox in mailboxes))
+    finally:
+        reporter.cancel()
+    logger.info(f"Shard {shard} (pid {os.getpid()}) stopped")
+
+
+def _worker_main(shard: int, mailboxes: List[MailboxConfig], factory: ProcessorFactory,
+                 metrics_queue, metrics_interval: float, metrics_port: Optional[int] = None) -> None:
+    """Entry point of a worker process: one event loop for all of its mailboxes."""
+    asyncio.run(_serve_shard(shard, mailboxes, factory, metrics_queue, metrics_interval, metrics_port))
+
+
+def aggregate_metrics(per_mailbox: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """
+    Sums per-stage counters across mailboxes. Average stage latency is
+    weighted by items processed.
+    """
+    totals: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for metrics in per_mailbox.values():
+        for stage, stats in metrics.get("stages", {}).items():
+            total = totals[stage]
+            for key in SUMMED_STAGE_FIELDS:
+                total[key] += stats.get(key, 0)
+            total["busy_seconds"] += stats.get("avg_seconds", 0.0) * stats.get("processed", 0)
+
+    result = {}
+    for stage, total in totals.items():
+        busy = total.pop("busy_seconds")
+        total["avg_seconds"] = busy / total["processed"] if total["processed"] else 0.0
+        result[stage] = dict(total)
+    return result
+
+
+class ShardedRunner:
+    """
+    Runs many mailboxes across a pool of worker processes.
+
+    Mailboxes are dealt round-robin to `workers` processes, each running its
+    share on its own event loop, so parsing and JSON work spread over cores.
+    The supervisor restarts any worker that dies (with backoff when it keeps
+    crashing) and aggregates the metrics the workers report.
+    """
+
+    RESTART_BACKOFF_MIN = 1
+    RESTART_BACKOFF_MAX = 60
+    # A worker that stayed up this long counts as healthy again
+    STABLE_AFTER = 60
+
+    def __init__(self, mailboxes: List[MailboxConfig], factory: ProcessorFactory, workers: Optional[int] = None,
+                 metrics_interval: float = 10, stats_interval: float = 30, metrics_port: Optional[int] = None,
+                 drain_timeout: float = 30):
+        if not mailboxes:
+            raise ValueError("ShardedRunner needs at least one mailbox")
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(mailboxes)))
+        self.shards = [mailboxes[i::self.workers] for i in range(self.workers)]
+        self.factory = factory
+        self.metrics_interval = metrics_interval
+        self.stats_interval = stats_interval
+        # Prometheus port of shard 0; shard N serves on metrics_port + N
+        self.metrics_port = metrics_port
+        # Workers get this long to drain on shutdown, plus a margin, before they are killed
+        self.drain_timeout = drain_timeout
+
+        # spawn: workers must not inherit the supervisor's event loop or sockets
+        self._ctx = multiprocessing.get_context("spawn")
+        self._metrics_queue = self._ctx.Queue(maxsize=1000)
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+        self._started_at = [0.0] * self.workers
+        self._restart_at = [0.0] * self.workers
+        self._backoff = [self.RESTART_BACKOFF_MIN] * self.workers
+        self.restarts = [0] * self.workers
+        # Latest per-mailbox report of each live worker, by (shard, pid). A worker's
+        # counters die with it, so its entry is dropped when it exits.
+        self.metrics: Dict[Tuple[int, int], Dict[str, Dict[str, Any]]] = {}
+
+    def run(self) -> None:
+        """Starts every shard and supervises them until interrupted."""
+        # Exit through the finally below, so SIGTERM reaches the workers instead of orphaning them
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        for shard in range(self.workers):
+            self._start(shard)
+
+        last_stats = time.monotonic()
+        try:
+            while True:
+                self._collect_metrics(timeout=1.0)
+                self._supervise()
+                if time.monotonic() - last_stats >= self.stats_interval:
+                    self.log_stats()
+                    last_stats = time.monotonic()
+        finally:
+            self.stop()
+
+    def _start(self, shard: int) -> None:
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(shard, self.shards[shard], self.factory, self._metrics_queue, self.metrics_interval,
+                  self.metrics_port),
+            name=f"mailbox-shard-{shard}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[shard] = process
+        self._started_at[shard] = time.monotonic()
+        logger.info(f"Started shard {shard} (pid {process.pid}): {', '.join(m.name for m in self.shards[shard])}")
+
+    def _supervise(self) -> None:
+        now = time.monotonic()
+        for shard, process in enumerate(self._processes):
+            if process is None:
+                if now >= self._restart_at[shard]:
+                    self.restarts[shard] += 1
+                    self._start(shard)
+                continue
+            if process.is_alive():
+                continue
+
+            uptime = now - self._started_at[shard]
+            if uptime >= self.STABLE_AFTER:
+                self._backoff[shard] = self.RESTART_BACKOFF_MIN
+            delay = self._backoff[shard]
+            self._backoff[shard] = min(delay * 2, self.RESTART_BACKOFF_MAX)
+            logger.error(
+                f"Shard {shard} (pid {process.pid}) exited with code {process.exitcode} "
+                f"after {uptime:.0f}s; restarting in {delay}s"
+            )
+            self._drop_metrics(shard, process.pid)
+            process.close()
+            self._processes[shard] = None
+            self._restart_at[shard] = now + delay
+
+    def _collect_metrics(self, timeout: float) -> None:
+        try:
+            report = self._metrics_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        self._record_metrics(*report)
+        while True:
+            try:
+                report = self._metrics_queue.get_nowait()
+            except queue.Empty:
+                return
+            self._record_metrics(*report)
+
+    def _record_metrics(self, shard: int, pid: int, snapshot: Dict[str, Dict[str, Any]]) -> None:
+        process = self._processes[shard]
+        if process is None or process.pid != pid:
+            # Sent by a worker that has exited since; its counters are gone
+            return
+        self.metrics[(shard, pid)] = snapshot
+
+    def _drop_metrics(self, shard: int, pid: Optional[int]) -> None:
+        self.metrics.pop((shard, pid), None)
+
+    def aggregate(self) -> Dict[str, Dict[str, float]]:
+        """Stage totals across the mailboxes of the workers currently running."""
+        return aggregate_metrics({
+            name: metrics for snapshot in self.metrics.values() for name, metrics in snapshot.items()
+        })
+
+    def log_stats(self) -> None:
+        alive = sum(1 for p in self._processes if p is not None and p.is_alive())
+        logger.info(f"[runner] shards alive={alive}/{self.workers} restarts={sum(self.restarts)} "
+                    f"mailboxes reporting={sum(len(snapshot) for snapshot in self.metrics.values())}")
+        for stage, stats in self.aggregate().items():
+            logger.info(
+                "[all:%s] processed=%d failed=%d queue=%d throughput=%.2f/s avg=%.3fs",
+                stage, stats["processed"], stats["failed"], stats["queue_depth"],
+                stats["throughput"], stats["avg_seconds"],
+            )
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Asks every worker to drain and exit (SIGTERM), killing those still alive after the deadline."""
+        timeout = timeout if timeout is not None else self.drain_timeout + 10
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            if process is not None:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    process.kill()
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from config.settings import settings
+from core.email.imap_reader import FetchedEmail
+from core.models import EmailMessage
+from services.property_manager_ai import EmailJob, PropertyManagerAi
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    return PropertyManagerAi(coalesce_window=60)
+
+
+def make_job(uid: int, body: str, in_reply_to=None) -> EmailJob:
+    email = EmailMessage(sender="tenant@example.com", subject="Locked out", body=body,
+                         message_id=f"{uid}@mail.example.com", in_reply_to=in_reply_to)
+    return EmailJob(fetched=FetchedEmail(uid=uid, raw=b""), email_message=email)
+
+
+def test_follow_up_before_the_llm_call_joins_the_leaders_prompt(processor):
+    leader = make_job(1, "I am locked out of 4B.")
+    follow_up = make_job(2, "Still waiting outside!!", in_reply_to="1@mail.example.com")
+
+    assert asyncio.run(processor._coalesce_stage(leader)) is leader
+    assert asyncio.run(processor._coalesce_stage(follow_up)) is None
+    assert "Still waiting outside!!" in leader.email_message.body
+    assert leader.followers == [follow_up.fetched]
+
+
+def test_follow_up_after_the_llm_call_started_is_answered_on_its_own(processor):
+    leader = make_job(1, "I am locked out of 4B.")
+    late = make_job(2, "Also, the hallway light is out.", in_reply_to="1@mail.example.com")
+    later = make_job(3, "Any update?", in_reply_to="2@mail.example.com")
+
+    asyncio.run(processor._coalesce_stage(leader))
+    leader.llm_started = True
+    prompt = leader.email_message
+
+    assert asyncio.run(processor._coalesce_stage(late)) is late
+    assert leader.email_message is prompt
+    assert leader.followers == []
+    # The late follow-up now leads the conversation
+    assert asyncio.run(processor._coalesce_stage(later)) is None
+    assert late.followers == [later.fetched]
+    assert processor.coalescer.stats()["coalesced"] == 1
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from config.settings import settings
+from core.email.imap_reader import FetchedEmail
+from core.models import EmailMessage, Intent
+from services.property_manager_ai import EmailJob, PropertyManagerAi
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    return PropertyManagerAi(llm_stream=True)
+
+
+def make_job() -> EmailJob:
+    email = EmailMessage(sender="tenant@example.com", subject="Locked out", body="I can't get into 4B.")
+    return EmailJob(fetched=FetchedEmail(uid=1, raw=b""), email_message=email)
+
+
+def test_streamed_intent_files_no_ticket_before_validation(processor):
+    async def scenario():
+        job = make_job()
+        processor._dispatch_early(job, Intent.locked_out, [])
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.early_dispatch is None
+    assert job.priority == 0
+
+
+def test_failed_email_cancels_its_early_dispatch(processor):
+    started = []
+
+    @processor.dispatcher.handler(Intent.locked_out, early=True)
+    async def page_on_call(event):
+        started.append(event.idempotency_key)
+        await asyncio.sleep(60)
+
+    async def scenario():
+        job = make_job()
+        processor.in_flight += 1
+        processor._dispatch_early(job, Intent.locked_out, [])
+        early = job.early_dispatch
+        while not started:
+            await asyncio.sleep(0.01)
+        # As on the LLMResponseError path of the LLM stage
+        processor._commit(job, failed=True)
+        with pytest.raises(asyncio.CancelledError):
+            await early
+        return job
+
+    job = asyncio.run(scenario())
+    assert len(started) == 1
+    assert job.early_dispatch is None
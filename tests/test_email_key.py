@@ -0,0 +1,27 @@
+from core.email.imap_reader import FetchedEmail
+from core.models import EmailMessage
+from services.property_manager_ai import EmailJob, PropertyManagerAi
+
+
+def make_job(uid=None, message_id=None) -> EmailJob:
+    email = EmailMessage(sender="tenant@example.com", subject="Leak", body="Water under the sink.",
+                         message_id=message_id)
+    return EmailJob(fetched=FetchedEmail(uid=uid, raw=b""), email_message=email)
+
+
+def test_same_email_keeps_its_key():
+    job = make_job(uid=7)
+    assert PropertyManagerAi._email_key(job) == PropertyManagerAi._email_key(job)
+    assert PropertyManagerAi._email_key(job) == PropertyManagerAi._email_key(make_job(uid=7))
+
+
+def test_identical_emails_without_uid_are_told_apart_by_message_id():
+    first = make_job(message_id="a@mail.example.com")
+    second = make_job(message_id="b@mail.example.com")
+    assert PropertyManagerAi._email_key(first) != PropertyManagerAi._email_key(second)
+    assert PropertyManagerAi._email_key(first) == PropertyManagerAi._email_key(make_job(message_id="a@mail.example.com"))
+
+
+def test_identical_emails_without_uid_or_message_id_get_distinct_keys():
+    first, second = make_job(), make_job()
+    assert PropertyManagerAi._email_key(first) != PropertyManagerAi._email_key(second)
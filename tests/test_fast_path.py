@@ -0,0 +1,31 @@
+import pytest
+
+from core.fast_path import FastPathClassifier
+from core.models import EmailMessage
+
+
+def category(body: str, subject: str = "Re: your request"):
+    return FastPathClassifier().category(EmailMessage(sender="tenant@example.com", subject=subject, body=body))
+
+
+@pytest.mark.parametrize("body", [
+    "Thanks!",
+    "Thank you so much for your help.",
+    "Thanks\nAnna",
+    "Many thanks\n- Anna Smith",
+    "Thank you for the update!\n\nBest,\nJohn",
+    "thx\n— Mary Ann Jones",
+])
+def test_plain_thank_you_notes_are_answered_from_the_template(body):
+    assert category(body) == "thanks"
+
+
+@pytest.mark.parametrize("body", [
+    "Thanks for your help\nThe window in 4B won't close",
+    "Thanks\nThe front door buzzer is dead",
+    "Got it\nbut the elevator is stuck again",
+    "Thanks for your help fixing the sink yesterday",
+    "Thanks\nAnna\nAlso the dryer is making noise",
+])
+def test_thank_you_with_a_request_goes_to_the_llm(body):
+    assert category(body) is None
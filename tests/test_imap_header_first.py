@@ -0,0 +1,49 @@
+import asyncio
+from email.message import EmailMessage
+
+from benchmarks.fake_servers import FakeImapServer
+from core.email.imap_reader import IMAPReader
+
+PHOTO = b"\xff\xd8\xff\xe0" + bytes(range(256)) * 8
+
+
+def make_email(body=None) -> bytes:
+    message = EmailMessage()
+    message["From"] = "tenant@example.com"
+    message["To"] = "manager@example.com"
+    message["Subject"] = "Water damage"
+    if body is not None:
+        message.set_content(body)
+    message.add_attachment(PHOTO, maintype="image", subtype="jpeg", filename="ceiling.jpg")
+    return message.as_bytes()
+
+
+def make_reader(server: FakeImapServer) -> IMAPReader:
+    reader = IMAPReader(host="127.0.0.1", user="manager@example.com", password="x", header_first=True)
+    reader.port, reader.use_ssl = server.port, False
+    return reader
+
+
+def test_header_first_marks_every_message_seen_and_leaves_attachments_on_the_server():
+    async def scenario():
+        server = FakeImapServer()
+        await server.start()
+        try:
+            server.deliver(make_email("The ceiling is dripping, photo attached."))
+            # Only a photo: no text part to fetch
+            server.deliver(make_email())
+            reader = make_reader(server)
+            fetched = [email async for email in reader.fetch_unread_stream()]
+            again = [email async for email in reader.fetch_unread_stream()]
+            photo = await reader.fetch_part(fetched[1].uid, fetched[1].attachments[0])
+            return server, fetched, again, photo
+        finally:
+            await server.stop()
+
+    server, fetched, again, photo = asyncio.run(scenario())
+    assert [email.uid for email in fetched] == [1, 2]
+    assert all("\\Seen" in message.flags for message in server.messages)
+    assert again == []
+    assert PHOTO not in fetched[0].raw
+    assert [part.filename for part in fetched[1].attachments] == ["ceiling.jpg"]
+    assert photo == PHOTO
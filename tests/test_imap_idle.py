@@ -0,0 +1,75 @@
+import asyncio
+import time
+from email.message import EmailMessage
+
+from benchmarks.fake_servers import FakeImapServer
+from core.email.imap_reader import IMAPReader
+
+
+def make_email(subject: str = "Sink is leaking", body: str = "Water everywhere in the kitchen.") -> bytes:
+    message = EmailMessage()
+    message["From"] = "tenant@example.com"
+    message["To"] = "manager@example.com"
+    message["Subject"] = subject
+    message.set_content(body)
+    return message.as_bytes()
+
+
+def make_reader(server: FakeImapServer) -> IMAPReader:
+    reader = IMAPReader(host="127.0.0.1", user="manager@example.com", password="x")
+    reader.port, reader.use_ssl = server.port, False
+    return reader
+
+
+async def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("condition not met")
+        await asyncio.sleep(0.01)
+
+
+def test_idle_delivers_new_mail_without_waiting_for_the_poll_interval():
+    async def scenario():
+        server = FakeImapServer()
+        await server.start()
+        reader = make_reader(server)
+        # A poll interval far above the assertion below: only the IDLE push can be this fast
+        stream = reader.watch_unread_stream(poll_interval=30)
+        fetch = asyncio.ensure_future(anext(stream))
+        try:
+            await wait_until(lambda: server._idling)
+            delivered_at = time.monotonic()
+            server.deliver(make_email())
+            fetched = await asyncio.wait_for(fetch, timeout=5)
+            return fetched, time.monotonic() - delivered_at
+        finally:
+            fetch.cancel()
+            await stream.aclose()
+            await server.stop()
+
+    fetched, latency = asyncio.run(scenario())
+    assert b"Sink is leaking" in fetched.raw
+    assert latency < 1.0
+
+
+def test_idle_keeps_streaming_later_arrivals():
+    async def scenario():
+        server = FakeImapServer()
+        await server.start()
+        stream = make_reader(server).watch_unread_stream(poll_interval=30)
+        subjects = []
+        try:
+            for index in range(3):
+                fetch = asyncio.ensure_future(anext(stream))
+                await wait_until(lambda: server._idling)
+                server.deliver(make_email(subject=f"Request {index}"))
+                fetched = await asyncio.wait_for(fetch, timeout=5)
+                subjects.append(fetched.raw)
+        finally:
+            await stream.aclose()
+            await server.stop()
+        return subjects
+
+    raws = asyncio.run(scenario())
+    assert [f"Request {i}".encode() in raw for i, raw in enumerate(raws)] == [True, True, True]
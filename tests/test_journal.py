@@ -0,0 +1,50 @@
+import asyncio
+from email.message import EmailMessage
+
+import pytest
+
+from config.settings import settings
+from core.email.imap_reader import FetchedEmail
+from core.email.journal import CLASSIFIED
+from services.property_manager_ai import EmailJob, PropertyManagerAi
+
+
+def make_email(message_id: str, body: str, in_reply_to=None) -> bytes:
+    message = EmailMessage()
+    message["From"] = "tenant@example.com"
+    message["To"] = "manager@example.com"
+    message["Subject"] = "Locked out"
+    message["Message-ID"] = message_id
+    if in_reply_to:
+        message["In-Reply-To"] = in_reply_to
+    message.set_content(body)
+    return message.as_bytes()
+
+
+@pytest.fixture
+def processor(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    return PropertyManagerAi(journal_path=str(tmp_path / "journal.sqlite3"))
+
+
+def test_checkpoint_of_a_coalesced_leader_is_found_when_the_email_is_refetched(processor):
+    leader_raw = make_email("<1@mail.example.com>", "I am locked out of 4B.")
+    follow_up_raw = make_email("<2@mail.example.com>", "Still outside!!", in_reply_to="<1@mail.example.com>")
+
+    async def scenario():
+        leader = await processor._parse_stage(EmailJob(fetched=FetchedEmail(uid=1, raw=leader_raw)))
+        follow_up = await processor._parse_stage(EmailJob(fetched=FetchedEmail(uid=2, raw=follow_up_raw)))
+        await processor._coalesce_stage(leader)
+        await processor._coalesce_stage(follow_up)
+        assert "Still outside!!" in leader.email_message.body
+        await processor._checkpoint(leader, CLASSIFIED)
+
+        # After a restart the leader is fetched again, without the follow-up folded in
+        refetched = await processor._parse_stage(EmailJob(fetched=FetchedEmail(uid=1, raw=leader_raw)))
+        return leader, refetched
+
+    leader, refetched = asyncio.run(scenario())
+    assert refetched.key == leader.key
+    assert refetched.resumed is not None
+    assert refetched.resumed.stage == CLASSIFIED
+    assert processor._reply_message_id(refetched) == processor._reply_message_id(leader)
@@ -0,0 +1,168 @@
+import asyncio
+
+from benchmarks.fake_servers import FakeOpenAIServer
+from config.settings import settings
+from core.email.imap_reader import FetchedEmail
+from core.llm_batch import LLMBatcher
+from core.llm_client import LLMClient
+from core.models import EmailMessage, Intent
+from services.pipeline import Pipeline, Stage
+from services.property_manager_ai import EmailJob, PropertyManagerAi
+
+EMAILS = {
+    Intent.locked_out: EmailMessage(sender="a@example.com", subject="Help", body="I am locked out of 4B."),
+    Intent.maintenance: EmailMessage(sender="b@example.com", subject="Kitchen", body="The sink has a leak."),
+    Intent.rent: EmailMessage(sender="c@example.com", subject="Question", body="What is my rent balance?"),
+}
+
+
+def run_batch(monkeypatch, server: FakeOpenAIServer):
+    """Sends every email through one batch job; returns the responses by expected intent and the batcher stats."""
+    async def scenario():
+        await server.start()
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+        llm = LLMClient()
+        batcher = LLMBatcher(llm, max_batch_size=len(EMAILS), max_wait=60, poll_interval=0.01)
+        try:
+            responses = await asyncio.wait_for(
+                asyncio.gather(*(batcher.generate(email, None) for email in EMAILS.values())), timeout=10,
+            )
+            return dict(zip(EMAILS, responses)), batcher.stats()
+        finally:
+            await batcher.close()
+            await llm.close()
+            await server.stop()
+
+    return asyncio.run(scenario())
+
+
+def test_full_batch_is_submitted_polled_and_mapped_back_to_each_caller(monkeypatch):
+    server = FakeOpenAIServer(latency=0.01, jitter=0, batch_latency=0.1)
+    responses, stats = run_batch(monkeypatch, server)
+
+    # Submitted as soon as it was full, not after max_wait, and polled until done
+    assert len(server.batches) == 1
+    assert [batch["status"] for batch in server.batches.values()] == ["completed"]
+    assert server.batched_requests == len(EMAILS)
+    assert server.requests == 0
+    assert {intent: response.intent for intent, response in responses.items()} == {i: i for i in EMAILS}
+    assert stats["submitted"] == 1
+    assert stats["answered"] == len(EMAILS)
+    assert stats["fallbacks"] == 0
+    assert stats["running"] == 0
+
+
+def test_failed_requests_fall_back_to_realtime(monkeypatch):
+    server = FakeOpenAIServer(latency=0.01, jitter=0, batch_latency=0.05, batch_error_rate=1.0)
+    responses, stats = run_batch(monkeypatch, server)
+
+    assert [batch["request_counts"]["failed"] for batch in server.batches.values()] == [len(EMAILS)]
+    assert server.requests == len(EMAILS)
+    assert {intent: response.intent for intent, response in responses.items()} == {i: i for i in EMAILS}
+    assert stats["answered"] == 0
+    assert stats["fallbacks"] == len(EMAILS)
+
+
+def test_expired_batch_keeps_its_answers_and_sends_the_rest_realtime(monkeypatch):
+    server = FakeOpenAIServer(latency=0.01, jitter=0, batch_latency=0.05, batch_expire_after=1)
+    responses, stats = run_batch(monkeypatch, server)
+
+    assert [batch["status"] for batch in server.batches.values()] == ["expired"]
+    assert server.requests == len(EMAILS) - 1
+    assert {intent: response.intent for intent, response in responses.items()} == {i: i for i in EMAILS}
+    assert stats["answered"] == 1
+    assert stats["fallbacks"] == len(EMAILS) - 1
+
+
+def make_jobs(count: int):
+    jobs = [
+        EmailJob(fetched=FetchedEmail(uid=n, raw=b""), email_message=EmailMessage(
+            sender=f"tenant{n}@example.com", subject="Kitchen", body=f"Leak number {n} under the sink."))
+        for n in range(count)
+    ]
+    for job in jobs:
+        job.key = PropertyManagerAi._email_key(job)
+    return jobs
+
+
+async def run_batch_stage(processor: PropertyManagerAi, jobs, batch_workers: int = 1):
+    """Runs the jobs through the batch stage alone; returns them as they reach dispatch."""
+    dispatched = []
+
+    async def dispatch(job):
+        dispatched.append(job)
+
+    processor.in_flight = len(jobs)
+    processor.pipeline = Pipeline([
+        Stage("batch", processor._batch_stage, batch_workers),
+        Stage("dispatch", dispatch),
+    ])
+
+    async def source():
+        for job in jobs:
+            yield job
+
+    await processor.pipeline.run(source())
+    return dispatched
+
+
+def test_backlog_past_one_full_batch_queues_the_next_batch(monkeypatch):
+    async def scenario():
+        server = FakeOpenAIServer(latency=0.01, jitter=0, batch_latency=0.1)
+        await server.start()
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+        processor = PropertyManagerAi(batch_threshold=1, batch_max_size=2, batch_max_wait=0.05,
+                                      batch_poll_interval=0.01)
+        jobs = make_jobs(5)
+        try:
+            # A single worker: batched emails must not hold it while their batch runs
+            dispatched = await asyncio.wait_for(run_batch_stage(processor, jobs), timeout=10)
+            return server, jobs, dispatched
+        finally:
+            await processor.llm.close()
+            await server.stop()
+
+    server, jobs, dispatched = asyncio.run(scenario())
+    assert sorted(job.fetched.uid for job in dispatched) == [job.fetched.uid for job in jobs]
+    assert all(job.llm_response.intent == Intent.maintenance for job in jobs)
+    # Two full batches plus the remainder after max_wait; nothing overflowed to realtime
+    assert sorted(batch["request_counts"]["total"] for batch in server.batches.values()) == [1, 2, 2]
+    assert server.requests == 0
+
+
+def test_batch_submitted_before_a_restart_is_resumed_not_resubmitted(monkeypatch, tmp_path):
+    journal_path = str(tmp_path / "journal.sqlite3")
+
+    async def scenario():
+        server = FakeOpenAIServer(latency=0.01, jitter=0, batch_latency=0.3)
+        await server.start()
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", server.base_url)
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+        before = PropertyManagerAi(batch_threshold=1, batch_max_size=3, batch_max_wait=60,
+                                   batch_poll_interval=60, journal_path=journal_path)
+        after = PropertyManagerAi(batch_threshold=1, batch_max_size=3, batch_max_wait=60,
+                                  batch_poll_interval=0.01, journal_path=journal_path)
+        try:
+            # Killed while the batch runs
+            run = asyncio.create_task(run_batch_stage(before, make_jobs(3)))
+            while not all([await before.journal.get_batch(job.key) for job in make_jobs(3)]):
+                await asyncio.sleep(0.01)
+            run.cancel()
+
+            jobs = make_jobs(3)
+            dispatched = await asyncio.wait_for(run_batch_stage(after, jobs), timeout=10)
+            return server, jobs, dispatched, after.batcher.stats()
+        finally:
+            await before.llm.close()
+            await after.llm.close()
+            await server.stop()
+
+    server, jobs, dispatched, stats = asyncio.run(scenario())
+    assert len(dispatched) == 3
+    assert all(job.llm_response.intent == Intent.maintenance for job in jobs)
+    assert len(server.batches) == 1
+    assert server.batched_requests == 3
+    assert server.requests == 0
+    assert stats["resumed"] == 3
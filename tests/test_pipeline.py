@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+from services.pipeline import Pipeline, Stage
+
+
+def test_cancelled_run_returns_even_if_a_handler_swallows_the_cancellation():
+    started = asyncio.Event()
+
+    async def swallow(item):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            pass
+
+    async def source():
+        yield 1
+
+    async def scenario():
+        run = asyncio.create_task(Pipeline([Stage("slow", swallow)]).run(source()))
+        await started.wait()
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(run, timeout=5)
+
+    asyncio.run(scenario())
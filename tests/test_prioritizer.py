@@ -0,0 +1,35 @@
+import pytest
+
+from core.models import EmailMessage, Priority
+from core.prioritizer import estimate_priority
+
+CONTEXT = {"tenant": {"name": "Maria", "unit": "4B"}}
+
+
+def priority(subject: str, body: str = "") -> Priority:
+    return estimate_priority(EmailMessage(sender="tenant@example.com", subject=subject, body=body), CONTEXT)
+
+
+@pytest.mark.parametrize("subject", [
+    "I'm locked out of 4B",
+    "Lost my keys on the way home",
+    "There is a gas leak in the basement",
+    "It smells of gas in the hallway",
+    "Fire in the laundry room!",
+    "The fire alarm going off on floor 3",
+    "Smoke coming from the vent",
+    "Water leaking through the ceiling",
+])
+def test_emergencies_are_urgent(subject):
+    assert priority(subject) == Priority.urgent
+
+
+@pytest.mark.parametrize("subject", [
+    "Can I get a new key fob?",
+    "Question about my gas bill",
+    "When is the fire drill schedule?",
+    "Smoke detector battery replacement",
+    "Spare keys for my sister",
+])
+def test_ordinary_mail_mentioning_keys_gas_or_fire_is_not_urgent(subject):
+    assert priority(subject) == Priority.normal
@@ -0,0 +1,56 @@
+import asyncio
+
+from benchmarks.fake_servers import FakeOpenAIServer
+from config.settings import settings
+from core.llm_client import LLMClient
+from core.models import EmailMessage
+from core.rate_limiter import RateLimiter
+
+EMAIL = EmailMessage(sender="tenant@example.com", subject="Broken heater", body="The heater in 4B stopped working.")
+
+
+def make_client(server: FakeOpenAIServer, monkeypatch, limiter: RateLimiter) -> LLMClient:
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    return LLMClient(limiter=limiter, max_connections=8)
+
+
+def test_concurrency_backs_off_on_429s_and_recovers(monkeypatch):
+    async def scenario():
+        server = FakeOpenAIServer(latency=0.02, jitter=0.0, rate_limit_rate=1.0, retry_after_ms=10)
+        await server.start()
+        limiter = RateLimiter(initial_concurrency=8, max_concurrency=8)
+        # Only throttling should move the limit here, not latency noise on a busy machine
+        limiter.concurrency.spike_factor = float("inf")
+        client = make_client(server, monkeypatch, limiter)
+        try:
+            await client.generate_response_async(EMAIL, None)
+            backed_off = limiter.concurrency.limit, limiter.throttled
+
+            server.rate_limit_rate = 0.0
+            for _ in range(40):
+                await client.generate_response_async(EMAIL, None)
+            return backed_off, limiter.concurrency.limit
+        finally:
+            await client.close()
+            await server.stop()
+
+    (limit_after_429s, throttled), recovered = asyncio.run(scenario())
+    # Four attempts, each answered 429: 8 -> 4 -> 2 -> 1 -> 1
+    assert throttled == LLMClient.MAX_ATTEMPTS
+    assert limit_after_429s == 1
+    assert recovered == 8
+
+
+def test_throttled_call_returns_its_token_reservation():
+    async def scenario():
+        limiter = RateLimiter(tokens_per_minute=6000)
+        async with limiter.slot(estimated_tokens=1000):
+            pass
+        reserved = limiter.tokens.level
+        limiter.on_throttle(retry_after=None, estimated_tokens=1000)
+        return reserved, limiter.tokens.level
+
+    reserved, refunded = asyncio.run(scenario())
+    assert reserved < 5100
+    assert refunded == 6000
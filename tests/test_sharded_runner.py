@@ -0,0 +1,80 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from config.mailboxes import MailboxConfig
+from services.sharded_runner import ShardedRunner, aggregate_metrics
+
+
+class _Pipeline:
+    def metrics(self):
+        return {"stages": {"llm": {"processed": 1, "failed": 0, "avg_seconds": 1.0}}}
+
+
+class _CrashOnceProcessor:
+    """Reports one llm item; the first process to run it dies, the restarted one runs until stopped."""
+
+    def __init__(self, marker: Path):
+        self.marker = marker
+        self.pipeline = _Pipeline()
+        self._stopped = asyncio.Event()
+
+    @property
+    def stopping(self) -> bool:
+        return self._stopped.is_set()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    async def run_forever(self) -> None:
+        if not self.marker.exists():
+            self.marker.touch()
+            # Long enough for a metrics report before the crash
+            await asyncio.sleep(0.5)
+            os._exit(1)
+        await self._stopped.wait()
+
+
+def crash_once_factory(mailbox: MailboxConfig) -> _CrashOnceProcessor:
+    return _CrashOnceProcessor(Path(mailbox.options["marker"]))
+
+
+def test_aggregate_sums_counters_and_weights_latency_by_items():
+    totals = aggregate_metrics({
+        "holland-ave": {"stages": {"llm": {"processed": 3, "failed": 1, "queue_depth": 2, "avg_seconds": 1.0}}},
+        "main-st": {"stages": {"llm": {"processed": 1, "failed": 0, "queue_depth": 5, "avg_seconds": 5.0}}},
+    })
+    assert totals["llm"]["processed"] == 4
+    assert totals["llm"]["failed"] == 1
+    assert totals["llm"]["queue_depth"] == 7
+    assert totals["llm"]["avg_seconds"] == pytest.approx(2.0)
+
+
+def test_restarted_shard_replaces_the_dead_workers_metrics(monkeypatch, tmp_path):
+    monkeypatch.setattr(ShardedRunner, "RESTART_BACKOFF_MIN", 0)
+    mailbox = MailboxConfig(name="holland-ave", options={"marker": str(tmp_path / "crashed")})
+    runner = ShardedRunner([mailbox], crash_once_factory, workers=1, metrics_interval=0.05)
+    runner._start(0)
+    first_pid = runner._processes[0].pid
+    reported_before_crash = False
+    try:
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            runner._collect_metrics(timeout=0.05)
+            reported_before_crash |= (0, first_pid) in runner.metrics
+            runner._supervise()
+            process = runner._processes[0]
+            if process is not None and process.pid != first_pid and (0, process.pid) in runner.metrics:
+                break
+        else:
+            pytest.fail("restarted shard never reported")
+
+        assert reported_before_crash
+        assert runner.restarts == [1]
+        assert list(runner.metrics) == [(0, runner._processes[0].pid)]
+        assert runner.aggregate()["llm"]["processed"] == 1
+    finally:
+        runner.stop(timeout=10)
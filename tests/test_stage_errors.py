@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from config.settings import settings
+from core.email.imap_reader import FetchedEmail
+from core.models import Intent, LLMResponse
+from services.property_manager_ai import PropertyManagerAi
+
+RAW = (
+    b"From: tenant@example.com\r\nTo: office@example.com\r\nSubject: Leak\r\n"
+    b"Message-ID: <leak@example.com>\r\n\r\nWater under the sink.\r\n"
+)
+
+
+@pytest.fixture
+def processor(monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    return PropertyManagerAi()
+
+
+def test_email_failing_in_a_middle_stage_is_committed_as_failed(processor, monkeypatch):
+    commits = []
+    monkeypatch.setattr(processor.imap, "commit", lambda uid, failed=False: commits.append((uid, failed)))
+
+    def classify(email, context):
+        raise RuntimeError("classifier crashed")
+
+    monkeypatch.setattr(processor.pre_classifier, "classify", classify)
+
+    async def fetched():
+        yield FetchedEmail(uid=42, raw=RAW)
+
+    asyncio.run(asyncio.wait_for(processor.pipeline.run(processor._jobs(fetched())), timeout=10))
+    assert commits == [(42, True)]
+    assert processor.in_flight == 0
+
+
+def test_email_whose_reply_was_not_sent_stays_pending_for_a_retry(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "test")
+    processor = PropertyManagerAi(max_retries=0, sync_state_path=str(tmp_path / "sync.json"))
+    state = processor.imap.sync_state
+    state.reset(uidvalidity=1, last_uid=41)
+    state.claim([42])
+
+    async def send_email_async(**kwargs):
+        return False
+
+    monkeypatch.setattr(processor.smtp, "send_email_async", send_email_async)
+    monkeypatch.setattr(processor.pre_classifier, "classify",
+                        lambda email, context: LLMResponse(reply="We'll send someone.", intent=Intent.general))
+
+    async def fetched():
+        yield FetchedEmail(uid=42, raw=RAW)
+
+    asyncio.run(asyncio.wait_for(processor.pipeline.run(processor._jobs(fetched())), timeout=10))
+    assert processor.in_flight == 0
+    assert state.last_uid == 41
+    assert state.failed == []
+    # The next search hands it out again
+    assert state.claim([42]) == [42]
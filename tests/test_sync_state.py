@@ -0,0 +1,100 @@
+import asyncio
+
+from core.email.sync_state import SyncState
+
+
+def test_commit_advances_mark_over_contiguous_uids(tmp_path):
+    state = SyncState(tmp_path / "sync.json")
+    state.reset(uidvalidity=1, last_uid=0)
+    state.claim([1, 2, 3])
+
+    state.commit(2)
+    assert state.last_uid == 0
+    state.commit(1)
+    assert state.last_uid == 2
+    assert state.done == set()
+
+
+def test_released_uid_holds_the_mark_until_it_is_fetched(tmp_path):
+    state = SyncState(tmp_path / "sync.json")
+    state.reset(uidvalidity=1, last_uid=0)
+    state.claim([1, 2, 3, 4])
+
+    # The FETCH for UID 2 failed; it is handed back, not lost
+    state.release(2)
+    for uid in (1, 3, 4):
+        state.commit(uid)
+    assert state.last_uid == 1
+    assert state.done == {3, 4}
+
+    # The next `UID 2:*` search still finds it
+    assert state.claim([2, 3, 4]) == [2]
+    state.commit(2)
+    assert state.last_uid == 4
+    assert state.pending == set()
+    assert state.done == set()
+
+
+def test_released_uid_is_dropped_once_a_search_shows_it_gone(tmp_path):
+    state = SyncState(tmp_path / "sync.json")
+    state.reset(uidvalidity=1, last_uid=0)
+    state.claim([1, 2, 3])
+    state.release(2)
+    state.commit(1)
+    state.commit(3)
+
+    # Deleted from the mailbox before the retry
+    assert state.claim([3]) == []
+    assert state.last_uid == 3
+    assert state.pending == set()
+
+
+def test_uid_that_keeps_failing_is_given_up_on_as_failed(tmp_path):
+    state = SyncState(tmp_path / "sync.json")
+    state.reset(uidvalidity=1, last_uid=0)
+    for _ in range(SyncState.MAX_RELEASES):
+        state.claim([1])
+        state.release(1)
+
+    assert state.last_uid == 1
+    assert state.failed == [1]
+
+
+def test_released_uid_is_claimed_again(tmp_path):
+    state = SyncState(tmp_path / "sync.json")
+    state.reset(uidvalidity=1, last_uid=0)
+    state.claim([1, 2])
+    state.release(2)
+
+    assert state.claim([1, 2]) == [2]
+
+
+def test_mark_survives_a_restart(tmp_path):
+    state = SyncState(tmp_path / "sync.json")
+    state.reset(uidvalidity=7, last_uid=10)
+    state.claim([11, 12])
+    state.commit(12)
+
+    reloaded = SyncState(tmp_path / "sync.json")
+    assert (reloaded.uidvalidity, reloaded.last_uid, reloaded.done) == (7, 10, {12})
+
+
+def test_commits_on_the_event_loop_are_written_behind_and_flushed(tmp_path, monkeypatch):
+    state = SyncState(tmp_path / "sync.json")
+    state.reset(uidvalidity=1, last_uid=0)
+    writes = []
+    write = state._write
+    monkeypatch.setattr(state, "_write", lambda snapshot: (writes.append(snapshot["last_uid"]), write(snapshot)))
+
+    async def scenario():
+        state.claim(range(1, 101))
+        for uid in range(1, 101):
+            state.commit(uid)
+        # Nothing was written on the loop; the saves coalesce behind one another
+        assert writes == []
+        await state.flush()
+
+    asyncio.run(scenario())
+    assert writes[-1] == 100
+    assert len(writes) < 100
+    assert SyncState(tmp_path / "sync.json").last_uid == 100
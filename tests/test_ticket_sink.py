@@ -0,0 +1,39 @@
+import asyncio
+
+from core.workflows.ticket_sink import JsonlTicketSink, SQLiteTicketSink, iter_tickets
+
+
+def write_all(sink, batches):
+    async def scenario():
+        for batch in batches:
+            await asyncio.gather(*(sink.write(ticket) for ticket in batch))
+            # Like a restart between batches: the sink reopens on the next write
+            await sink.close()
+
+    asyncio.run(scenario())
+
+
+def test_jsonl_reader_keeps_the_last_copy_of_a_replayed_ticket(tmp_path):
+    sink = JsonlTicketSink(tmp_path, max_segment_age=0)
+    write_all(sink, [
+        [{"id": "a", "timestamp": "2025-01-01T00:00:00", "details": "first"},
+         {"id": "b", "timestamp": "2025-01-01T00:00:01"}],
+        # Replayed after a restart: same id, written again
+        [{"id": "a", "timestamp": "2025-01-02T00:00:00", "details": "replayed"}],
+    ])
+
+    tickets = list(iter_tickets(tmp_path))
+    assert [t["id"] for t in tickets] == ["b", "a"]
+    assert tickets[1]["details"] == "replayed"
+    assert [t["id"] for t in iter_tickets(tmp_path, since="2025-01-02")] == ["a"]
+
+
+def test_sqlite_and_jsonl_readers_agree_on_replays(tmp_path):
+    batches = [
+        [{"id": "a", "timestamp": "2025-01-01T00:00:00"}, {"id": "b", "timestamp": "2025-01-01T00:00:01"}],
+        [{"id": "a", "timestamp": "2025-01-02T00:00:00"}],
+    ]
+    write_all(JsonlTicketSink(tmp_path / "jsonl"), batches)
+    write_all(SQLiteTicketSink(tmp_path / "tickets.sqlite3"), batches)
+
+    assert list(iter_tickets(tmp_path / "jsonl")) == list(iter_tickets(tmp_path / "tickets.sqlite3"))
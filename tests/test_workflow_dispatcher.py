@@ -0,0 +1,47 @@
+import asyncio
+
+from core.email.imap_reader import BodyPart
+from core.models import Intent
+from core.workflows.dispatcher import WorkflowDispatcher, WorkflowEvent
+
+PHOTO = BodyPart(section="2", content_type="image/jpeg", params={}, encoding="base64", size=2048,
+                 disposition="attachment", filename="ceiling.jpg")
+
+
+def test_handlers_get_the_attachments_and_can_download_them():
+    dispatcher = WorkflowDispatcher(register_defaults=False)
+
+    @dispatcher.handler(Intent.maintenance)
+    async def attach_photos(event: WorkflowEvent):
+        return {part.filename: await event.fetch_attachment(part) for part in event.attachments}
+
+    async def fetch_attachment(part: BodyPart) -> bytes:
+        return f"bytes of {part.section}".encode()
+
+    result = asyncio.run(dispatcher.dispatch(
+        Intent.maintenance, [], None, None, attachments=(PHOTO,), fetch_attachment=fetch_attachment,
+    ))
+    assert result == {"attach_photos": {"ceiling.jpg": b"bytes of 2"}}
+
+
+def test_early_dispatch_only_runs_early_handlers_and_the_full_dispatch_skips_them():
+    dispatcher = WorkflowDispatcher(register_defaults=False)
+    calls = []
+
+    @dispatcher.handler(Intent.locked_out, early=True)
+    async def page_on_call(event: WorkflowEvent):
+        calls.append("page_on_call")
+
+    @dispatcher.handler(Intent.locked_out)
+    async def file_ticket(event: WorkflowEvent):
+        calls.append("file_ticket")
+
+    async def scenario():
+        await dispatcher.dispatch(Intent.locked_out, [], None, None, idempotency_key="k", early_only=True)
+        assert calls == ["page_on_call"]
+        await dispatcher.dispatch(Intent.locked_out, [], None, None, idempotency_key="k")
+
+    asyncio.run(scenario())
+    assert calls == ["page_on_call", "file_ticket"]
+    assert dispatcher.has_handlers(Intent.locked_out, early_only=True)
+    assert not WorkflowDispatcher().has_handlers(Intent.maintenance, early_only=True)